@@ -1,7 +1,18 @@
+import os
+
 import streamlit as st
-import plotly.express as px
-import numpy as np
-import pandas as pd
+
+from solar_core.perezoso import modulo_perezoso
+from solar_core.tiempos import MedicionRerun, registro_tiempos
+
+# Se importan al dibujar la primera gráfica del tema elegido
+px = modulo_perezoso("plotly.express")
+np = modulo_perezoso("numpy")
+pd = modulo_perezoso("pandas")
+
+# Tiempos de este rerun; cada tema se mide como un tramo con su nombre
+medicion = MedicionRerun("documentacion")
+RERUNS_DEPURACION = 10
 
 st.title("📚 Sección Educativa sobre Paneles Solares")
 
@@ -33,6 +44,7 @@ with st.sidebar:
         "Integración de la Energía Solar con la Red Eléctrica"
     ])
 
+medicion.iniciar(seleccion)
 
 # ============================
 # Introducción a la Energía Solar
@@ -1186,8 +1198,17 @@ if seleccion == "Integración de la Energía Solar con la Red Eléctrica":
         "Los diferentes modelos de conexión permiten adaptarse a las necesidades del usuario, garantizando un uso eficiente y sostenible de la energía renovable."
     )
 
+medicion.terminar(seleccion)
+
 # ============================
 # Conclusión y Pie de Página
 # ============================
 st.markdown("---")
 st.write("_Monitoreo de paneles solares © 2024_", unsafe_allow_html=True)
+
+registro_tiempos().registrar(medicion)
+
+# Panel de depuración con los tiempos de los últimos reruns
+if st.query_params.get("depurar") == "1" or os.environ.get("SOLAR_DEPURACION") == "1":
+    with st.expander("⏱️ Tiempos por tema (ms)"):
+        st.dataframe(registro_tiempos().tabla(RERUNS_DEPURACION, script="documentacion"), hide_index=True)
@@ -1,16 +1,41 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
 import os
-import pdfplumber
-import re
+import uuid
 from datetime import datetime
 
+from solar_core.agregados import calcular_kpis
+from solar_core.almacen import exportar_excel
+from solar_core.esquema import exigir_validos
+from solar_core.filtros import IndiceHistorial, filtrar
+from solar_core.graficas import FIGURAS, figura_dona
+from solar_core.perfilado import Perfil, perfil_solicitado
+from solar_core.formatos_recibo import CAMPOS_RECIBO
+from solar_core.recibos import COLUMNAS_LOTE
+from solar_core.registros import construir_registro, entradas_desde_recibo
+from solar_core.sitios import HOJA_EXCEL, INVERSION_POR_DEFECTO, LIBRO_EXCEL, RUTA_HISTORIAL, abrir_registro
+from solar_core.tarifas import COLUMNAS_PRECIO, NIVELES, recalcular_historial
+from solar_core.tiempos import MedicionRerun, registro_tiempos
+from solar_core.trabajos import ColaLlena, cola_recibos
+
 # ============================
 # Configuración inicial
 # ============================
-EXCEL_PATH = "Inversión sistema fotovoltaico.xlsx"
-EXCEL_SHEET = "Total"
+EXCEL_PATH = LIBRO_EXCEL
+EXCEL_SHEET = HOJA_EXCEL
+# Almacén principal del historial; Excel solo se usa para importar/exportar
+DATA_PATH = RUTA_HISTORIAL
+# Figuras memorizadas por tipo de gráfica (se desalojan las menos recientes)
+MAX_FIGURAS = 32
+# Reruns que muestra el panel de tiempos (?depurar=1 o SOLAR_DEPURACION=1)
+RERUNS_DEPURACION = 10
+
+# Las vistas filtradas comparten datos con el historial cacheado; con
+# Copy-on-Write una modificación nunca alcanza al DataFrame base.
+pd.set_option("mode.copy_on_write", True)
+
+# Tiempos por fase de este rerun (ver solar_core.tiempos)
+medicion = MedicionRerun("solar_app")
 
 # ============================
 # Configurar la página principal
@@ -21,189 +46,264 @@ st.set_page_config(
     initial_sidebar_state="expanded",
 )
 
+# ============================
+# Perfilado bajo demanda (?perfil=<token>, ver solar_core.perfilado)
+# ============================
+if "perfil_activo" in st.session_state:
+    # Un rerun interrumpido (st.rerun) deja su perfil sin terminar
+    st.session_state.pop("perfil_activo").descartar()
+perfil = None
+if perfil_solicitado(st.query_params.get("perfil")):
+    sesion_perfil = st.session_state.setdefault("id_sesion", uuid.uuid4().hex[:12])
+    perfil = Perfil("solar_app", sesion_perfil).iniciar()
+    if perfil is not None:
+        st.session_state["perfil_activo"] = perfil
+
+# ============================
+# Instalaciones
+# ============================
+# Sin archivo de sitios (SOLAR_SITIOS) se usa una sola instalación con el
+# historial de siempre
+registro_sitios = abrir_registro()
+
+# Valores que prellenar_formulario copia de un recibo al formulario de alta
+CLAVES_PRELLENADO = (
+    "nuevo_periodo", "precio_basico", "precio_intermedio", "precio_excedente",
+    "nuevo_basico_cfe", "nuevo_intermedio1_cfe", "nuevo_intermedio2_cfe", "nuevo_excedente_cfe",
+    "MWh_devueltos",
+)
+
+def cambiar_sitio():
+    """Al cambiar de instalación se descartan filtros y formularios del sitio anterior"""
+    for clave in ("filtro_periodo", "filtro_origen", "filtro_nivel", "filtros_aplicados", "lote_recibos", *CLAVES_PRELLENADO):
+        st.session_state.pop(clave, None)
+    inversion = registro_sitios.sitio(st.session_state["sitio"]).inversion_inicial
+    if inversion is not None:
+        st.session_state['INVERSION_INICIAL'] = inversion
+
+if len(registro_sitios.ids()) > 1:
+    sitio_id = st.sidebar.selectbox(
+        "Instalación", registro_sitios.ids(),
+        format_func=lambda i: registro_sitios.sitio(i).nombre,
+        key="sitio", on_change=cambiar_sitio
+    )
+else:
+    sitio_id = registro_sitios.ids()[0]
+sitio = registro_sitios.sitio(sitio_id)
+
 # Lee el valor del secreto o usa uno por defecto
 # Cambiamos esto a una variable de sesión
 if 'INVERSION_INICIAL' not in st.session_state:
-    st.session_state['INVERSION_INICIAL'] = 100000
+    st.session_state['INVERSION_INICIAL'] = sitio.inversion_inicial or INVERSION_POR_DEFECTO
 
 LOGO_PATH = "logo_solar.png"
 
 # ============================
-# Funciones auxiliares
+# Cargar y preparar los datos
 # ============================
+def obtener_almacen():
+    """Almacén Parquet del historial del sitio; el libro de Excel se importa si aún no existe"""
+    return registro_sitios.almacen(sitio_id)
 
-def get_float_value(data, key, default=0.0):
-    """Obtiene un valor float de un diccionario con manejo de errores"""
-    value = data.get(key, default)
-    try:
-        return float(value) if value is not None else default
-    except:
-        return default
+def cargar_datos_sitio(sitio_id):
+    """Carga el historial del sitio desde su almacén (con caché por firma del archivo).
 
-# ============================
-# Cargar y preparar los datos
-# ============================
-def load_data_from_excel(file_path, sheet_name):
+    Devuelve el DataFrame y la firma de los datos cargados, que identifica al
+    historial en las cachés de gráficas; None si la lectura no tuvo una firma
+    estable (el archivo cambió a media lectura) y no se debe memorizar nada.
+    """
     try:
-        df = pd.read_excel(file_path, sheet_name=sheet_name)
-        df.columns = [col.strip() for col in df.columns]
-        
-        numeric_cols = ['Ahorro Total', 'Básico Solar', 'Intermedio 1 Solar', 'Intermedio 2 Solar', 
-                       'Excedente Solar', 'Básico CFE', 'Intermedio 1 CFE', 'Intermedio 2 CFE', 
-                       'Excedente CFE', 'Subtotal Solar', 'IVA Solar', 'Total de recibo Solar', 
-                       'Subtotal CFE', 'IVA CFE', 'Subtotal CFE.1']
-        
-        for col in numeric_cols:
-            if col in df.columns:
-                try:
-                    df[col] = df[col].replace("[\\$,]", "", regex=True).astype(float)
-                except:
-                    st.warning(f"No se pudo convertir la columna {col} a numérica")
-        
-        return df
+        df, firma = registro_sitios.cargar(sitio_id)
     except Exception as e:
         st.error(f"Error al cargar el archivo: {e}")
-        return pd.DataFrame()
+        return pd.DataFrame(), None
+    
+    for col in registro_sitios.almacen(sitio_id).columnas_invalidas:
+        st.warning(f"No se pudo convertir la columna {col} a numérica")
+    
+    return df, ((sitio_id, firma) if firma is not None else None)
+
+def leer_tabla_precios(archivo):
+    """Lee la tabla de precios por periodo desde CSV o Excel"""
+    if archivo.name.lower().endswith(".csv"):
+        tabla = pd.read_csv(archivo)
+    else:
+        tabla = pd.read_excel(archivo)
+    tabla.columns = [str(col).strip() for col in tabla.columns]
+    return tabla
 
-df = load_data_from_excel(EXCEL_PATH, EXCEL_SHEET)
+# Las figuras se comparten entre reruns y sesiones mientras no cambien los
+# datos filtrados; no se modifican después de construirlas.
+@st.cache_resource(show_spinner=False, max_entries=MAX_FIGURAS)
+def figura_memorizada(tipo, clave, _df, periodo_col):
+    """Figura de ``tipo`` para los datos identificados por ``clave``"""
+    medicion.contar("figuras_construidas")
+    return FIGURAS[tipo](_df, periodo_col)
 
-# Ajustar nombre de columna según sea necesario
-periodo_col = "Periodos" if "Periodos" in df.columns else "Periodo"
-origen_col = "Origen" if "Origen" in df.columns else None
+def figura_vista(tipo, clave, df_vista, periodo_col):
+    """Figura memorizada por ``clave``; sin firma de los datos se construye sin caché"""
+    if clave[0] is None:
+        medicion.contar("figuras_construidas")
+        return FIGURAS[tipo](df_vista, periodo_col)
+    return figura_memorizada(tipo, clave, df_vista, periodo_col)
+
+@st.cache_resource(show_spinner=False, max_entries=MAX_FIGURAS)
+def figura_dona_memorizada(ahorro_acumulado, pendiente_recuperar):
+    return figura_dona(ahorro_acumulado, pendiente_recuperar)
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def indice_historial(firma, _df):
+    """Índice de periodo y origen del historial; se reconstruye solo si cambia la firma"""
+    return IndiceHistorial(_df)
+
+with medicion.tramo("datos"):
+    df, firma_datos = cargar_datos_sitio(sitio_id)
+
+    # Ajustar nombre de columna según sea necesario
+    periodo_col = "Periodos" if "Periodos" in df.columns else "Periodo"
+    origen_col = "Origen" if "Origen" in df.columns else None
+    indice = indice_historial(firma_datos, df) if firma_datos is not None else IndiceHistorial(df)
+medicion.contar("filas", len(df))
 
 # ============================
 # Funciones para procesar PDFs
 # ============================
-def procesar_recibo_pdf(pdf_file):
-    try:
-        with pdfplumber.open(pdf_file) as pdf:
-            text = ""
-            for page in pdf.pages:
-                text += page.extract_text() or ""
-        
-        datos = {
-            "periodo_facturado": extraer_patron(r"PERIODO FACTURADO:\s*(.*?)\n", text),
-            "total_pagar": extraer_numero(r"TOTAL A PAGAR:\s*\$\s*([\d,]+)", text),
-            "energia_total_kwh": extraer_numero(r"Energía\s*\(kWh\)\s+(\d+,\d+|\d+)", text),
-            "consumo_total_periodo": extraer_numero(r"Energía\s*\(kWh\)\s+.*?\s+.*?\s+(\d+,\d+|\d+)", text),
-            
-            # Básico
-            "basico_kwh": extraer_numero(r"Básico\s+(\d+,\d+|\d+)\s+(\d+,\d+|\d+)\s+(\d+)", text, group=3),
-            "basico_precio": extraer_numero(r"Básico\s+.*?(\d+\.\d+)\s+(\d+\.\d+)", text, group=1),
-            "basico_subtotal": extraer_numero(r"Básico\s+.*?\s+(\d+\.\d+)\s+(\d+\.\d+)", text, group=2),
-            
-            # Intermedio
-            "intermedio_kwh": extraer_numero(r"Intermedio\s+(\d+,\d+|\d+)\s+(\d+\.\d+)", text, group=1),
-            "intermedio_precio": extraer_numero(r"Intermedio\s+(\d+,\d+|\d+)\s+(\d+\.\d+)", text, group=2),
-            "intermedio_subtotal": extraer_numero(r"Intermedio\s+.*?\s+(\d+\.\d+)\s+(\d+\.\d+)", text, group=3),
-            
-            # Excedente
-            "excedente_kwh": extraer_numero(r"Excedente\s+(\d+,\d+|\d+)\s+(\d+\.\d+)", text, group=1),
-            "excedente_precio": extraer_numero(r"Excedente\s+(\d+,\d+|\d+)\s+(\d+\.\d+)", text, group=2),
-            "excedente_subtotal": extraer_numero(r"Excedente\s+.*?\s+(\d+\.\d+)\s+(\d+\.\d+)", text, group=3),
-            
-            "apoyo_gubernamental": extraer_numero(r"Apoyo Gubernamental\s+([\d\.,]+)", text),
-        }
-        
-        return datos
-    except Exception as e:
-        st.error(f"Error al procesar PDF: {str(e)}")
-        return None
+# Los recibos se leen en la cola de trabajos (pool de procesos): el script
+# solo encola y consulta el estado, nunca espera a pdfplumber.
+INTERVALO_RECIBOS = 1.0
 
-def extraer_patron(patron, texto, group=1):
-    try:
-        match = re.search(patron, texto, re.DOTALL)
-        return match.group(group).strip() if match else ""
-    except:
-        return ""
-
-def extraer_numero(patron, texto, group=1):
-    try:
-        match = re.search(patron, texto, re.DOTALL)
-        if match:
-            try:
-                valor = match.group(group).replace(",", "")
-                return float(valor) if '.' in valor else float(valor)
-            except:
-                return 0.0
-        return 0.0
-    except:
-        return 0.0
+def prellenar_formulario(datos_recibo):
+    """Copia al formulario las entradas calculadas a partir del recibo"""
+    entradas = entradas_desde_recibo(datos_recibo)
+    st.session_state["nuevo_periodo"] = entradas["periodo"]
+    
+    (st.session_state["precio_basico"],
+     st.session_state["precio_intermedio"],
+     st.session_state["precio_excedente"]) = entradas["precios"]
+    
+    # Reparto del consumo en Básico e Intermedio 1 CFE; el excedente viene del recibo
+    (st.session_state["nuevo_basico_cfe"],
+     st.session_state["nuevo_intermedio1_cfe"],
+     _,
+     st.session_state["nuevo_excedente_cfe"]) = entradas["kwh_cfe"]
+    
+    # Lógica para devolucion a la red
+    st.session_state["MWh_devueltos"] = entradas["kwh_devueltos"]
 
 # ============================
-# Sidebar - Logo y filtros
+# Sidebar - Secciones como fragmentos
 # ============================
-with st.sidebar:
-    if os.path.exists(LOGO_PATH):
-        st.image(LOGO_PATH, use_column_width=True)
-           
+# Cada sección de la barra lateral es un fragmento: interactuar con sus
+# widgets solo vuelve a ejecutar esa sección. El tablero completo se
+# recalcula (st.rerun) únicamente cuando cambian los datos, la meta o los
+# filtros aplicados.
+
+def avisar(seccion, mensaje):
+    """Guarda un mensaje de éxito para mostrarlo en la sección después del st.rerun"""
+    st.session_state.setdefault(f"avisos_{seccion}", []).append(mensaje)
+
+def mostrar_avisos(seccion):
+    for mensaje in st.session_state.pop(f"avisos_{seccion}", []):
+        st.success(mensaje)
+
+@st.fragment
+def seccion_recibo_pdf():
     # ============================
     # Sidebar - Carga de recibo de luz
     # ============================
             
     st.markdown("## Cargar Recibo de Luz (PDF)")
     
-    uploaded_file = st.file_uploader("Sube tu recibo CFE en PDF", type="pdf", key="pdf_uploader")
+    uploaded_files = st.file_uploader(
+        "Sube tu recibo CFE en PDF", type="pdf", key="pdf_uploader", accept_multiple_files=True
+    )
+    if not uploaded_files:
+        return
     
-    if uploaded_file is not None:
-        datos_recibo = procesar_recibo_pdf(uploaded_file)
-        
-        if datos_recibo:
-            st.success("Recibo procesado correctamente!")
-            
-            with st.expander("Ver datos extraídos", expanded=False):
-                st.json(datos_recibo)
-            
-            # Pre-llenar el formulario con los datos del PDF
-            try:
-                periodo_pdf = datos_recibo.get("periodo_facturado", "").replace(" - ", " al ")
-                st.session_state["nuevo_periodo"] = periodo_pdf if periodo_pdf else ""
-                
-                consumo_total = get_float_value(datos_recibo, "consumo_total_periodo")
-                #precio_basico = get_float_value(datos_recibo, "basico_precio")
-                #precio_intermedio = get_float_value(datos_recibo, "intermedio_precio")
-                #precio_excedente = get_float_value(datos_recibo, "excedente_precio")
-                
-                st.session_state["precio_basico"] = get_float_value(datos_recibo, "basico_precio")
-                st.session_state["precio_intermedio"] = get_float_value(datos_recibo, "intermedio_precio")
-                st.session_state["precio_excedente"] = get_float_value(datos_recibo, "excedente_precio")
+    # Cada selección nueva de archivos se encola una sola vez
+    archivos = tuple(f.file_id for f in uploaded_files)
+    lote = st.session_state.get("lote_recibos")
+    if lote is None or lote["archivos"] != archivos:
+        cola = cola_recibos()
+        st.session_state["lote_recibos"] = {
+            "archivos": archivos,
+            "nombres": [f.name for f in uploaded_files],
+            "trabajos": [encolar_recibo(cola, f) for f in uploaded_files],
+            "resultados": None,
+        }
+        # El avance se muestra en su propio fragmento, que se monta en el rerun completo
+        st.rerun()
+    
+    resultados = lote["resultados"]
+    if resultados is None:
+        return
+    
+    # Varios recibos: se muestran en una tabla
+    if len(resultados) > 1:
+        resultados_lote = pd.DataFrame(resultados, columns=list(COLUMNAS_LOTE))
+        errores_lote = resultados_lote[resultados_lote["error"] != ""]
+        st.success(f"{len(resultados_lote) - len(errores_lote)} de {len(resultados_lote)} recibos procesados")
+        if not errores_lote.empty:
+            st.warning("Recibos con error: " + ", ".join(errores_lote["archivo"]))
+        with st.expander("Ver datos extraídos", expanded=False):
+            st.dataframe(resultados_lote)
+        st.download_button(
+            "📥 Descargar datos de recibos (CSV)",
+            data=resultados_lote.to_csv(index=False).encode("utf-8"),
+            file_name="recibos.csv",
+            mime="text/csv",
+            key="descargar_lote"
+        )
+        return
+    
+    fila = resultados[0]
+    if fila["error"]:
+        st.error(f"Error al procesar PDF: {fila['error']}")
+        return
+    st.success("Recibo procesado correctamente!")
+    with st.expander("Ver datos extraídos", expanded=False):
+        st.json({campo: fila.get(campo) for campo in CAMPOS_RECIBO})
 
-                # Lógica para Básico CFE
-                if consumo_total > 150:
-                    st.session_state["nuevo_basico_cfe"] = 150 
-                else:
-                    st.session_state["nuevo_basico_cfe"] = consumo_total 
-
-                # Lógica para Intermedio 1 CFE
-                if consumo_total > 150:
-                    if consumo_total > 350:
-                        st.session_state["nuevo_intermedio1_cfe"] = 200 
-                    else:
-                        st.session_state["nuevo_intermedio1_cfe"] = (consumo_total - st.session_state["nuevo_basico_cfe"])
-                else:
-                    st.session_state["nuevo_intermedio1_cfe"] = 0
-
-                # Lógica para Excedente CFE
-                #if consumo_total > 350:
-                 #   st.session_state["nuevo_excedente_cfe"] = (consumo_total - (st.session_state["nuevo_basico_cfe"] + st.session_state["nuevo_intermedio1_cfe"]))
-               # else:
-                #    st.session_state["nuevo_excedente_cfe"] = 0     
-                               
-                #st.info("Los campos del formulario se han pre-llenado con los datos del recibo. Verifica y ajusta si es necesario.")
-                
-                # Lógica para Excedente CFE
-                st.session_state["nuevo_excedente_cfe"] = get_float_value(datos_recibo, "excedente_kwh")   
-                
-                # Lógica para devolucion a la red
-                st.session_state["MWh_devueltos"] = consumo_total - st.session_state["nuevo_basico_cfe"] - st.session_state["nuevo_intermedio1_cfe"] - st.session_state["nuevo_excedente_cfe"]
+def encolar_recibo(cola, archivo):
+    """Id del trabajo del recibo; None si la cola está llena"""
+    try:
+        return cola.encolar(archivo.name, archivo.getvalue())
+    except ColaLlena:
+        return None
 
+@st.fragment(run_every=INTERVALO_RECIBOS)
+def seccion_progreso_recibos():
+    """Consulta la cola mientras haya recibos pendientes; al terminar redibuja la app"""
+    lote = st.session_state["lote_recibos"]
+    cola = cola_recibos()
+    trabajos = [cola.estado(trabajo_id) if trabajo_id is not None else None for trabajo_id in lote["trabajos"]]
+    terminados = sum(1 for t in trabajos if t is None or t.terminado)
+    if terminados < len(trabajos):
+        st.progress(terminados / len(trabajos), text=f"Procesando recibos... {terminados} de {len(trabajos)}")
+        return
+    
+    lote["resultados"] = [
+        t.fila if t is not None
+        else {"archivo": nombre, "error": "Cola de recibos llena; vuelve a subirlo más tarde"} if trabajo_id is None
+        else {"archivo": nombre, "error": "El trabajo ya no está disponible"}
+        for t, trabajo_id, nombre in zip(trabajos, lote["trabajos"], lote["nombres"])
+    ]
+    # Un solo recibo: pre-llenar el formulario con los datos del PDF
+    if len(trabajos) == 1 and trabajos[0] is not None and trabajos[0].datos:
+        try:
+            prellenar_formulario(trabajos[0].datos)
+            avisar("datos", "Los campos del formulario se han pre-llenado con los datos del recibo. Verifica y ajusta si es necesario.")
+        except Exception as e:
+            st.error(f"Error al cargar datos en el formulario: {str(e)}")
+            return
+    st.rerun()
 
-                st.info("Los campos del formulario se han pre-llenado con los datos del recibo. Verifica y ajusta si es necesario.")
-             
-                      
-            except Exception as e:
-                st.error(f"Error al cargar datos en el formulario: {str(e)}")
-                                
+def recibos_pendientes():
+    lote = st.session_state.get("lote_recibos")
+    return lote is not None and lote["resultados"] is None
+
+@st.fragment
+def seccion_meta():
     # ============================
     # Sección para actualizar la meta de inversión
     # ============================
@@ -216,38 +316,79 @@ with st.sidebar:
             min_value=0.0, 
             value=float(st.session_state['INVERSION_INICIAL']),
             step=1000.0,
-            format="%.2f"
+            format="%.2f",
+            key="meta_input"
         )
         
         if st.button("Actualizar Meta"):
+            cambio = nueva_meta != st.session_state['INVERSION_INICIAL']
             st.session_state['INVERSION_INICIAL'] = nueva_meta
-            st.success(f"Meta actualizada a ${nueva_meta:,.2f}")
-    
+            avisar("meta", f"Meta actualizada a ${nueva_meta:,.2f}")
+            if cambio:
+                st.rerun()
+        
+        mostrar_avisos("meta")
+
+@st.fragment
+def seccion_filtros(df, periodo_col, origen_col):
     # ============================
     # Sidebar - Filtros
     # ============================
     
     st.markdown("## Filtros")
     with st.expander("Filtros"):
-        opciones_periodo = ["Seleccionar todo"] + list(df[periodo_col].unique()) if not df.empty else ["Seleccionar todo"]
-        seleccion_periodo = st.multiselect('Selecciona periodos', opciones_periodo, default=["Seleccionar todo"])
-        
-        df_filtrado = df.copy()
-        if seleccion_periodo and "Seleccionar todo" not in seleccion_periodo:
-            df_filtrado = df_filtrado[df_filtrado[periodo_col].isin(seleccion_periodo)]
+        opciones_periodo = ["Seleccionar todo"] + indice.opciones_periodo
+        st.multiselect('Selecciona periodos', opciones_periodo, default=["Seleccionar todo"], key="filtro_periodo")
         
         if origen_col:
-            opciones_origen = ["Seleccionar todo"] + list(df[origen_col].unique()) if not df.empty else ["Seleccionar todo"]
-            seleccion_origen = st.multiselect('Selecciona origen', opciones_origen, default=["Seleccionar todo"])
-            if seleccion_origen and "Seleccionar todo" not in seleccion_origen:
-                df_filtrado = df_filtrado[df_filtrado[origen_col].isin(seleccion_origen)]
+            opciones_origen = ["Seleccionar todo"] + indice.opciones_origen
+            st.multiselect('Selecciona origen', opciones_origen, default=["Seleccionar todo"], key="filtro_origen")
         
-        opciones_nivel = ["Seleccionar todo"] + ['Básico', 'Intermedio 1', 'Intermedio 2', 'Excedente']
-        seleccion_nivel = st.multiselect('Selecciona nivel de cobro', opciones_nivel, default=["Seleccionar todo"])
-        if seleccion_nivel and "Seleccionar todo" not in seleccion_nivel:
-            columnas_nivel = [col for col in df.columns if any(n in col for n in seleccion_nivel)]
-            df_filtrado = df_filtrado[[periodo_col] + ([origen_col] if origen_col else []) + columnas_nivel]
-            
+        opciones_nivel = ["Seleccionar todo"] + list(NIVELES)
+        st.multiselect('Selecciona nivel de cobro', opciones_nivel, default=["Seleccionar todo"], key="filtro_nivel")
+    
+    # Solo se redibuja el tablero si cambió la selección que ya estaba aplicada
+    seleccion = selecciones_filtros()
+    if seleccion != st.session_state.get("filtros_aplicados"):
+        primera_vez = "filtros_aplicados" not in st.session_state
+        st.session_state["filtros_aplicados"] = seleccion
+        if not primera_vez:
+            st.rerun()
+
+def selecciones_filtros():
+    return (
+        tuple(st.session_state.get("filtro_periodo", ["Seleccionar todo"])),
+        tuple(st.session_state.get("filtro_origen", ["Seleccionar todo"])),
+        tuple(st.session_state.get("filtro_nivel", ["Seleccionar todo"])),
+    )
+
+def seleccion_efectiva(seleccion):
+    """Valores elegidos en un filtro; None si no restringe (vacío o "Seleccionar todo")"""
+    if not seleccion or "Seleccionar todo" in seleccion:
+        return None
+    return list(seleccion)
+
+def resumen_ahorro(seleccion_periodo, seleccion_origen):
+    """KPIs de ahorro desde los agregados del almacén, sin recorrer el historial"""
+    if df.empty:
+        return {"suma": 0.0, "cuenta": 0, "maximo": None}
+    return registro_sitios.resumen(
+        sitio_id,
+        periodos=seleccion_efectiva(seleccion_periodo),
+        origenes=seleccion_efectiva(seleccion_origen) if origen_col else None,
+    )
+
+def filtrar_datos(df, seleccion_periodo, seleccion_origen, seleccion_nivel):
+    """Vista filtrada del historial: sin selección de filas no se copia nada"""
+    return filtrar(
+        df, indice,
+        periodos=seleccion_efectiva(seleccion_periodo),
+        origenes=seleccion_efectiva(seleccion_origen) if origen_col else None,
+        niveles=seleccion_efectiva(seleccion_nivel),
+    )
+
+@st.fragment
+def seccion_ingresar_datos(df, periodo_col):
     # ============================
     # Menú para ingresar datos
     # ============================
@@ -347,82 +488,19 @@ with st.sidebar:
             precio_excedente = float(precio_excedente)
             MWh_devueltos = float(MWh_devueltos)
             
-            # Calcular campos faltantes para el nuevo registro
-            if "No. Periodo" in df.columns:
-                nuevo_num_periodo = df["No. Periodo"].max() + 1
-            else:
-                nuevo_num_periodo = 1
-            
-            # Datos de energia de paneles solares
-            
-            if Total_solar <= 150:
-                nuevo_basico_solar = Total_solar * precio_basico
-                subtotal_solar = nuevo_basico_solar
-            elif Total_solar <= 350:
-                nuevo_basico_solar = 150 * precio_basico
-                nuevo_intermedio1_solar = (Total_solar - 150) * precio_intermedio
-                subtotal_solar = nuevo_intermedio1_solar + nuevo_basico_solar
-            else:  # MWh_devueltos > 350
-                nuevo_basico_solar = 150 * precio_basico
-                nuevo_intermedio1_solar = 200 * precio_intermedio
-                nuevo_excedente_solar = (Total_solar - 350) * precio_excedente
-                nuevo_intermedio2_solar = 0
-                # Se corrigió el cálculo final para sumar la variable correcta.
-                subtotal_solar = nuevo_basico_solar + nuevo_intermedio1_solar + nuevo_intermedio2_solar + nuevo_excedente_solar
-            
-            iva_solar = subtotal_solar * 0.16
-            total_recibo_solar = subtotal_solar + iva_solar
-            
-            # Datos de energia de recibo de CFE
-            
-            subtotal_cfe = (
-                (nuevo_basico_cfe*precio_basico) + (nuevo_intermedio1_cfe*precio_intermedio) + 
-                (nuevo_intermedio2_cfe) + (nuevo_excedente_cfe*precio_excedente)
-            )
-            
-            iva_cfe = subtotal_cfe * 0.16
-            total_cfe = subtotal_cfe + iva_cfe
-            
-            if MWh_devueltos <= 150:
-                ahorro_total = MWh_devueltos * precio_basico
-            elif MWh_devueltos <= 350:
-                ahorro_basico = 150 * precio_basico
-                ahorro_intermedio = (MWh_devueltos - 150) * precio_intermedio
-                ahorro_total = ahorro_basico + ahorro_intermedio
-            else:  # MWh_devueltos > 350
-                ahorro_basico = 150 * precio_basico
-                ahorro_intermedio = 200 * precio_intermedio
-                ahorro_excedente = (MWh_devueltos - 350) * precio_excedente
-                # Se corrigió el cálculo final para sumar la variable correcta.
-                ahorro_total = ahorro_basico + ahorro_intermedio + ahorro_excedente
-                                
-            nuevo_registro = {
-                periodo_col: nuevo_periodo,
-                "No. Periodo": nuevo_num_periodo,
-                "Básico Solar": nuevo_basico_cfe*precio_basico,
-                "Intermedio 1 Solar": nuevo_intermedio1_cfe*precio_intermedio,
-                "Intermedio 2 Solar": nuevo_intermedio2_cfe,
-                "Excedente Solar": nuevo_excedente_cfe*precio_excedente,
-                "Básico CFE": nuevo_basico_solar,
-                "Intermedio 1 CFE": nuevo_intermedio1_solar,
-                "Intermedio 2 CFE": nuevo_intermedio2_solar,
-                "Excedente CFE": nuevo_excedente_solar,
-                "Mwh Devueltos": MWh_devueltos,
-                "Subtotal Solar": subtotal_solar,
-                "IVA Solar": iva_cfe,
-                "Total de recibo Solar": total_cfe,
-                "Subtotal CFE": subtotal_cfe,
-                "IVA CFE": iva_solar,
-                "Subtotal CFE.1": total_recibo_solar, 
-                "Ahorro Total": ahorro_total
-            }
-            
-            # Agregar el nuevo registro al DataFrame
-            df = pd.concat([df, pd.DataFrame([nuevo_registro])], ignore_index=True)
-            
-            # Guardar el DataFrame actualizado en el archivo Excel
-            df.to_excel(EXCEL_PATH, sheet_name=EXCEL_SHEET, index=False)
-            st.success("Datos agregados correctamente y guardados en el archivo!")
+            # Tarifa escalonada para la energía solar, el recibo de CFE y los kWh devueltos
+            kwh_cfe = [nuevo_basico_cfe, nuevo_intermedio1_cfe, nuevo_intermedio2_cfe, nuevo_excedente_cfe]
+
+            def armar_registro(nuevo_num_periodo):
+                return construir_registro(
+                    nuevo_periodo, nuevo_num_periodo, Total_solar, kwh_cfe, MWh_devueltos,
+                    (precio_basico, precio_intermedio, precio_excedente), periodo_col
+                )
+
+            # Agregar el nuevo registro con el siguiente número de periodo y guardarlo en el almacén
+            obtener_almacen().agregar_siguiente(armar_registro)
+            avisar("datos", "Datos agregados correctamente y guardados en el archivo!")
+            st.rerun()
             
         except Exception as e:
             st.error(f"Error al procesar los datos: {str(e)}")
@@ -431,52 +509,113 @@ with st.sidebar:
     if st.button('🗑️ Borrar último registro', key='borrar_registro'):
         if len(df) > 0:
             try:
-                df_actualizado = df.iloc[:-1].copy()
-                
-                with pd.ExcelWriter(EXCEL_PATH, engine='openpyxl', mode='w') as writer:
-                    df_actualizado.to_excel(writer, sheet_name=EXCEL_SHEET, index=False)
-                
-                df = load_data_from_excel(EXCEL_PATH, EXCEL_SHEET)
-                
-                st.success(f"Registro del período {df.iloc[-1][periodo_col]} eliminado correctamente!")
-                st.experimental_rerun()
+                eliminado = obtener_almacen().quitar_ultimo()
+                if eliminado is not None:
+                    avisar("datos", f"Registro del período {eliminado[periodo_col]} eliminado correctamente!")
+                st.rerun()
                 
             except Exception as e:
                 st.error(f"Error al guardar cambios: {str(e)}")
         else:
             st.warning("No hay registros para eliminar")
 
+    # ============================
+    # Recalcular historial con nuevos precios
+    # ============================
+    with st.expander("Recalcular historial"):
+        st.caption(f"Tabla con columnas {periodo_col}, " + ", ".join(COLUMNAS_PRECIO))
+        archivo_precios = st.file_uploader("Tabla de precios (CSV o Excel)", type=["csv", "xlsx"], key="tabla_precios")
+        if archivo_precios is not None and st.button("Recalcular", key="recalcular_historial"):
+            try:
+                tabla_precios = leer_tabla_precios(archivo_precios)
+
+                def recalcular(df_actual):
+                    # Sobre el historial vigente, no sobre el df de este rerun:
+                    # así no se pierden altas de otras sesiones o de la API
+                    df_recalculado, recalculados = recalcular_historial(df_actual, tabla_precios, periodo_col)
+                    if not recalculados.any():
+                        return None, 0
+                    # Se validan los periodos recalculados antes de reescribir el historial
+                    exigir_validos(df_recalculado[recalculados], periodo_col)
+                    return df_recalculado, int(recalculados.sum())
+
+                cuantos = obtener_almacen().actualizar(recalcular)
+                if cuantos:
+                    avisar("datos", f"{cuantos} periodos recalculados")
+                    st.rerun()
+                else:
+                    st.warning("Ningún periodo coincide con la tabla o tiene sus kWh guardados")
+            except Exception as e:
+                st.error(f"Error al recalcular: {str(e)}")
+
+    mostrar_avisos("datos")
+
+    # Exportar el historial como libro de Excel. El libro se arma solo cuando
+    # el usuario lo pide: openpyxl tarda segundos con historiales grandes y no
+    # debe pagarse en cada rerun después de un alta o una baja.
+    if not df.empty:
+        libro = st.session_state.get("libro_excel")
+        if libro is not None and firma_datos is not None and libro[0] == (sitio_id, firma_datos):
+            st.download_button(
+                "📥 Exportar a Excel",
+                data=libro[1],
+                file_name=os.path.basename(sitio.origen_excel or EXCEL_PATH),
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                key="exportar_excel"
+            )
+        elif st.button("📄 Preparar Excel", key="preparar_excel"):
+            with st.spinner("Generando libro de Excel..."):
+                st.session_state["libro_excel"] = ((sitio_id, firma_datos), exportar_excel(df, sitio.hoja))
+            st.rerun()
+        else:
+            st.session_state.pop("libro_excel", None)
+
+with st.sidebar:
+    if os.path.exists(LOGO_PATH):
+        st.image(LOGO_PATH, use_column_width=True)
+    
+    with medicion.tramo("recibos"):
+        seccion_recibo_pdf()
+        if recibos_pendientes():
+            seccion_progreso_recibos()
+    with medicion.tramo("meta"):
+        seccion_meta()
+    with medicion.tramo("filtros_widgets"):
+        seccion_filtros(df, periodo_col, origen_col)
+    with medicion.tramo("ingreso_datos"):
+        seccion_ingresar_datos(df, periodo_col)
+
+with medicion.tramo("filtros"):
+    seleccion_periodo, seleccion_origen, seleccion_nivel = selecciones_filtros()
+    vista = filtrar_datos(df, seleccion_periodo, seleccion_origen, seleccion_nivel)
+
+    # Identifican a la vista sin recorrerla: datos cargados + selecciones de filtros.
+    # Los niveles de cobro solo cambian las columnas, no las filas.
+    clave_filas = (firma_datos, seleccion_periodo, seleccion_origen)
+    clave_tabla = clave_filas + (seleccion_nivel,)
+    resumen = resumen_ahorro(seleccion_periodo, seleccion_origen)
+medicion.contar("filas_filtradas", len(vista))
+
 # ============================
 # Análisis clave
 # ============================
 st.title("Monitoreo del Ahorro y Recuperación de Inversión")
 
 # Cálculo de métricas principales
-# Cálculo de métricas principales
-if not df_filtrado.empty:
-    ahorro_acumulado = df_filtrado["Ahorro Total"].sum()
-    pendiente_recuperar = max(0, st.session_state['INVERSION_INICIAL'] - ahorro_acumulado)
-    progreso = (ahorro_acumulado / st.session_state['INVERSION_INICIAL']) * 100 if st.session_state['INVERSION_INICIAL'] > 0 else 0
-    
-    if len(df_filtrado) > 0 and ahorro_acumulado > 0:
-        meses_faltantes = pendiente_recuperar / (ahorro_acumulado / len(df_filtrado))
-    else:
-        meses_faltantes = 0
-        
-    ahorro_promedio_mensual = ahorro_acumulado / len(df_filtrado) if len(df_filtrado) > 0 else 0
-else:
-    ahorro_acumulado = 0
-    pendiente_recuperar = st.session_state['INVERSION_INICIAL']
-    progreso = 0
-    meses_faltantes = 0
-    ahorro_promedio_mensual = 0
-    
-col1, col2, col3, col4, col5 = st.columns(5)
-col1.metric("Ahorro Acumulado", f"${ahorro_acumulado:,.2f}")
-col2.metric("Pendiente para Recuperar", f"${pendiente_recuperar:,.2f}")
-col3.metric("Porcentaje Recuperado", f"{progreso:.2f}%")
-col4.metric("Meses Estimados Restantes", f"{meses_faltantes:.1f} meses")
-col5.metric("Ahorro Promedio por Mes", f"${ahorro_promedio_mensual:,.2f}")
+with medicion.tramo("metricas"):
+    kpis = calcular_kpis(resumen, st.session_state['INVERSION_INICIAL'])
+    ahorro_acumulado = kpis["ahorro_acumulado"]
+    pendiente_recuperar = kpis["pendiente_recuperar"]
+    progreso = kpis["progreso"]
+    meses_faltantes = kpis["meses_faltantes"]
+    ahorro_promedio_mensual = kpis["ahorro_promedio_mensual"]
+
+    col1, col2, col3, col4, col5 = st.columns(5)
+    col1.metric("Ahorro Acumulado", f"${ahorro_acumulado:,.2f}")
+    col2.metric("Pendiente para Recuperar", f"${pendiente_recuperar:,.2f}")
+    col3.metric("Porcentaje Recuperado", f"{progreso:.2f}%")
+    col4.metric("Meses Estimados Restantes", f"{meses_faltantes:.1f} meses")
+    col5.metric("Ahorro Promedio por Mes", f"${ahorro_promedio_mensual:,.2f}")
 
 st.markdown(
     """
@@ -497,60 +636,66 @@ st.markdown(
     unsafe_allow_html=True
 )
 
+# Resumen entre instalaciones, a partir de los agregados de cada sitio
+if len(registro_sitios.ids()) > 1:
+    with st.expander("Resumen de todas las instalaciones"):
+        resumen_sitios = registro_sitios.resumen_sitios()
+        columnas_monto = ["Ahorro Acumulado", "Ahorro Promedio por Mes", "Mayor Ahorro", "Inversión"]
+        st.dataframe(resumen_sitios.style.format({col: "${:,.2f}" for col in columnas_monto}, na_rep="—"))
+
 # Gráficos de Análisis
-if not df_filtrado.empty:
-    st.subheader("Tendencia del Ahorro Acumulado")
-    fig_ahorro = px.area(
-        df_filtrado, x=periodo_col, y="Ahorro Total",
-        title="Evolución del Ahorro por Periodo",
-        markers=True, color_discrete_sequence=["#2ECC71"]
-    )
-    st.plotly_chart(fig_ahorro, use_container_width=True)
-
-    col1, col2 = st.columns(2)
-    with col1:
-        st.subheader("Tiempo Estimado de Recuperación")
-        fig_dona = px.pie(
-            names=["Ahorro Total", "Restante"],
-            values=[ahorro_acumulado, pendiente_recuperar],
-            title="Progreso de Recuperación",
-            hole=0.5,
-            color_discrete_sequence=["#2ECC71", "#E74C3C"]
-        )
-        st.plotly_chart(fig_dona, use_container_width=True)
-
-    with col2:
-        st.subheader("Distribución Total de Costos por Nivel de Cobro")
-        df_totales = df_filtrado[["Básico Solar", "Intermedio 1 Solar", "Intermedio 2 Solar", "Excedente Solar", 
-                                  "Básico CFE", "Intermedio 1 CFE", "Intermedio 2 CFE", "Excedente CFE"]].sum().reset_index()
-        df_totales.columns = ["Nivel de Cobro", "Costo Total"]
-        fig_treemap = px.treemap(
-            df_totales, path=["Nivel de Cobro"], values="Costo Total",
-            title="Proporción Total de Costos por Nivel de Cobro",
-            color="Costo Total", color_continuous_scale="Viridis"
-        )
-        st.plotly_chart(fig_treemap, use_container_width=True)
-
-    # Comparación entre Consumo Real y Estimado
-    st.subheader("Comparación de Consumo Real vs Estimado")
-    fig_comparativo = px.bar(
-        df_filtrado, x=periodo_col, y=["Total de recibo Solar", "Subtotal CFE.1"],
-        barmode="group", title="Consumo Real (Verde) vs Estimado (Amarillo)",
-        color_discrete_map={"Total de recibo Solar": "#2ECC71", "Subtotal CFE.1": "#F4D03F"}
-    )
-    st.plotly_chart(fig_comparativo, use_container_width=True)
+if not vista.empty:
+    with medicion.tramo("graficas"):
+        st.subheader("Tendencia del Ahorro Acumulado")
+        fig_ahorro = figura_vista("ahorro", clave_filas, vista.filas, periodo_col)
+        st.plotly_chart(fig_ahorro, use_container_width=True)
+
+        col1, col2 = st.columns(2)
+        with col1:
+            st.subheader("Tiempo Estimado de Recuperación")
+            fig_dona = figura_dona_memorizada(float(ahorro_acumulado), float(pendiente_recuperar))
+            st.plotly_chart(fig_dona, use_container_width=True)
+
+        with col2:
+            st.subheader("Distribución Total de Costos por Nivel de Cobro")
+            fig_treemap = figura_vista("treemap", clave_tabla, vista.tabla, periodo_col)
+            st.plotly_chart(fig_treemap, use_container_width=True)
+
+        # Comparación entre Consumo Real y Estimado
+        st.subheader("Comparación de Consumo Real vs Estimado")
+        fig_comparativo = figura_vista("comparativo", clave_filas, vista.filas, periodo_col)
+        st.plotly_chart(fig_comparativo, use_container_width=True)
 
-    # Periodo con Mayor Ahorro
-    st.subheader("Periodo con Mayor Ahorro")
-    mes_max_ahorro = df_filtrado.loc[df_filtrado['Ahorro Total'].idxmax()]
-    st.write(f"El mes con mayor ahorro fue **{mes_max_ahorro[periodo_col]}** con un ahorro de **${mes_max_ahorro['Ahorro Total']:,.2f}**.")
+        # Periodo con Mayor Ahorro
+        st.subheader("Periodo con Mayor Ahorro")
+        if resumen["maximo"] is not None:
+            # El periodo viaja con el máximo: la posición podría no existir en este df
+            max_ahorro, _, periodo_max = resumen["maximo"]
+            st.write(f"El mes con mayor ahorro fue **{periodo_max}** con un ahorro de **${max_ahorro:,.2f}**.")
 
     # Tabla resumen
-    st.subheader("Tabla Resumen de Datos Filtrados")
-    numeric_cols = df_filtrado.select_dtypes(include=['number']).columns
-    st.dataframe(df_filtrado.style.format({col: "${:,.2f}" for col in numeric_cols}))
+    with medicion.tramo("tabla"):
+        st.subheader("Tabla Resumen de Datos Filtrados")
+        numeric_cols = vista.tabla.select_dtypes(include=['number']).columns
+        # column_config formatea en el navegador; Styler no admite más de 262,144 celdas
+        st.dataframe(
+            vista.tabla,
+            column_config={col: st.column_config.NumberColumn(format="$%.2f") for col in numeric_cols},
+        )
 else:
     st.warning("No hay datos disponibles para mostrar los gráficos y análisis")
 
 st.markdown("---")
-st.write("_Monitoreo de paneles solares © 2024_", unsafe_allow_html=True)
\ No newline at end of file
+st.write("_Monitoreo de paneles solares © 2024_", unsafe_allow_html=True)
+
+registro_tiempos().registrar(medicion)
+
+# Panel de depuración con los tiempos de los últimos reruns
+if st.query_params.get("depurar") == "1" or os.environ.get("SOLAR_DEPURACION") == "1":
+    with st.expander("⏱️ Tiempos por fase (ms)"):
+        st.dataframe(registro_tiempos().tabla(RERUNS_DEPURACION, script="solar_app"), hide_index=True)
+
+if perfil is not None:
+    st.session_state.pop("perfil_activo", None)
+    ruta_perfil = perfil.terminar(filas=len(df))
+    st.caption(f"Perfil de este rerun guardado en `{ruta_perfil}`")
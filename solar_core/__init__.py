@@ -0,0 +1 @@
+"""Lógica reutilizable del monitoreo solar (almacenamiento, cálculos y recibos)."""
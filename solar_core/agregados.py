@@ -0,0 +1,238 @@
+"""Agregados incrementales del ahorro por origen y periodo.
+
+Los KPIs del tablero (ahorro acumulado, número de periodos y periodo con
+mayor ahorro) se resuelven con estos agregados en lugar de recorrer la
+columna ``Ahorro Total`` en cada rerun. Se construyen una vez por lectura del
+historial y después se actualizan en O(1) con cada alta o baja.
+
+Las sumas se llevan en centavos enteros (ver ``solar_core.dinero``), así que
+el ahorro acumulado es exacto y no depende del orden de las altas y bajas.
+
+El historial solo crece o se recorta por el final, así que el máximo de cada
+grupo se lleva como una pila de máximos prefijo: una alta apila si supera al
+máximo vigente y una baja desapila si la fila eliminada era ese máximo. Cada
+entrada guarda también el periodo de la fila, así quien muestra el máximo no
+tiene que buscarlo en un DataFrame que puede ser de otra lectura.
+"""
+import json
+import math
+
+import numpy as np
+import pandas as pd
+
+from solar_core.dinero import a_centavos, a_pesos
+from solar_core.filtros import columnas_clave
+
+COLUMNA_AHORRO = "Ahorro Total"
+
+
+def _clave(valor):
+    """Normaliza valores faltantes para usarlos como llave de diccionario"""
+    return None if pd.isna(valor) else valor
+
+
+def _valor(valor):
+    try:
+        valor = float(valor)
+    except (TypeError, ValueError):
+        return math.nan
+    return valor
+
+
+class Grupo:
+    """Suma (centavos), conteo y pila de máximos (valor, posición, periodo) de un conjunto de filas"""
+
+    __slots__ = ("suma", "cuenta", "maximos")
+
+    def __init__(self, suma=0, cuenta=0, maximos=None):
+        self.suma = suma
+        self.cuenta = cuenta
+        self.maximos = maximos if maximos is not None else []
+
+    def agregar(self, valor, posicion, periodo=None):
+        self.cuenta += 1
+        if math.isnan(valor):
+            return
+        self.suma += int(a_centavos(valor))
+        if not self.maximos or valor > self.maximos[-1][0]:
+            self.maximos.append((valor, posicion, periodo))
+
+    def quitar(self, valor, posicion):
+        self.cuenta -= 1
+        if math.isnan(valor):
+            return
+        self.suma -= int(a_centavos(valor))
+        if self.maximos and self.maximos[-1][1] == posicion:
+            self.maximos.pop()
+
+    @property
+    def maximo(self):
+        """(valor, posición, periodo) del mayor ahorro; None si no hay valores"""
+        return self.maximos[-1] if self.maximos else None
+
+    def anexar(self, registro, periodo_col):
+        """Suma ``registro`` como la fila siguiente a las del grupo (para el total del historial)"""
+        self.agregar(_valor(registro.get(COLUMNA_AHORRO)), self.cuenta, _clave(registro.get(periodo_col)))
+
+    def a_json(self):
+        return json.dumps({"suma": self.suma, "cuenta": self.cuenta, "maximos": self.maximos}, default=str)
+
+    @classmethod
+    def desde_json(cls, texto):
+        datos = json.loads(texto)
+        return cls(int(datos["suma"]), int(datos["cuenta"]), [tuple(m) for m in datos["maximos"]])
+
+
+def _valores_ahorro(df):
+    return pd.to_numeric(df[COLUMNA_AHORRO], errors="coerce").to_numpy(dtype=float)
+
+
+def total_historial(df):
+    """``Grupo`` con todas las filas de ``df``"""
+    if df.empty or COLUMNA_AHORRO not in df.columns:
+        return Grupo(cuenta=len(df))
+    valores = _valores_ahorro(df)
+    nuevos = _maximos_prefijo(valores)
+    periodo_col, _ = columnas_clave(df.columns)
+    periodos = df[periodo_col].to_numpy(dtype=object) if periodo_col in df.columns else np.full(len(df), None)
+    return Grupo(
+        int(a_centavos(np.where(np.isnan(valores), 0.0, valores)).sum()),
+        len(df),
+        [(v, p, _clave(e)) for v, p, e in zip(valores[nuevos].tolist(), np.arange(len(df))[nuevos].tolist(), periodos[nuevos])],
+    )
+
+
+def resumir(grupos):
+    """KPIs de la unión de ``grupos`` (ver ``AgregadosAhorro.resumen``)"""
+    maximos = [g.maximo for g in grupos if g.maximo is not None]
+    centavos = sum(g.suma for g in grupos)
+    return {
+        "suma": float(a_pesos(centavos)),
+        "suma_centavos": centavos,
+        "cuenta": sum(g.cuenta for g in grupos),
+        # En empate gana la fila más antigua, igual que idxmax
+        "maximo": max(maximos, key=lambda m: (m[0], -m[1])) if maximos else None,
+    }
+
+
+def _maximos_prefijo(valores, grupos=None):
+    """Máscara de las filas que establecen un nuevo máximo dentro de su grupo"""
+    serie = pd.Series(np.where(np.isnan(valores), -np.inf, valores))
+    if grupos is None:
+        previo = serie.cummax().shift(fill_value=-np.inf)
+    else:
+        previo = serie.groupby(grupos, sort=False, dropna=False, observed=True).cummax()
+        previo = previo.groupby(grupos, sort=False, dropna=False, observed=True).shift(fill_value=-np.inf)
+    return (serie > previo).to_numpy()
+
+
+class AgregadosAhorro:
+    """Agregados de ``Ahorro Total`` por (origen, periodo) y del historial completo"""
+
+    def __init__(self, periodo_col, origen_col=None):
+        self.periodo_col = periodo_col
+        self.origen_col = origen_col
+        self.total = Grupo()
+        self.grupos = {}
+        # Índices para resolver selecciones sin recorrer todos los grupos
+        self._por_periodo = {}
+        self._por_origen = {}
+
+    @classmethod
+    def desde_dataframe(cls, df):
+        """Construye los agregados de un historial con operaciones vectorizadas"""
+        periodo_col, origen_col = columnas_clave(df.columns)
+        agregados = cls(periodo_col, origen_col)
+        agregados.total = total_historial(df)
+        if df.empty or COLUMNA_AHORRO not in df.columns:
+            return agregados
+
+        valores = _valores_ahorro(df)
+        centavos = a_centavos(np.where(np.isnan(valores), 0.0, valores))
+
+        periodos = df[periodo_col] if periodo_col in df.columns else pd.Series([None] * len(df))
+        origenes = df[origen_col] if origen_col else pd.Series([None] * len(df))
+        llaves = [origenes.reset_index(drop=True), periodos.reset_index(drop=True)]
+        nuevos = _maximos_prefijo(valores, llaves)
+        filas = pd.DataFrame({"o": llaves[0], "p": llaves[1]})
+        for (origen, periodo), indices in filas.groupby(["o", "p"], sort=False, dropna=False, observed=True).indices.items():
+            marcados = indices[nuevos[indices]]
+            agregados._registrar(
+                _clave(origen),
+                _clave(periodo),
+                Grupo(
+                    int(centavos[indices].sum()),
+                    len(indices),
+                    [(v, p, _clave(periodo)) for v, p in zip(valores[marcados].tolist(), marcados.tolist())],
+                ),
+            )
+        return agregados
+
+    def _registrar(self, origen, periodo, grupo):
+        self.grupos[(origen, periodo)] = grupo
+        self._por_periodo.setdefault(periodo, {})[origen] = grupo
+        self._por_origen.setdefault(origen, {})[periodo] = grupo
+
+    def _grupo(self, registro):
+        origen = _clave(registro.get(self.origen_col)) if self.origen_col else None
+        periodo = _clave(registro.get(self.periodo_col))
+        grupo = self.grupos.get((origen, periodo))
+        if grupo is None:
+            grupo = Grupo()
+            self._registrar(origen, periodo, grupo)
+        return grupo
+
+    def agregar(self, registro, posicion):
+        """Suma la fila ``registro`` que quedó en ``posicion`` del historial"""
+        valor = _valor(registro.get(COLUMNA_AHORRO))
+        periodo = _clave(registro.get(self.periodo_col))
+        self.total.agregar(valor, posicion, periodo)
+        self._grupo(registro).agregar(valor, posicion, periodo)
+
+    def quitar(self, registro, posicion):
+        """Resta la última fila del historial, que estaba en ``posicion``"""
+        valor = _valor(registro.get(COLUMNA_AHORRO))
+        self.total.quitar(valor, posicion)
+        self._grupo(registro).quitar(valor, posicion)
+
+    def _seleccion(self, periodos, origenes):
+        if periodos is None and origenes is None:
+            return [self.total]
+        if periodos is not None and origenes is not None:
+            return [self.grupos[(o, p)] for p in periodos for o in origenes if (o, p) in self.grupos]
+        if periodos is not None:
+            return [g for p in periodos for g in self._por_periodo.get(p, {}).values()]
+        return [g for o in origenes for g in self._por_origen.get(o, {}).values()]
+
+    def resumen(self, periodos=None, origenes=None):
+        """KPIs de las filas seleccionadas; ``None`` significa sin filtrar.
+
+        Devuelve un diccionario con ``suma`` (pesos), ``suma_centavos``,
+        ``cuenta`` y ``maximo`` (valor, posición y periodo de la fila con mayor
+        ahorro, o None).
+        """
+        if periodos is not None:
+            periodos = list(dict.fromkeys(_clave(p) for p in periodos))
+        if origenes is not None:
+            origenes = list(dict.fromkeys(_clave(o) for o in origenes))
+        return resumir(self._seleccion(periodos, origenes))
+
+
+def calcular_kpis(resumen, inversion):
+    """Métricas de recuperación de la inversión a partir de ``resumen``"""
+    ahorro_acumulado = resumen["suma"] if resumen["cuenta"] else 0.0
+    num_periodos = resumen["cuenta"]
+    pendiente_recuperar = max(0, inversion - ahorro_acumulado)
+    progreso = (ahorro_acumulado / inversion) * 100 if inversion > 0 else 0
+    if num_periodos > 0 and ahorro_acumulado > 0:
+        meses_faltantes = pendiente_recuperar / (ahorro_acumulado / num_periodos)
+    else:
+        meses_faltantes = 0
+    return {
+        "ahorro_acumulado": ahorro_acumulado,
+        "pendiente_recuperar": pendiente_recuperar,
+        "progreso": progreso,
+        "meses_faltantes": meses_faltantes,
+        "ahorro_promedio_mensual": ahorro_acumulado / num_periodos if num_periodos > 0 else 0,
+        "periodos": num_periodos,
+    }
@@ -0,0 +1,687 @@
+"""Almacenamiento del historial de ahorro.
+
+El almacén principal es un archivo Parquet: se lee y escribe en columnas, sin
+pasar por openpyxl. Excel queda solo como formato de importación (el libro
+original se migra la primera vez) y de exportación.
+
+Los registros nuevos no reescriben el Parquet: se anotan en un diario
+(JSON lines) de solo-agregar, una línea por alta o por baja (tombstone del
+último registro). El diario se compacta en el Parquet en segundo plano al
+superar ``UMBRAL_COMPACTACION`` entradas (ver ``AlmacenParquet``).
+
+Toda alta se valida contra el esquema (``esquema.exigir_validos``) antes de
+tocar el disco: un registro inválido levanta ``RegistroInvalido`` y no deja
+rastro en el diario ni en el archivo.
+"""
+import contextlib
+import io
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from solar_core.agregados import AgregadosAhorro, Grupo, resumir, total_historial
+from solar_core.esquema import COLUMNAS_MONETARIAS, anexar_filas, compactar_tipos, exigir_validos
+from solar_core.filtros import columnas_clave
+from solar_core.registros import siguiente_num_periodo
+
+logger = logging.getLogger(__name__)
+
+UMBRAL_COMPACTACION = 64
+# Metadato del Parquet con la última generación de diario que ya contiene
+CLAVE_GENERACION = b"solar_diario_generacion"
+# Metadato del Parquet con los totales de ahorro de sus filas (``Grupo.a_json``)
+CLAVE_TOTALES = b"solar_ahorro_totales"
+# Segundos tras los que un candado de compactación se da por abandonado
+VENCIMIENTO_BLOQUEO = 600
+
+COLUMNAS_NUMERICAS = list(COLUMNAS_MONETARIAS)
+
+
+def firma_archivo(ruta):
+    """Huella (mtime, tamaño) del archivo; None si no existe"""
+    try:
+        stat = os.stat(ruta)
+        return (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        return None
+
+
+def limpiar_columnas(df):
+    """Normaliza nombres y convierte las columnas monetarias a float.
+
+    Devuelve el DataFrame y la lista de columnas que no se pudieron convertir.
+    """
+    df.columns = [str(col).strip() for col in df.columns]
+    invalidas = []
+    for col in COLUMNAS_NUMERICAS:
+        if col in df.columns:
+            try:
+                df[col] = df[col].replace("[\\$,]", "", regex=True).astype(float)
+            except (TypeError, ValueError):
+                invalidas.append(col)
+    return df, invalidas
+
+
+def importar_excel(ruta, hoja):
+    """Lee una hoja de Excel y la deja con el esquema del historial"""
+    return limpiar_columnas(pd.read_excel(ruta, sheet_name=hoja))
+
+
+def exportar_excel(df, hoja):
+    """Serializa el historial a un libro de Excel en memoria"""
+    buffer = io.BytesIO()
+    with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
+        df.to_excel(writer, sheet_name=hoja, index=False)
+    return buffer.getvalue()
+
+
+class Almacen:
+    """Interfaz común de los backends del historial.
+
+    ``cargar`` mantiene en memoria la última lectura y solo vuelve a disco
+    cuando cambia la firma del almacén, así que es seguro llamarlo en cada
+    rerun. Los backends implementan ``firma``, ``_leer`` y ``_escribir``.
+
+    Junto con la caché se mantienen los agregados de ahorro (ver
+    ``solar_core.agregados``): se construyen al leer y las altas y bajas los
+    actualizan sin recorrer el historial.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._cache = None
+        self._firma_cache = None
+        self._agregados = None
+        self.columnas_invalidas = []
+
+    def firma(self):
+        raise NotImplementedError
+
+    def _leer(self):
+        raise NotImplementedError
+
+    def _escribir(self, df):
+        raise NotImplementedError
+
+    def cargar(self):
+        with self._lock:
+            firma = self.firma()
+            if self._cache is None or firma != self._firma_cache:
+                # Periodo y origen como categorías, enteros compactos (ver solar_core.esquema)
+                self._cache = compactar_tipos(self._leer())
+                self._firma_cache = self.firma()
+                self._agregados = None
+            return self._cache
+
+    def cargar_con_firma(self):
+        """Como ``cargar``, junto con la firma que corresponde a esos datos"""
+        with self._lock:
+            df = self.cargar()
+            return df, self._firma_cache
+
+    def agregados_vigentes(self):
+        """True si hay agregados que corresponden a los datos actuales en disco"""
+        with self._lock:
+            return self._agregados is not None and self.firma() == self._firma_cache
+
+    def agregados(self):
+        """Agregados de ahorro del historial; tras ``liberar`` no se vuelve a leer
+        el archivo mientras no cambie su firma"""
+        with self._lock:
+            if self._cache is None and self.agregados_vigentes():
+                return self._agregados
+            df = self.cargar()
+            if self._agregados is None:
+                self._agregados = AgregadosAhorro.desde_dataframe(df)
+            return self._agregados
+
+    def resumen(self, periodos=None, origenes=None):
+        """KPIs de ahorro de la selección (ver ``AgregadosAhorro.resumen``)"""
+        with self._lock:
+            return self.agregados().resumen(periodos, origenes)
+
+    def _totales_en_disco(self):
+        """Totales del historial sin leer sus filas; None si el backend no los guarda"""
+        return None
+
+    def resumen_total(self):
+        """KPIs del historial completo sin dejarlo en memoria.
+
+        Usa los agregados vigentes o los totales guardados en disco; si no hay
+        ninguno lee el historial una vez y, si no estaba cargado, lo suelta
+        de nuevo (los agregados se conservan).
+        """
+        with self._lock:
+            if self.agregados_vigentes():
+                return self._agregados.resumen()
+            totales = self._totales_en_disco()
+            if totales is not None:
+                return resumir([totales])
+            cargado = self._cache is not None
+            resumen = self.resumen()
+            if not cargado:
+                self._cache = None
+            return resumen
+
+    def _actualizar_cache(self, df, agregados=None):
+        self._cache = df
+        self._firma_cache = self.firma()
+        self._agregados = agregados
+
+    def _candado_escritura(self):
+        """Candado entre procesos para reescribir el archivo completo.
+
+        Se toma siempre antes que ``self._lock``, nunca con él tomado.
+        """
+        return contextlib.nullcontext()
+
+    def guardar(self, df):
+        with self._candado_escritura(), self._lock:
+            self._escribir(df)
+            self._actualizar_cache(df)
+
+    def actualizar(self, transformar, intentos=5):
+        """Reescribe el historial con ``transformar(df)`` sobre los datos vigentes.
+
+        ``transformar`` recibe el historial actual y devuelve ``(df_nuevo,
+        resultado)``; con ``df_nuevo`` None no se escribe nada. Lectura,
+        transformación y escritura ocurren bajo los candados, como en
+        ``agregar_siguiente``; si otro proceso cambia el archivo mientras
+        tanto se vuelve a transformar. Devuelve ``resultado``.
+        """
+        with self._candado_escritura(), self._lock:
+            for _ in range(intentos):
+                df, firma = self.cargar_con_firma()
+                nuevo, resultado = transformar(df)
+                if nuevo is None:
+                    return resultado
+                if firma is not None and self.firma() == firma:
+                    self._escribir(nuevo)
+                    self._actualizar_cache(nuevo)
+                    return resultado
+            raise RuntimeError("El historial cambió en cada intento de actualizarlo")
+
+    def _sumar_altas(self, df, registros):
+        """Actualiza los agregados vigentes con las filas que se acaban de agregar al final de ``df``"""
+        if self._agregados is not None:
+            inicio = len(df) - len(registros)
+            for i, registro in enumerate(registros):
+                self._agregados.agregar(registro, inicio + i)
+        return self._agregados
+
+    def _descontar_baja(self, df):
+        """Descuenta de los agregados la última fila de ``df`` antes de borrarla"""
+        if self._agregados is not None:
+            self._agregados.quitar(df.iloc[-1].to_dict(), len(df) - 1)
+        return self._agregados
+
+    def agregar(self, registro):
+        return self.agregar_lote([registro])
+
+    def agregar_siguiente(self, armar):
+        """Agrega el registro ``armar(num_periodo)`` con el siguiente número consecutivo.
+
+        El número se calcula bajo el candado del almacén, así que dos altas
+        simultáneas no reciben el mismo. Devuelve el registro agregado.
+        """
+        with self._lock:
+            registro = armar(siguiente_num_periodo(self.cargar()))
+            self.agregar(registro)
+            return registro
+
+    def agregar_numerados(self, registros):
+        """Agrega ``registros`` con ``No. Periodo`` consecutivos a partir del siguiente.
+
+        Como en ``agregar_siguiente``, la numeración se calcula bajo el
+        candado del almacén. Devuelve los registros con su número.
+        """
+        with self._lock:
+            inicio = siguiente_num_periodo(self.cargar())
+            registros = [{**registro, "No. Periodo": inicio + i} for i, registro in enumerate(registros)]
+            self.agregar_lote(registros)
+            return registros
+
+    def quitar_ultimo(self):
+        """Borra el último registro y lo devuelve (Series); None si el historial está vacío"""
+        with self._lock:
+            df = self.cargar()
+            if df.empty:
+                return None
+            eliminado = df.iloc[-1]
+            self.borrar_ultimo()
+            return eliminado
+
+    def agregar_lote(self, registros):
+        """Valida todos los registros en una pasada y los escribe juntos"""
+        registros = list(registros)
+        exigir_validos(registros)
+        with self._lock:
+            df = self.cargar()
+            if not registros:
+                return df
+            df = anexar_filas(df, registros)
+            self._escribir(df)
+            self._actualizar_cache(df, self._sumar_altas(df, registros))
+            return df
+
+    def borrar_ultimo(self):
+        with self._lock:
+            df = self.cargar()
+            if df.empty:
+                return df
+            agregados = self._descontar_baja(df)
+            df = df.iloc[:-1].copy()
+            self._escribir(df)
+            self._actualizar_cache(df, agregados)
+            return df
+
+    def compactar(self):
+        """Los backends sin diario no tienen nada que compactar"""
+
+    def liberar(self):
+        """Suelta el DataFrame en memoria; los agregados se conservan"""
+        with self._lock:
+            self._cache = None
+
+    def invalidar(self):
+        with self._lock:
+            self._cache = None
+            self._firma_cache = None
+            self._agregados = None
+
+
+def _json_default(valor):
+    """Convierte escalares de NumPy/pandas al anotarlos en el diario"""
+    if hasattr(valor, "item"):
+        return valor.item()
+    if isinstance(valor, pd.Timestamp):
+        return valor.isoformat()
+    raise TypeError(f"Tipo no serializable: {type(valor).__name__}")
+
+
+def _generacion(esquema):
+    return int((esquema.metadata or {}).get(CLAVE_GENERACION, b"0"))
+
+
+def _reproducir_diarios(rutas):
+    """Reproduce los diarios en orden: altas vigentes, filas base dadas de baja y entradas leídas"""
+    altas = []
+    bajas = 0
+    entradas = 0
+    for ruta in rutas:
+        if not os.path.exists(ruta):
+            continue
+        with open(ruta, encoding="utf-8") as f:
+            for linea in f:
+                if not linea.strip():
+                    continue
+                try:
+                    entrada = json.loads(linea)
+                except json.JSONDecodeError:
+                    # Última línea incompleta por una escritura interrumpida
+                    logger.warning("Entrada ilegible en %s", ruta)
+                    continue
+                entradas += 1
+                if entrada.get("op") == "alta":
+                    altas.append(entrada["registro"])
+                elif altas:
+                    altas.pop()
+                else:
+                    bajas += 1
+    return altas, bajas, entradas
+
+
+def _aplicar_diario(df, altas, bajas):
+    if bajas:
+        df = df.iloc[:max(len(df) - bajas, 0)]
+    if altas:
+        df = anexar_filas(df, altas)
+    return df
+
+
+class _BloqueoArchivo:
+    """Candado entre procesos: un archivo creado en exclusiva.
+
+    Un candado más viejo que ``vencimiento`` segundos se considera abandonado
+    (proceso que murió compactando) y se toma de nuevo.
+    """
+
+    def __init__(self, ruta, vencimiento=VENCIMIENTO_BLOQUEO):
+        self.ruta = ruta
+        self.vencimiento = vencimiento
+
+    def adquirir(self, espera=0.0):
+        limite = time.monotonic() + espera
+        while True:
+            try:
+                os.close(os.open(self.ruta, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return True
+            except FileExistsError:
+                try:
+                    if time.time() - os.stat(self.ruta).st_mtime > self.vencimiento:
+                        logger.warning("Candado abandonado en %s", self.ruta)
+                        os.remove(self.ruta)
+                        continue
+                except FileNotFoundError:
+                    continue
+            if time.monotonic() >= limite:
+                return False
+            time.sleep(0.05)
+
+    def liberar(self):
+        try:
+            os.remove(self.ruta)
+        except FileNotFoundError:
+            pass
+
+
+class AlmacenParquet(Almacen):
+    """Historial en Parquet más un diario de solo-agregar.
+
+    Si el Parquet aún no existe se importa desde el libro de Excel.
+
+    Para compactar, el diario activo se rota primero con ``os.replace`` a un
+    diario numerado (``<ruta>.diario.<n>.jsonl``) y el Parquet nuevo anota en
+    sus metadatos la generación ``n`` que ya contiene. Al leer solo se
+    reproducen los diarios rotados de generación mayor, así que un corte entre
+    escribir el Parquet y borrar los diarios no duplica filas, y lo que otro
+    proceso anote mientras tanto cae en el diario activo nuevo. El Parquet se
+    escribe fuera del candado: las sesiones siguen leyendo y anotando.
+    """
+
+    def __init__(self, ruta, origen_excel=None, hoja=None, umbral_compactacion=UMBRAL_COMPACTACION):
+        super().__init__()
+        self.ruta = ruta
+        self.ruta_diario = f"{ruta}.diario.jsonl"
+        self.origen_excel = origen_excel
+        self.hoja = hoja
+        self.umbral_compactacion = umbral_compactacion
+        self._bloqueo = _BloqueoArchivo(f"{ruta}.compactando")
+        # Candado propio: la migración corre dentro de cargar, con self._lock
+        # tomado, y no puede esperar al de compactación (ver _candado_escritura)
+        self._bloqueo_migracion = _BloqueoArchivo(f"{ruta}.migrando")
+        self._entradas_diario = 0
+        self._compactando = False
+
+    def firma(self):
+        return (firma_archivo(self.ruta), firma_archivo(self.ruta_diario))
+
+    def cargar(self):
+        with self._lock:
+            if self._cache is None or self.firma() != self._firma_cache:
+                self._cache, self._firma_cache = self._leer_estable()
+                self._agregados = None
+            return self._cache
+
+    def _leer_estable(self, intentos=5):
+        """Lee el historial y la firma que le corresponde.
+
+        Si otro proceso rota el diario o reemplaza el Parquet a media lectura,
+        la firma cambia y se vuelve a leer.
+        """
+        for _ in range(intentos):
+            firma = self.firma()
+            df = compactar_tipos(self._leer())
+            if self.firma() == firma:
+                return df, firma
+        return df, None
+
+    def _leer(self):
+        df, generacion = self._leer_base()
+        rutas = [ruta for numero, ruta in self._diarios_rotados() if numero > generacion]
+        altas, bajas, self._entradas_diario = _reproducir_diarios([*rutas, self.ruta_diario])
+        return _aplicar_diario(df, altas, bajas)
+
+    def _leer_base(self):
+        """El Parquet y la generación de diario que ya incluye"""
+        if not os.path.exists(self.ruta):
+            if self.origen_excel and os.path.exists(self.origen_excel):
+                return self._migrar()
+            return pd.DataFrame(), 0
+        return self._leer_parquet()
+
+    def _leer_parquet(self):
+        tabla = pq.read_table(self.ruta)
+        return tabla.to_pandas(), _generacion(tabla.schema)
+
+    def _migrar(self):
+        """Importa el libro de Excel al Parquet; un solo proceso migra a la vez"""
+        if not self._bloqueo_migracion.adquirir(espera=VENCIMIENTO_BLOQUEO):
+            raise TimeoutError(f"{self.ruta} sigue bloqueado por otra migración")
+        try:
+            if os.path.exists(self.ruta):
+                # Otro proceso terminó de migrar mientras se esperaba el candado
+                return self._leer_parquet()
+            df, self.columnas_invalidas = importar_excel(self.origen_excel, self.hoja)
+            logger.info("Migrando %s a %s", self.origen_excel, self.ruta)
+            os.replace(self._escribir_temporal(df, 0), self.ruta)
+            return df, 0
+        finally:
+            self._bloqueo_migracion.liberar()
+
+    def _totales_en_disco(self):
+        """Totales guardados en el Parquet más las altas de los diarios pendientes.
+
+        None si el Parquet no los trae (escrito antes de guardarlos), si los
+        diarios dan de baja filas de la base (su ahorro no está en el diario)
+        o si otro proceso cambió los archivos a media lectura.
+        """
+        firma = self.firma()
+        try:
+            esquema = pq.read_schema(self.ruta)
+        except (OSError, ValueError):
+            return None
+        crudo = (esquema.metadata or {}).get(CLAVE_TOTALES)
+        if crudo is None:
+            return None
+        generacion = _generacion(esquema)
+        rutas = [ruta for numero, ruta in self._diarios_rotados() if numero > generacion]
+        altas, bajas, _ = _reproducir_diarios([*rutas, self.ruta_diario])
+        if bajas or self.firma() != firma:
+            return None
+        total = Grupo.desde_json(crudo)
+        periodo_col, _ = columnas_clave(esquema.names)
+        for registro in altas:
+            total.anexar(registro, periodo_col)
+        return total
+
+    def _generacion_base(self):
+        try:
+            return _generacion(pq.read_schema(self.ruta))
+        except (OSError, ValueError):
+            return 0
+
+    def _ruta_rotado(self, generacion):
+        return f"{self.ruta}.diario.{generacion}.jsonl"
+
+    def _diarios_rotados(self):
+        """(generación, ruta) de los diarios rotados, de la más vieja a la más nueva"""
+        directorio = os.path.dirname(self.ruta) or "."
+        prefijo = f"{os.path.basename(self.ruta)}.diario."
+        try:
+            nombres = os.listdir(directorio)
+        except OSError:
+            return []
+        rotados = []
+        for nombre in nombres:
+            numero = nombre[len(prefijo):-len(".jsonl")] if nombre.startswith(prefijo) and nombre.endswith(".jsonl") else ""
+            if numero.isdigit():
+                rotados.append((int(numero), os.path.join(directorio, nombre)))
+        return sorted(rotados)
+
+    def _rotar_diario(self):
+        """Mueve el diario activo a uno numerado; devuelve la generación que cubre todos los rotados"""
+        generacion = max([self._generacion_base(), *(numero for numero, _ in self._diarios_rotados())])
+        if os.path.exists(self.ruta_diario):
+            generacion += 1
+            os.replace(self.ruta_diario, self._ruta_rotado(generacion))
+        self._entradas_diario = 0
+        return generacion
+
+    def _borrar_rotados(self, generacion):
+        for numero, ruta in self._diarios_rotados():
+            if numero <= generacion:
+                try:
+                    os.remove(ruta)
+                except FileNotFoundError:
+                    pass
+
+    def _escribir_temporal(self, df, generacion):
+        tabla = pa.Table.from_pandas(df, preserve_index=False)
+        metadatos = {
+            **(tabla.schema.metadata or {}),
+            CLAVE_GENERACION: str(generacion).encode(),
+            CLAVE_TOTALES: total_historial(df).a_json().encode(),
+        }
+        tmp = f"{self.ruta}.{generacion}.{uuid.uuid4().hex}.tmp"
+        pq.write_table(tabla.replace_schema_metadata(metadatos), tmp)
+        return tmp
+
+    @contextlib.contextmanager
+    def _candado_escritura(self):
+        # Mismo orden que compactar: primero el archivo y después self._lock
+        if not self._bloqueo.adquirir(espera=VENCIMIENTO_BLOQUEO):
+            raise TimeoutError(f"{self.ruta} sigue bloqueado por otra compactación")
+        try:
+            yield
+        finally:
+            self._bloqueo.liberar()
+
+    def _escribir(self, df):
+        """Reescribe el Parquet con ``df``, que ya incluye todos los diarios.
+
+        Se llama con ``_candado_escritura`` tomado (ver ``guardar``).
+        """
+        generacion = self._rotar_diario()
+        os.replace(self._escribir_temporal(df, generacion), self.ruta)
+        self._borrar_rotados(generacion)
+
+    def _anotar(self, *entradas):
+        """Agrega las entradas al diario con una sola escritura y un solo fsync"""
+        texto = "".join(json.dumps(entrada, ensure_ascii=False, default=_json_default) + "\n" for entrada in entradas)
+        with open(self.ruta_diario, "a", encoding="utf-8") as f:
+            f.write(texto)
+            f.flush()
+            os.fsync(f.fileno())
+        self._entradas_diario += len(entradas)
+
+    def agregar_lote(self, registros):
+        """Anota una línea por registro en el diario; el costo no crece con el historial"""
+        registros = list(registros)
+        exigir_validos(registros)
+        with self._lock:
+            df = self.cargar()
+            if not registros:
+                return df
+            self._anotar(*({"op": "alta", "registro": registro} for registro in registros))
+            df = anexar_filas(df, registros)
+            self._actualizar_cache(df, self._sumar_altas(df, registros))
+        self._programar_compactacion()
+        return df
+
+    def borrar_ultimo(self):
+        """Anota un tombstone del último registro en lugar de reescribir el archivo"""
+        with self._lock:
+            df = self.cargar()
+            if df.empty:
+                return df
+            self._anotar({"op": "baja"})
+            agregados = self._descontar_baja(df)
+            df = df.iloc[:-1]
+            self._actualizar_cache(df, agregados)
+        self._programar_compactacion()
+        return df
+
+    def _programar_compactacion(self):
+        with self._lock:
+            if self._compactando or self._entradas_diario < self.umbral_compactacion:
+                return
+            self._compactando = True
+        threading.Thread(target=self.compactar, name="compactar-historial", daemon=True).start()
+
+    def compactar(self):
+        """Vuelca los diarios en el Parquet; no hace nada si otro proceso ya está compactando"""
+        if not self._bloqueo.adquirir():
+            self._compactando = False
+            return
+        try:
+            with self._lock:
+                if not self._entradas_diario and not self._diarios_rotados():
+                    return
+                vigente = self._firma_cache == self.firma()
+                generacion = self._rotar_diario()
+                firma_base = firma_archivo(self.ruta)
+                if vigente:
+                    self._firma_cache = self.firma()
+            # Fuera del candado: base + diarios rotados, sin lo que se anote de aquí en adelante
+            df, base = self._leer_base()
+            rutas = [ruta for numero, ruta in self._diarios_rotados() if base < numero <= generacion]
+            df = _aplicar_diario(df, *_reproducir_diarios(rutas)[:2])
+            tmp = self._escribir_temporal(df, generacion)
+            with self._lock:
+                if firma_archivo(self.ruta) != firma_base:
+                    # Otro proceso reescribió el Parquet (p. ej. tras tomar un
+                    # candado vencido): la instantánea ya no vale
+                    logger.warning("%s cambió durante la compactación; se descarta", self.ruta)
+                    os.remove(tmp)
+                    return
+                firma = self.firma()
+                os.replace(tmp, self.ruta)
+                if self._firma_cache == firma:
+                    # El contenido no cambió: se conservan la caché y los agregados vigentes
+                    self._firma_cache = self.firma()
+                self._borrar_rotados(generacion)
+        except Exception:
+            logger.exception("No se pudo compactar %s", self.ruta)
+        finally:
+            self._bloqueo.liberar()
+            self._compactando = False
+
+
+class AlmacenExcel(Almacen):
+    """Backend heredado que lee y reescribe el libro completo en cada cambio"""
+
+    def __init__(self, ruta, hoja):
+        super().__init__()
+        self.ruta = ruta
+        self.hoja = hoja
+
+    def firma(self):
+        return firma_archivo(self.ruta)
+
+    def _leer(self):
+        df, self.columnas_invalidas = importar_excel(self.ruta, self.hoja)
+        return df
+
+    def _escribir(self, df):
+        with pd.ExcelWriter(self.ruta, engine='openpyxl', mode='w') as writer:
+            df.to_excel(writer, sheet_name=self.hoja, index=False)
+
+
+_almacenes = {}
+_almacenes_lock = threading.Lock()
+
+
+def abrir_almacen(ruta, origen_excel=None, hoja="Total"):
+    """Devuelve el almacén del proceso para ``ruta``, elegido por extensión.
+
+    Las instancias se comparten entre reruns y sesiones para que la caché de
+    ``cargar`` sea de todo el proceso.
+    """
+    ruta = os.path.abspath(ruta)
+    with _almacenes_lock:
+        almacen = _almacenes.get(ruta)
+        if almacen is None:
+            if ruta.endswith((".xlsx", ".xlsm")):
+                almacen = AlmacenExcel(ruta, hoja)
+            else:
+                almacen = AlmacenParquet(ruta, origen_excel=origen_excel, hoja=hoja)
+            _almacenes[ruta] = almacen
+        return almacen
@@ -0,0 +1,233 @@
+"""API HTTP (ASGI) del historial de ahorro.
+
+Expone sin Streamlit lo mismo que usa el tablero: historial y KPIs por
+instalación, alta y baja de registros, lectura de recibos PDF (en una cola
+de trabajos, ver ``solar_core.trabajos``) y el cálculo de la tarifa
+escalonada. Las instalaciones salen del mismo registro de sitios
+(``solar_core.sitios``), así que la API y la app comparten almacenes y cachés
+cuando corren en el mismo proceso.
+
+Las altas, bajas y recibos piden ``Authorization: Bearer <token>`` con el token
+de ``SOLAR_API_TOKEN``; sin token configurado esos endpoints responden 503.
+Las consultas no piden token. Si la cola de recibos está llena de trabajos
+sin terminar, ``POST /recibos`` responde 429 con ``Retry-After``.
+
+Los candados y cachés de los almacenes son del proceso, así que la API corre
+con un solo worker::
+
+    uvicorn solar_core.api:app --host 0.0.0.0 --port 8000
+    python -m solar_core.api --port 8000
+"""
+import argparse
+import hmac
+import os
+import threading
+from typing import List, Optional
+
+from fastapi import Depends, FastAPI, File, HTTPException, Query, Response, UploadFile
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from pydantic import BaseModel, Field
+
+from solar_core.agregados import calcular_kpis
+from solar_core.esquema import RegistroInvalido
+from solar_core.filtros import IndiceHistorial, filtrar
+from solar_core.registros import construir_registro, entradas_desde_recibo
+from solar_core.sitios import INVERSION_POR_DEFECTO, abrir_registro
+from solar_core.tarifas import ANCHOS_KWH, IVA, NIVELES, calcular_tarifa, precios_por_nivel
+from solar_core.trabajos import ColaLlena, cola_recibos
+
+app = FastAPI(title="API Solar", description="Historial de ahorro y tarifas de CFE")
+
+_indices = {}
+_indices_lock = threading.Lock()
+_portador = HTTPBearer(auto_error=False)
+
+
+class NuevoRegistro(BaseModel):
+    periodo: str = Field(min_length=1)
+    kwh_solar: float = Field(ge=0)
+    kwh_cfe: List[float] = Field(min_length=4, max_length=4, description="Básico, Intermedio 1, Intermedio 2, Excedente")
+    kwh_devueltos: float = Field(ge=0)
+    precios: List[float] = Field(min_length=3, max_length=3, description="Básico, Intermedio, Excedente")
+
+
+class ConsultaTarifa(BaseModel):
+    kwh: float = Field(ge=0)
+    precios: List[float] = Field(min_length=3, max_length=3, description="Básico, Intermedio, Excedente")
+
+
+# ============================
+# Utilidades
+# ============================
+def _registro():
+    return abrir_registro()
+
+
+def exigir_token(credenciales: Optional[HTTPAuthorizationCredentials] = Depends(_portador)):
+    """Dependencia de los endpoints que escriben: compara el token con ``SOLAR_API_TOKEN``"""
+    token = os.environ.get("SOLAR_API_TOKEN")
+    if not token:
+        raise HTTPException(status_code=503, detail="Escritura deshabilitada: falta configurar SOLAR_API_TOKEN")
+    if credenciales is None or not hmac.compare_digest(credenciales.credentials.encode(), token.encode()):
+        raise HTTPException(status_code=401, detail="Token inválido", headers={"WWW-Authenticate": "Bearer"})
+
+
+def _validar_sitio(sitio_id):
+    if sitio_id not in _registro().sitios:
+        raise HTTPException(status_code=404, detail=f"Sitio desconocido: {sitio_id}")
+
+
+def _indice(sitio_id, df, firma):
+    """Índice de filtros del sitio, reconstruido solo si cambia la firma del historial"""
+    with _indices_lock:
+        vigente = _indices.get(sitio_id)
+        if vigente is None or vigente[0] != firma:
+            vigente = (firma, IndiceHistorial(df))
+            _indices[sitio_id] = vigente
+        return vigente[1]
+
+
+def _seleccion(valores):
+    return valores or None
+
+
+# ============================
+# Instalaciones e historial
+# ============================
+@app.get("/sitios")
+def listar_sitios():
+    registro = _registro()
+    return [
+        {"id": sitio.id, "nombre": sitio.nombre, "inversion_inicial": sitio.inversion_inicial}
+        for sitio in registro.sitios.values()
+    ]
+
+
+@app.get("/sitios/resumen")
+def resumen_sitios():
+    """Ahorro de todas las instalaciones a partir de sus agregados"""
+    tabla = _registro().resumen_sitios()
+    return Response(tabla.to_json(orient="records", force_ascii=False), media_type="application/json")
+
+
+@app.get("/sitios/{sitio_id}/historial")
+def historial(
+    sitio_id: str,
+    periodo: Optional[List[str]] = Query(None),
+    origen: Optional[List[str]] = Query(None),
+    nivel: Optional[List[str]] = Query(None),
+    desde: int = Query(0, ge=0),
+    limite: Optional[int] = Query(None, ge=1),
+):
+    """Registros del historial con los mismos filtros que el tablero"""
+    _validar_sitio(sitio_id)
+    df, firma = _registro().cargar(sitio_id)
+    vista = filtrar(df, _indice(sitio_id, df, firma), _seleccion(periodo), _seleccion(origen), _seleccion(nivel))
+    fin = None if limite is None else desde + limite
+    tabla = vista.tabla.iloc[desde:fin]
+    return Response(tabla.to_json(orient="records", force_ascii=False), media_type="application/json")
+
+
+@app.get("/sitios/{sitio_id}/kpis")
+def kpis(
+    sitio_id: str,
+    periodo: Optional[List[str]] = Query(None),
+    origen: Optional[List[str]] = Query(None),
+    inversion: Optional[float] = Query(None, ge=0),
+):
+    """Métricas de recuperación; se resuelven con los agregados sin recorrer el historial"""
+    _validar_sitio(sitio_id)
+    registro = _registro()
+    resumen = registro.resumen(sitio_id, _seleccion(periodo), _seleccion(origen))
+    if inversion is None:
+        inversion = registro.sitio(sitio_id).inversion_inicial or INVERSION_POR_DEFECTO
+    resultado = calcular_kpis(resumen, inversion)
+    resultado["inversion"] = inversion
+    resultado["mayor_ahorro"] = resumen["maximo"][0] if resumen["maximo"] else None
+    return resultado
+
+
+@app.post("/sitios/{sitio_id}/registros", status_code=201, dependencies=[Depends(exigir_token)])
+def agregar_registro(sitio_id: str, datos: NuevoRegistro):
+    _validar_sitio(sitio_id)
+    registro = _registro()
+    df, _ = registro.cargar(sitio_id)
+    periodo_col = "Periodos" if "Periodos" in df.columns else "Periodo"
+
+    def armar(num_periodo):
+        return construir_registro(
+            datos.periodo, num_periodo, datos.kwh_solar, datos.kwh_cfe,
+            datos.kwh_devueltos, datos.precios, periodo_col
+        )
+
+    try:
+        # El número de periodo se asigna bajo el candado del almacén
+        return registro.almacen(sitio_id).agregar_siguiente(armar)
+    except RegistroInvalido as e:
+        raise HTTPException(status_code=422, detail=[mensaje for _, mensaje in e.errores])
+
+
+@app.delete("/sitios/{sitio_id}/registros/ultimo", dependencies=[Depends(exigir_token)])
+def borrar_ultimo(sitio_id: str):
+    _validar_sitio(sitio_id)
+    eliminado = _registro().almacen(sitio_id).quitar_ultimo()
+    if eliminado is None:
+        raise HTTPException(status_code=404, detail="El historial está vacío")
+    return Response(eliminado.to_json(force_ascii=False), media_type="application/json")
+
+
+# ============================
+# Recibos y tarifas
+# ============================
+@app.post("/recibos", status_code=202, dependencies=[Depends(exigir_token)])
+def encolar_recibo(archivo: UploadFile = File(...)):
+    """Acepta un recibo PDF y lo encola; el resultado se consulta en /recibos/{id}.
+
+    Es síncrono a propósito: leer el archivo, calcular su huella y consultar
+    la caché en disco corren en el threadpool, no en el event loop.
+    """
+    contenido = archivo.file.read()
+    try:
+        trabajo_id = cola_recibos().encolar(archivo.filename or "recibo.pdf", contenido)
+    except ColaLlena as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "30"})
+    return {"id": trabajo_id, "estado": cola_recibos().estado(trabajo_id).estado}
+
+
+@app.get("/recibos/{trabajo_id}")
+async def estado_recibo(trabajo_id: str):
+    """Estado del trabajo; al terminar trae los datos del recibo y las entradas del formulario"""
+    trabajo = cola_recibos().estado(trabajo_id)
+    if trabajo is None:
+        raise HTTPException(status_code=404, detail=f"Trabajo desconocido: {trabajo_id}")
+    resultado = trabajo.a_dict()
+    resultado["entradas"] = entradas_desde_recibo(trabajo.datos) if trabajo.datos else None
+    return resultado
+
+
+@app.post("/tarifa")
+def tarifa(consulta: ConsultaTarifa):
+    """Tarifa escalonada de un consumo total"""
+    cargos = calcular_tarifa(consulta.kwh, precios_por_nivel(*consulta.precios))
+    return {
+        "niveles": dict(zip(NIVELES, cargos["niveles"].tolist())),
+        "subtotal": float(cargos["subtotal"]),
+        "iva": float(cargos["iva"]),
+        "total": float(cargos["total"]),
+        "anchos_kwh": list(ANCHOS_KWH),
+        "tasa_iva": IVA,
+    }
+
+
+def main(argv=None):
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Servidor HTTP de la API Solar")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args(argv)
+    uvicorn.run("solar_core.api:app", host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
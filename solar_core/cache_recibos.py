@@ -0,0 +1,87 @@
+"""Caché persistente de datos extraídos de recibos.
+
+La llave es el SHA-256 del PDF, así que un recibo que se vuelve a subir (o que
+sigue en el uploader durante los reruns) no pasa otra vez por pdfplumber.
+Cada entrada es un JSON en disco; al superar ``max_entradas`` se descartan
+las de acceso más antiguo (LRU por mtime).
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+DIRECTORIO_CACHE = os.environ.get("SOLAR_CACHE_RECIBOS", os.path.join(".cache", "recibos"))
+MAX_ENTRADAS = 512
+
+
+def huella_bytes(contenido):
+    return hashlib.sha256(contenido).hexdigest()
+
+
+def huella_archivo(ruta, bloque=1 << 20):
+    h = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for parte in iter(lambda: f.read(bloque), b""):
+            h.update(parte)
+    return h.hexdigest()
+
+
+class CacheRecibos:
+    """Mapa huella -> datos del recibo, con desalojo LRU acotado"""
+
+    def __init__(self, directorio=DIRECTORIO_CACHE, max_entradas=MAX_ENTRADAS, version=1):
+        self.directorio = directorio
+        self.max_entradas = max_entradas
+        self.version = version
+        self._lock = threading.Lock()
+
+    def _ruta(self, huella):
+        return os.path.join(self.directorio, f"{huella}.v{self.version}.json")
+
+    def obtener(self, huella):
+        ruta = self._ruta(huella)
+        try:
+            with open(ruta, encoding="utf-8") as f:
+                datos = json.load(f)
+            os.utime(ruta)  # marca el acceso para el LRU
+            return datos
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            logger.warning("Entrada de caché ilegible: %s", ruta)
+            return None
+
+    def guardar(self, huella, datos):
+        try:
+            os.makedirs(self.directorio, exist_ok=True)
+            ruta = self._ruta(huella)
+            # Un temporal por hilo: la cola de la app y la API pueden guardar el mismo recibo a la vez
+            tmp = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(datos, f, ensure_ascii=False)
+            os.replace(tmp, ruta)
+            self._desalojar()
+        except OSError:
+            logger.warning("No se pudo escribir la caché de recibos en %s", self.directorio)
+
+    def _desalojar(self):
+        with self._lock:
+            entradas = []
+            with os.scandir(self.directorio) as it:
+                for e in it:
+                    if e.name.endswith(".json"):
+                        try:
+                            entradas.append((e.stat().st_mtime_ns, e.path))
+                        except FileNotFoundError:
+                            pass
+            sobrantes = len(entradas) - self.max_entradas
+            if sobrantes <= 0:
+                return
+            for _, ruta in sorted(entradas)[:sobrantes]:
+                try:
+                    os.remove(ruta)
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,55 @@
+"""Aritmética de dinero exacta en centavos enteros.
+
+Los montos se llevan como ``int64`` de centavos y las cantidades con
+decimales (kWh, precios por kWh, tasas) como enteros de punto fijo, así que
+sumar, multiplicar y aplicar el IVA no acumula errores de punto flotante: el
+mismo historial da siempre los mismos centavos, sin importar el orden de la
+suma. Todo trabaja sobre arreglos de NumPy completos (sin ``Decimal`` por
+elemento).
+
+El redondeo es a la mitad hacia arriba (alejándose de cero), como en los
+recibos.
+"""
+import numpy as np
+
+CENTAVOS = 100
+# Decimales que se conservan de cada cantidad al pasarla a punto fijo
+ESCALA_KWH = 1_000
+ESCALA_PRECIO = 10_000
+ESCALA_TASA = 10_000
+
+
+def a_fijo(valores, escala):
+    """Redondea ``valores`` a enteros en unidades de ``1 / escala``"""
+    valores = np.asarray(valores, dtype=float)
+    if np.isnan(valores).any():
+        raise ValueError("No se pueden convertir valores faltantes a punto fijo")
+    # El redondeo previo absorbe errores de representación como 1.005 * 100 = 100.4999...
+    escalados = np.round(np.abs(valores) * escala, 6)
+    return (np.sign(valores) * np.floor(escalados + 0.5)).astype(np.int64)
+
+
+def a_centavos(pesos):
+    return a_fijo(pesos, CENTAVOS)
+
+
+def a_pesos(centavos):
+    """Centavos enteros a pesos (float64, el valor más cercano al monto exacto)"""
+    return np.asarray(centavos, dtype=np.int64) / CENTAVOS
+
+
+def dividir(numerador, divisor):
+    """División entera redondeando a la mitad hacia arriba"""
+    numerador = np.asarray(numerador, dtype=np.int64)
+    return np.sign(numerador) * ((np.abs(numerador) + divisor // 2) // divisor)
+
+
+def importe(kwh, precio):
+    """Centavos de ``kwh`` a ``precio`` pesos por kWh, con un solo redondeo"""
+    producto = a_fijo(kwh, ESCALA_KWH) * a_fijo(precio, ESCALA_PRECIO)
+    return dividir(producto, ESCALA_KWH * ESCALA_PRECIO // CENTAVOS)
+
+
+def aplicar_tasa(centavos, tasa):
+    """Centavos de ``tasa`` (p. ej. 0.16) sobre ``centavos``"""
+    return dividir(np.asarray(centavos, dtype=np.int64) * a_fijo(tasa, ESCALA_TASA), ESCALA_TASA)
@@ -0,0 +1,256 @@
+"""Tipos compactos del historial en memoria.
+
+Cada columna conocida del historial tiene un tipo en ``ESQUEMA``:
+
+- ``categoria``: periodo y origen se guardan como categorías (un código
+  entero por fila) en lugar de una cadena de Python por fila. Las categorías
+  quedan en orden de aparición, que es el orden cronológico del historial.
+- ``entero``: ``No. Periodo`` y ``Total periodo`` usan el entero más chico
+  que alcanza, si la columna no tiene faltantes.
+- ``dinero``, ``kwh`` y ``precio``: se quedan en float64. float32 no
+  conserva los centavos de montos mayores a ~167 mil ni los decimales del IVA
+  calculado, y las sumas de los KPIs se desviarían.
+
+``compactar_tipos`` se aplica al leer el historial y ``anexar_filas`` agrega
+registros sin perder los tipos. El Parquet guarda las categorías como
+diccionario, así que la siguiente lectura ya llega compacta::
+
+    python -m solar_core.esquema "Inversión sistema fotovoltaico.parquet"
+
+Antes de escribir, el almacén pasa los registros nuevos por
+``validar_registros``: columnas requeridas, rangos y que los cargos de cada
+recibo cuadren (escalones contra subtotal, IVA y total, en centavos). Todas
+las reglas se evalúan en una sola pasada de NumPy sobre la matriz numérica,
+así que validar un lote de miles de registros cuesta lo mismo que uno.
+"""
+import argparse
+import sys
+
+import numpy as np
+import pandas as pd
+
+from solar_core.dinero import a_centavos, aplicar_tasa
+from solar_core.tarifas import (
+    COLUMNA_KWH_DEVUELTOS, COLUMNA_KWH_SOLAR, COLUMNAS_KWH_CFE, COLUMNAS_PRECIO, COLUMNAS_RECIBO, IVA,
+)
+
+COLUMNAS_CATEGORICAS = ("Periodos", "Periodo", "Origen")
+COLUMNAS_ENTERAS = ("No. Periodo", "Total periodo")
+COLUMNAS_MONETARIAS = ('Ahorro Total', 'Básico Solar', 'Intermedio 1 Solar', 'Intermedio 2 Solar',
+                       'Excedente Solar', 'Básico CFE', 'Intermedio 1 CFE', 'Intermedio 2 CFE',
+                       'Excedente CFE', 'Subtotal Solar', 'IVA Solar', 'Total de recibo Solar',
+                       'Subtotal CFE', 'IVA CFE', 'Subtotal CFE.1')
+COLUMNAS_KWH = (COLUMNA_KWH_SOLAR, *COLUMNAS_KWH_CFE, COLUMNA_KWH_DEVUELTOS,
+                "Total de kilowatts generados por el fotovoltaico", "Total de kilowatts utilizados")
+
+ESQUEMA = {
+    **{col: "categoria" for col in COLUMNAS_CATEGORICAS},
+    **{col: "entero" for col in COLUMNAS_ENTERAS},
+    **{col: "dinero" for col in COLUMNAS_MONETARIAS},
+    **{col: "kwh" for col in COLUMNAS_KWH},
+    **{col: "precio" for col in COLUMNAS_PRECIO},
+}
+
+# Entradas que ``registros.construir_registro`` guarda con cada periodo
+COLUMNAS_ENTRADA_KWH = (COLUMNA_KWH_SOLAR, *COLUMNAS_KWH_CFE, COLUMNA_KWH_DEVUELTOS)
+COLUMNAS_REQUERIDAS = ("No. Periodo", *COLUMNAS_ENTRADA_KWH, *COLUMNAS_PRECIO, *COLUMNAS_MONETARIAS)
+# Límites (inclusive) de cada tipo numérico de un registro nuevo
+RANGOS = {
+    "entero": (1, 1e6),
+    "kwh": (0.0, 1e6),
+    "precio": (0.0, 100.0),
+    "dinero": (0.0, 1e9),
+}
+# Diferencia máxima, en centavos, entre un total y la suma de sus partes
+TOLERANCIA_CENTAVOS = 1
+MAX_ERRORES_MENSAJE = 5
+
+
+class RegistroInvalido(ValueError):
+    """Registros que no cumplen el esquema; ``errores`` es la lista de
+    ``(fila, mensaje)`` de ``validar_registros``"""
+
+    def __init__(self, errores):
+        self.errores = list(errores)
+        detalle = "; ".join(
+            mensaje if fila is None else f"fila {fila}: {mensaje}"
+            for fila, mensaje in self.errores[:MAX_ERRORES_MENSAJE]
+        )
+        restantes = len(self.errores) - MAX_ERRORES_MENSAJE
+        if restantes > 0:
+            detalle += f" (y {restantes} errores más)"
+        super().__init__(f"Registro inválido: {detalle}")
+
+    def filas(self):
+        """Posiciones de las filas con al menos un error"""
+        return sorted({fila for fila, _ in self.errores if fila is not None})
+
+
+def _columna_periodo(df, periodo_col):
+    if periodo_col is not None:
+        return periodo_col
+    return next((col for col in ("Periodos", "Periodo") if col in df.columns), "Periodos")
+
+
+def _matriz_numerica(df, columnas):
+    """Las columnas como una matriz float (n, k); lo que no es número queda como NaN"""
+    try:
+        return df[list(columnas)].to_numpy(dtype=float)
+    except (TypeError, ValueError):
+        return np.column_stack([pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=float) for col in columnas])
+
+
+def validar_registros(registros, periodo_col=None):
+    """Valida registros nuevos del historial contra el esquema.
+
+    ``registros`` es un DataFrame o una lista de dicts. Devuelve la lista de
+    ``(fila, mensaje)`` con la posición de cada fila inválida (``None`` para
+    errores de todo el lote); vacía si todo es válido.
+    """
+    df = registros if isinstance(registros, pd.DataFrame) else pd.DataFrame(list(registros))
+    if df.empty:
+        return []
+    periodo_col = _columna_periodo(df, periodo_col)
+    faltantes = [col for col in (periodo_col, *COLUMNAS_REQUERIDAS) if col not in df.columns]
+    if faltantes:
+        return [(None, f"faltan las columnas: {', '.join(faltantes)}")]
+
+    errores = []
+
+    def reportar(invalidas, mensaje):
+        errores.extend((int(fila), mensaje) for fila in np.flatnonzero(invalidas))
+
+    periodos = df[periodo_col]
+    reportar(periodos.isna().to_numpy() | (periodos.astype(str).str.strip() == "").to_numpy(), "el periodo está vacío")
+
+    matriz = _matriz_numerica(df, COLUMNAS_REQUERIDAS)
+    posicion = {col: i for i, col in enumerate(COLUMNAS_REQUERIDAS)}
+    nulos = np.isnan(matriz)
+    for j in np.flatnonzero(nulos.any(axis=0)):
+        reportar(nulos[:, j], f"'{COLUMNAS_REQUERIDAS[j]}' falta o no es numérico")
+
+    # Rangos: una comparación por columna contra los límites de su tipo
+    tipos = ["entero"] + [ESQUEMA[col] for col in COLUMNAS_REQUERIDAS[1:]]
+    minimos = np.array([RANGOS[t][0] for t in tipos])
+    maximos = np.array([RANGOS[t][1] for t in tipos])
+    with np.errstate(invalid="ignore"):
+        fuera = ~nulos & ((matriz < minimos) | (matriz > maximos))
+    for j in np.flatnonzero(fuera.any(axis=0)):
+        reportar(fuera[:, j], f"'{COLUMNAS_REQUERIDAS[j]}' fuera de rango [{minimos[j]:g}, {maximos[j]:g}]")
+    numero = matriz[:, posicion["No. Periodo"]]
+    reportar(~nulos[:, posicion["No. Periodo"]] & (numero != np.round(numero)), "'No. Periodo' no es entero")
+
+    # Consistencia de cada recibo en centavos; las filas con faltantes ya se reportaron
+    centavos = a_centavos(np.where(nulos, 0.0, matriz))
+    for recibo, nombres in COLUMNAS_RECIBO.items():
+        niveles = centavos[:, [posicion[col] for col in nombres["niveles"]]].sum(axis=1)
+        subtotal = centavos[:, posicion[nombres["subtotal"]]]
+        iva = centavos[:, posicion[nombres["iva"]]]
+        total = centavos[:, posicion[nombres["total"]]]
+        reportar(np.abs(niveles - subtotal) > TOLERANCIA_CENTAVOS,
+                 f"'{nombres['subtotal']}' no es la suma de los escalones")
+        reportar(np.abs(aplicar_tasa(subtotal, IVA) - iva) > TOLERANCIA_CENTAVOS,
+                 f"'{nombres['iva']}' no es el {IVA:.0%} del subtotal")
+        reportar(np.abs(subtotal + iva - total) > TOLERANCIA_CENTAVOS,
+                 f"'{nombres['total']}' no es el subtotal más IVA")
+
+    errores.sort(key=lambda error: error[0])
+    return errores
+
+
+def exigir_validos(registros, periodo_col=None):
+    """Como ``validar_registros``, pero levanta ``RegistroInvalido`` si hay errores"""
+    errores = validar_registros(registros, periodo_col)
+    if errores:
+        raise RegistroInvalido(errores)
+
+
+def _categorica(serie):
+    return pd.Categorical(serie, categories=pd.unique(serie.dropna()))
+
+
+def _entero(serie):
+    """La serie con el entero más chico que la contiene; sin cambios si no es entera"""
+    if not pd.api.types.is_numeric_dtype(serie) or serie.isna().any():
+        return serie
+    valores = serie.to_numpy()
+    if valores.dtype.kind == "f" and not np.array_equal(valores, np.round(valores)):
+        return serie
+    return pd.to_numeric(serie, downcast="integer")
+
+
+def compactar_tipos(df):
+    """Aplica ``ESQUEMA`` a las columnas de ``df`` que todavía no lo cumplen"""
+    for col in df.columns:
+        tipo = ESQUEMA.get(col)
+        serie = df[col]
+        if tipo == "categoria" and not isinstance(serie.dtype, pd.CategoricalDtype):
+            df[col] = _categorica(serie)
+        elif tipo == "entero":
+            compacta = _entero(serie)
+            if compacta.dtype != serie.dtype:
+                df[col] = compacta
+    return df
+
+
+def anexar_filas(df, filas):
+    """Agrega ``filas`` (registros o DataFrame) al final de ``df`` conservando los tipos compactos"""
+    nuevas = filas.copy() if isinstance(filas, pd.DataFrame) else pd.DataFrame(filas)
+    for col in nuevas.columns.intersection(df.columns):
+        tipo = df[col].dtype
+        if isinstance(tipo, pd.CategoricalDtype):
+            faltantes = pd.Index(nuevas[col].dropna().unique()).difference(tipo.categories)
+            if len(faltantes):
+                df = df.assign(**{col: df[col].cat.add_categories(faltantes)})
+                tipo = df[col].dtype
+            nuevas[col] = pd.Categorical(nuevas[col], dtype=tipo)
+        elif tipo.kind == "i":
+            compacta = _entero(nuevas[col])
+            if compacta.dtype.kind == "i":
+                destino = np.promote_types(tipo, compacta.dtype)
+                if destino != tipo:
+                    df = df.assign(**{col: df[col].astype(destino)})
+                nuevas[col] = compacta.astype(destino)
+    return pd.concat([df, nuevas], ignore_index=True)
+
+
+def reporte_memoria(df):
+    """Memoria por columna antes y después de compactar (bytes)"""
+    compacto = compactar_tipos(df.copy())
+    antes = df.memory_usage(deep=True, index=False)
+    despues = compacto.memory_usage(deep=True, index=False)
+    return pd.DataFrame({
+        "tipo_antes": df.dtypes.astype(str),
+        "bytes_antes": antes,
+        "tipo_despues": compacto.dtypes.astype(str),
+        "bytes_despues": despues,
+    })
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Memoria del historial antes y después de compactar tipos")
+    parser.add_argument("ruta", help="Historial en Parquet o Excel")
+    parser.add_argument("--hoja", default="Total", help="Hoja del libro de Excel")
+    args = parser.parse_args(argv)
+
+    if args.ruta.endswith((".xlsx", ".xlsm")):
+        df = pd.read_excel(args.ruta, sheet_name=args.hoja)
+    else:
+        df = pd.read_parquet(args.ruta)
+        # El Parquet puede venir ya compacto; se mide contra los tipos por defecto
+        df = df.astype({
+            col: object if isinstance(df[col].dtype, pd.CategoricalDtype) else "int64"
+            for col in df.columns
+            if isinstance(df[col].dtype, pd.CategoricalDtype) or df[col].dtype.kind == "i"
+        })
+    reporte = reporte_memoria(df)
+    with pd.option_context("display.width", 160, "display.max_rows", None, "display.max_columns", None):
+        print(reporte)
+    antes, despues = reporte["bytes_antes"].sum(), reporte["bytes_despues"].sum()
+    cambio = (despues / antes - 1) * 100 if antes else 0.0
+    print(f"\n{len(df):,} filas: {antes / 2**20:.2f} MB -> {despues / 2**20:.2f} MB ({cambio:+.0f}%)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+"""Filtros del tablero por periodo, origen y nivel de cobro.
+
+Los valores de ``Periodos`` y ``Origen`` se codifican una vez por lectura del
+historial (como categorías) y cada valor queda asociado a las posiciones de
+sus filas. Filtrar es entonces buscar esas posiciones y tomar solo esas filas:
+el costo depende de cuántas filas se seleccionan, no del tamaño del historial.
+
+Los niveles de cobro se resuelven con un mapa fijo nivel → columnas en lugar
+de buscar el nombre del nivel dentro de cada columna.
+"""
+import numpy as np
+import pandas as pd
+
+from solar_core.tarifas import COLUMNAS_KWH_CFE, COLUMNAS_PRECIO, NIVELES
+
+COLUMNA_ORIGEN = "Origen"
+
+_PRECIO_NIVEL = dict(zip(NIVELES, (COLUMNAS_PRECIO[0], COLUMNAS_PRECIO[1], COLUMNAS_PRECIO[1], COLUMNAS_PRECIO[2])))
+
+# Columnas del historial que pertenecen a cada nivel de cobro
+COLUMNAS_POR_NIVEL = {
+    nivel: (f"{nivel} Solar", f"{nivel} CFE", kwh, _PRECIO_NIVEL[nivel])
+    for nivel, kwh in zip(NIVELES, COLUMNAS_KWH_CFE)
+}
+
+
+def columnas_clave(columnas):
+    """Nombres de las columnas de periodo y origen (None si no hay origen)"""
+    periodo_col = "Periodos" if "Periodos" in columnas else "Periodo"
+    origen_col = COLUMNA_ORIGEN if COLUMNA_ORIGEN in columnas else None
+    return periodo_col, origen_col
+
+
+def columnas_nivel(columnas, niveles):
+    """Columnas de ``columnas`` que corresponden a los ``niveles`` elegidos, en su orden"""
+    elegidas = {col for nivel in niveles for col in COLUMNAS_POR_NIVEL.get(nivel, ())}
+    return [col for col in columnas if col in elegidas]
+
+
+class IndiceCategorico:
+    """Posiciones de las filas de cada valor de una columna"""
+
+    def __init__(self, serie):
+        codigos, valores = pd.factorize(serie, use_na_sentinel=False)
+        orden = np.argsort(codigos, kind="stable")
+        limites = np.searchsorted(codigos[orden], np.arange(len(valores) + 1))
+        self.valores = list(valores)
+        self._posiciones = {
+            valor: orden[limites[i]:limites[i + 1]] for i, valor in enumerate(self.valores)
+        }
+
+    def posiciones(self, valores):
+        """Posiciones ordenadas de las filas con alguno de ``valores``"""
+        partes = [self._posiciones[v] for v in dict.fromkeys(valores) if v in self._posiciones]
+        if not partes:
+            return np.empty(0, dtype=np.intp)
+        if len(partes) == 1:
+            return partes[0]
+        return np.sort(np.concatenate(partes))
+
+
+class IndiceHistorial:
+    """Índices de periodo y origen de un historial ya cargado"""
+
+    def __init__(self, df):
+        self.periodo_col, self.origen_col = columnas_clave(df.columns)
+        self.filas = len(df)
+        self.periodos = IndiceCategorico(df[self.periodo_col]) if self.periodo_col in df.columns else None
+        self.origenes = IndiceCategorico(df[self.origen_col]) if self.origen_col else None
+
+    @property
+    def opciones_periodo(self):
+        return self.periodos.valores if self.periodos is not None else []
+
+    @property
+    def opciones_origen(self):
+        return self.origenes.valores if self.origenes is not None else []
+
+    def posiciones(self, periodos=None, origenes=None):
+        """Posiciones de las filas seleccionadas; None significa todas"""
+        seleccion = None
+        if periodos is not None and self.periodos is not None:
+            seleccion = self.periodos.posiciones(periodos)
+        if origenes is not None and self.origenes is not None:
+            por_origen = self.origenes.posiciones(origenes)
+            seleccion = por_origen if seleccion is None else np.intersect1d(seleccion, por_origen, assume_unique=True)
+        return seleccion
+
+
+class VistaFiltrada:
+    """Selección de filas y columnas sobre el historial base, materializada al usarla.
+
+    Sin filtros de filas, ``filas`` es el mismo DataFrame base (no se copia);
+    un filtro de periodo u origen toma solo las filas seleccionadas la
+    primera vez que se piden. El filtro de niveles solo proyecta columnas en
+    ``tabla``: las gráficas y KPIs siguen viendo todas las columnas.
+
+    Con Copy-on-Write de pandas activo, ``filas`` y ``tabla`` comparten los
+    datos del historial hasta que alguien los modifique.
+    """
+
+    def __init__(self, base, indice, posiciones=None, niveles=None):
+        self.base = base
+        self.indice = indice
+        self.posiciones = posiciones
+        self.niveles = niveles
+        self._filas = None
+        self._tabla = None
+
+    @property
+    def filtra_filas(self):
+        return self.posiciones is not None
+
+    def __len__(self):
+        return len(self.base) if self.posiciones is None else len(self.posiciones)
+
+    @property
+    def empty(self):
+        return len(self) == 0
+
+    @property
+    def filas(self):
+        """Filas seleccionadas con todas sus columnas"""
+        if self._filas is None:
+            self._filas = self.base if self.posiciones is None else self.base.take(self.posiciones)
+        return self._filas
+
+    @property
+    def tabla(self):
+        """Filas seleccionadas, proyectadas a los niveles de cobro elegidos"""
+        if self._tabla is None:
+            df = self.filas
+            if self.niveles is not None:
+                claves = [self.indice.periodo_col] + ([self.indice.origen_col] if self.indice.origen_col else [])
+                df = df[claves + columnas_nivel(df.columns, self.niveles)]
+            self._tabla = df
+        return self._tabla
+
+
+def filtrar(df, indice, periodos=None, origenes=None, niveles=None):
+    """Vista de ``df`` con la selección; ``None`` en un filtro no restringe"""
+    return VistaFiltrada(df, indice, indice.posiciones(periodos, origenes), niveles)
@@ -0,0 +1,192 @@
+"""Formatos de recibo CFE y sus patrones precompilados.
+
+Cada formato tiene nombre y versión; ``parsear_texto`` elige el primero que
+reconoce el texto y extrae todos los campos de ``CAMPOS_RECIBO``. Los
+patrones se compilan una sola vez al importar el módulo.
+
+``FormatoTabla`` recorre el texto una sola vez: un único patrón localiza las
+líneas que empiezan con una palabra clave (periodo, total, energía, filas de
+la tabla de escalones...) y cada línea se analiza con su patrón anclado, sin
+``.*?`` que pueda retroceder por toda la página. ``FormatoLegado`` conserva
+los patrones originales para recibos que no traen la tabla en ese formato.
+
+Los campos de encabezado (periodo, total, energía, apoyo) que ``FormatoTabla``
+no encuentra al inicio de una línea, como en los encabezados a varias
+columnas, se completan con los patrones de ``FormatoLegado``.
+"""
+import re
+import time
+
+CAMPOS_RECIBO = (
+    "periodo_facturado", "total_pagar", "energia_total_kwh", "consumo_total_periodo",
+    "basico_kwh", "basico_precio", "basico_subtotal",
+    "intermedio_kwh", "intermedio_precio", "intermedio_subtotal",
+    "excedente_kwh", "excedente_precio", "excedente_subtotal",
+    "apoyo_gubernamental",
+)
+
+# Tope del texto analizado: acota el tiempo de parseo de recibos anómalos
+MAX_CARACTERES = 200_000
+
+
+def _numero(valor):
+    try:
+        return float(valor.replace(",", ""))
+    except (AttributeError, ValueError):
+        return 0.0
+
+
+def _datos_vacios():
+    return {campo: ("" if campo == "periodo_facturado" else 0.0) for campo in CAMPOS_RECIBO}
+
+
+class FormatoRecibo:
+    """Interfaz de un formato de recibo"""
+
+    nombre = ""
+    version = 0
+
+    def detectar(self, texto):
+        raise NotImplementedError
+
+    def extraer(self, texto):
+        raise NotImplementedError
+
+
+class FormatoTabla(FormatoRecibo):
+    """Recibo doméstico con filas 'Nivel kWh precio subtotal' en la tabla de escalones"""
+
+    nombre = "tabla-escalones"
+    version = 3
+
+    _LINEA = re.compile(
+        r"^[ \t]*(PERIODO FACTURADO|TOTAL A PAGAR|Energía|Básico|Intermedio|Excedente|Apoyo Gubernamental)"
+        r"(?![^\W\d_])[^\n]*",
+        re.MULTILINE,
+    )
+    _PERIODO = re.compile(r"[ \t]*PERIODO FACTURADO:[ \t]*(.*)")
+    _TOTAL = re.compile(r"[ \t]*TOTAL A PAGAR:[ \t]*\$[ \t]*([\d,]+)")
+    _ENERGIA = re.compile(
+        r"[ \t]*Energía[ \t]*\(kWh\)[ \t]+(\d+,\d+|\d+)(?:[ \t]+\S+[ \t]+(\d+,\d+|\d+))?"
+    )
+    _NIVEL = re.compile(
+        r"[ \t]*(Básico|Intermedio|Excedente)[ \t]+(\d+,\d+|\d+)[ \t]+(\d+\.\d+)(?:[ \t]+([\d,]+\.\d+))?"
+    )
+    _APOYO = re.compile(r"[ \t]*Apoyo Gubernamental[ \t]+([\d\.,]+)")
+    _FIRMA = re.compile(r"^[ \t]*(?:Básico|Intermedio|Excedente)[ \t]+(?:\d+,\d+|\d+)[ \t]+\d+\.\d+", re.MULTILINE)
+    _PREFIJOS = {"Básico": "basico", "Intermedio": "intermedio", "Excedente": "excedente"}
+    # Campos de encabezado que pueden quedar a media línea; si faltan se buscan con el formato legado.
+    # Los escalones no: una fila ausente es un escalón sin consumo.
+    _ENCABEZADOS = {
+        "periodo": ("periodo_facturado",),
+        "total": ("total_pagar",),
+        "energia": ("energia_total_kwh", "consumo_total_periodo"),
+        "apoyo": ("apoyo_gubernamental",),
+    }
+
+    def detectar(self, texto):
+        return self._FIRMA.search(texto) is not None
+
+    def extraer(self, texto):
+        datos = _datos_vacios()
+        pendientes = {"periodo", "total", "energia", "basico", "intermedio", "excedente", "apoyo"}
+
+        for linea in self._LINEA.finditer(texto):
+            clave = linea.group(1)
+            texto_linea = linea.group(0)
+
+            if clave == "PERIODO FACTURADO" and "periodo" in pendientes:
+                m = self._PERIODO.match(texto_linea)
+                if m:
+                    datos["periodo_facturado"] = m.group(1).strip()
+                    pendientes.discard("periodo")
+            elif clave == "TOTAL A PAGAR" and "total" in pendientes:
+                m = self._TOTAL.match(texto_linea)
+                if m:
+                    datos["total_pagar"] = _numero(m.group(1))
+                    pendientes.discard("total")
+            elif clave == "Energía" and "energia" in pendientes:
+                m = self._ENERGIA.match(texto_linea)
+                if m:
+                    datos["energia_total_kwh"] = _numero(m.group(1))
+                    datos["consumo_total_periodo"] = _numero(m.group(2))
+                    pendientes.discard("energia")
+            elif clave in self._PREFIJOS:
+                prefijo = self._PREFIJOS[clave]
+                m = self._NIVEL.match(texto_linea)
+                if m and prefijo in pendientes:
+                    datos[f"{prefijo}_kwh"] = _numero(m.group(2))
+                    datos[f"{prefijo}_precio"] = _numero(m.group(3))
+                    datos[f"{prefijo}_subtotal"] = _numero(m.group(4))
+                    pendientes.discard(prefijo)
+            elif clave == "Apoyo Gubernamental" and "apoyo" in pendientes:
+                m = self._APOYO.match(texto_linea)
+                if m:
+                    datos["apoyo_gubernamental"] = _numero(m.group(1))
+                    pendientes.discard("apoyo")
+
+            if not pendientes:
+                break
+
+        faltantes = [campo for clave in pendientes & self._ENCABEZADOS.keys() for campo in self._ENCABEZADOS[clave]]
+        if faltantes:
+            datos.update(FormatoLegado().extraer(texto, faltantes))
+        return datos
+
+
+class FormatoLegado(FormatoRecibo):
+    """Patrones originales sobre todo el texto; se usa cuando ningún otro formato aplica"""
+
+    nombre = "legado"
+    version = 1
+
+    # campo -> (patrón compilado, grupo)
+    _PATRONES = {
+        "periodo_facturado": (re.compile(r"PERIODO FACTURADO:\s*(.*?)\n", re.DOTALL), 1),
+        "total_pagar": (re.compile(r"TOTAL A PAGAR:\s*\$\s*([\d,]+)", re.DOTALL), 1),
+        "energia_total_kwh": (re.compile(r"Energía\s*\(kWh\)\s+(\d+,\d+|\d+)", re.DOTALL), 1),
+        "consumo_total_periodo": (re.compile(r"Energía\s*\(kWh\)\s+.*?\s+.*?\s+(\d+,\d+|\d+)", re.DOTALL), 1),
+        "basico_kwh": (re.compile(r"Básico\s+(\d+,\d+|\d+)\s+(\d+,\d+|\d+)\s+(\d+)", re.DOTALL), 3),
+        "basico_precio": (re.compile(r"Básico\s+.*?(\d+\.\d+)\s+(\d+\.\d+)", re.DOTALL), 1),
+        "basico_subtotal": (re.compile(r"Básico\s+.*?\s+(\d+\.\d+)\s+(\d+\.\d+)", re.DOTALL), 2),
+        "intermedio_kwh": (re.compile(r"Intermedio\s+(\d+,\d+|\d+)\s+(\d+\.\d+)", re.DOTALL), 1),
+        "intermedio_precio": (re.compile(r"Intermedio\s+(\d+,\d+|\d+)\s+(\d+\.\d+)", re.DOTALL), 2),
+        "intermedio_subtotal": (re.compile(r"Intermedio\s+.*?\s+(\d+\.\d+)\s+(\d+\.\d+)", re.DOTALL), 2),
+        "excedente_kwh": (re.compile(r"Excedente\s+(\d+,\d+|\d+)\s+(\d+\.\d+)", re.DOTALL), 1),
+        "excedente_precio": (re.compile(r"Excedente\s+(\d+,\d+|\d+)\s+(\d+\.\d+)", re.DOTALL), 2),
+        "excedente_subtotal": (re.compile(r"Excedente\s+.*?\s+(\d+\.\d+)\s+(\d+\.\d+)", re.DOTALL), 2),
+        "apoyo_gubernamental": (re.compile(r"Apoyo Gubernamental\s+([\d\.,]+)", re.DOTALL), 1),
+    }
+
+    def detectar(self, texto):
+        return True
+
+    def extraer(self, texto, campos=CAMPOS_RECIBO):
+        datos = {}
+        for campo in campos:
+            patron, grupo = self._PATRONES[campo]
+            m = patron.search(texto)
+            valor = m.group(grupo) if m else None
+            if campo == "periodo_facturado":
+                datos[campo] = valor.strip() if valor else ""
+            else:
+                datos[campo] = _numero(valor)
+        return datos
+
+
+# En orden de preferencia; el último siempre aplica
+FORMATOS = (FormatoTabla(), FormatoLegado())
+VERSION_FORMATOS = "+".join(f"{f.nombre}.{f.version}" for f in FORMATOS)
+
+
+def parsear_texto(texto):
+    """Extrae los campos del texto del recibo.
+
+    Devuelve ``(datos, formato, segundos)`` para poder medir el parseo de cada
+    recibo.
+    """
+    inicio = time.perf_counter()
+    texto = texto[:MAX_CARACTERES]
+    formato = next(f for f in FORMATOS if f.detectar(texto))
+    datos = formato.extraer(texto)
+    return datos, formato, time.perf_counter() - inicio
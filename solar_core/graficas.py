@@ -0,0 +1,57 @@
+"""Figuras del tablero de ahorro.
+
+Funciones puras (DataFrame -> figura de Plotly) para que la app pueda
+memorizarlas por huella de datos y no reconstruirlas en cada rerun.
+"""
+from solar_core.perezoso import modulo_perezoso
+
+# Plotly se importa al construir la primera figura, no al importar este módulo
+px = modulo_perezoso("plotly.express")
+
+COLUMNAS_NIVEL = ["Básico Solar", "Intermedio 1 Solar", "Intermedio 2 Solar", "Excedente Solar",
+                  "Básico CFE", "Intermedio 1 CFE", "Intermedio 2 CFE", "Excedente CFE"]
+
+
+def figura_ahorro(df, periodo_col):
+    return px.area(
+        df, x=periodo_col, y="Ahorro Total",
+        title="Evolución del Ahorro por Periodo",
+        markers=True, color_discrete_sequence=["#2ECC71"]
+    )
+
+
+def figura_dona(ahorro_acumulado, pendiente_recuperar):
+    return px.pie(
+        names=["Ahorro Total", "Restante"],
+        values=[ahorro_acumulado, pendiente_recuperar],
+        title="Progreso de Recuperación",
+        hole=0.5,
+        color_discrete_sequence=["#2ECC71", "#E74C3C"]
+    )
+
+
+def figura_treemap(df):
+    df_totales = df[[col for col in COLUMNAS_NIVEL if col in df.columns]].sum().reset_index()
+    df_totales.columns = ["Nivel de Cobro", "Costo Total"]
+    # Los niveles sin costo no tienen área y rompen la escala de color
+    df_totales = df_totales[df_totales["Costo Total"] > 0]
+    return px.treemap(
+        df_totales, path=["Nivel de Cobro"], values="Costo Total",
+        title="Proporción Total de Costos por Nivel de Cobro",
+        color="Costo Total", color_continuous_scale="Viridis"
+    )
+
+
+def figura_comparativo(df, periodo_col):
+    return px.bar(
+        df, x=periodo_col, y=["Total de recibo Solar", "Subtotal CFE.1"],
+        barmode="group", title="Consumo Real (Verde) vs Estimado (Amarillo)",
+        color_discrete_map={"Total de recibo Solar": "#2ECC71", "Subtotal CFE.1": "#F4D03F"}
+    )
+
+
+FIGURAS = {
+    "ahorro": figura_ahorro,
+    "treemap": lambda df, periodo_col: figura_treemap(df),
+    "comparativo": figura_comparativo,
+}
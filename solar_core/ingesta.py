@@ -0,0 +1,275 @@
+"""Ingesta masiva de recibos como un pipeline de generadores.
+
+Etapas: descubrir PDFs -> extraer y parsear campos -> validar -> calcular
+tarifas -> agregar al historial. Los registros se agregan en lotes de
+``LOTE``: cada lote se valida contra el esquema en una sola pasada y se
+escribe con ``agregar_lote``. Cada etapa es un generador que pide
+elementos a la anterior solo cuando los necesita, y la extracción (la etapa
+cara) corre en un pool de procesos con a lo sumo ``ventana`` recibos en
+vuelo. La memoria queda acotada sin importar cuántos recibos haya.
+
+Un recibo que falla en cualquier etapa va a la lista de descartes
+(dead-letter) con la etapa y el motivo, y el flujo sigue. Cada recibo tiene el
+mismo plazo de proceso que en la cola de trabajos (``trabajos.TIEMPO_MAXIMO``)::
+
+    python -m solar_core.ingesta carpeta_de_recibos --historial historial.parquet
+"""
+import argparse
+import itertools
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from solar_core.almacen import abrir_almacen
+from solar_core.cache_recibos import huella_archivo
+from solar_core.esquema import validar_registros
+from solar_core.recibos import analizar_recibo, cache_recibos
+from solar_core.registros import construir_registro, entradas_desde_recibo, siguiente_num_periodo
+from solar_core.trabajos import TIEMPO_MAXIMO, terminar_pool
+
+VENTANA = 8
+LOTE = 64
+
+
+class _Descarte(Exception):
+    def __init__(self, etapa, motivo):
+        super().__init__(motivo)
+        self.etapa = etapa
+
+
+def descubrir_pdfs(directorio):
+    """Genera las rutas de los PDF conforme se recorre el árbol de directorios"""
+    for raiz, carpetas, nombres in os.walk(directorio):
+        carpetas.sort()
+        for nombre in sorted(nombres):
+            if nombre.lower().endswith(".pdf"):
+                yield os.path.join(raiz, nombre)
+
+
+def _extraer(ruta):
+    """Tarea del pool: campos del recibo (con caché por contenido) o el error"""
+    try:
+        huella = huella_archivo(ruta)
+        datos = cache_recibos.obtener(huella)
+        if datos is None:
+            datos, _ = analizar_recibo(ruta)
+            cache_recibos.guardar(huella, datos)
+        return datos, None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def _enviar(pool, funcion, elemento):
+    try:
+        return pool.submit(funcion, elemento)
+    except BrokenProcessPool as e:
+        futuro = Future()
+        futuro.set_exception(e)
+        return futuro
+
+
+def _mapa_acotado(funcion, elementos, procesos, ventana, tiempo_maximo=TIEMPO_MAXIMO):
+    """Como ``map`` en un pool de procesos, sin más de ``ventana`` tareas pendientes.
+
+    Genera ``(elemento, resultado, error)``: una tarea que falla no corta el
+    flujo. Si un proceso muere (un PDF que tumba al intérprete, falta de
+    memoria), el pool se rehace y las tareas que estaban en vuelo se repiten
+    una por una, así que solo se descarta la que lo tumba. Una tarea que no
+    termina en ``tiempo_maximo`` segundos (contados desde que la anterior
+    entregó su resultado) falla con ``TimeoutError``: sus procesos se terminan
+    y las demás tareas en vuelo se reenvían a un pool nuevo. Con un solo
+    proceso las tareas corren aquí mismo, sin plazo.
+    """
+    if procesos == 1:
+        for elemento in elementos:
+            try:
+                yield elemento, funcion(elemento), None
+            except Exception as e:
+                yield elemento, None, e
+        return
+    contexto = multiprocessing.get_context("spawn")
+
+    def nuevo_pool():
+        return ProcessPoolExecutor(max_workers=procesos, mp_context=contexto)
+
+    def vencida():
+        return TimeoutError(f"Tiempo agotado ({tiempo_maximo:.0f} s)")
+
+    pool = nuevo_pool()
+    elementos = iter(elementos)
+    en_vuelo = deque()
+    inicio = time.monotonic()
+    try:
+        while True:
+            for elemento in itertools.islice(elementos, ventana - len(en_vuelo)):
+                en_vuelo.append((elemento, _enviar(pool, funcion, elemento)))
+            if not en_vuelo:
+                return
+            elemento, futuro = en_vuelo.popleft()
+            try:
+                resultado, error = futuro.result(timeout=max(inicio + tiempo_maximo - time.monotonic(), 0)), None
+            except TimeoutError as e:
+                # Si el future terminó, el TimeoutError lo levantó la tarea misma
+                if not futuro.done():
+                    # Se termina el proceso colgado; lo que ya terminó se conserva y el resto se reenvía
+                    listos = [otro_futuro.done() for _, otro_futuro in en_vuelo]
+                    terminar_pool(pool)
+                    pool = nuevo_pool()
+                    en_vuelo = deque(
+                        (otro, otro_futuro if listo else _enviar(pool, funcion, otro))
+                        for (otro, otro_futuro), listo in zip(en_vuelo, listos)
+                    )
+                    e = vencida()
+                resultado, error = None, e
+            except BrokenProcessPool:
+                terminar_pool(pool)
+                pool = nuevo_pool()
+                sospechosos = [elemento, *(otro for otro, _ in en_vuelo)]
+                en_vuelo.clear()
+                for sospechoso in sospechosos:
+                    try:
+                        resultado, error = _enviar(pool, funcion, sospechoso).result(timeout=tiempo_maximo), None
+                    except (BrokenProcessPool, TimeoutError) as e:
+                        terminar_pool(pool)
+                        pool = nuevo_pool()
+                        resultado, error = None, e if isinstance(e, BrokenProcessPool) else vencida()
+                    except Exception as e:
+                        resultado, error = None, e
+                    yield sospechoso, resultado, error
+                inicio = time.monotonic()
+                continue
+            except Exception as e:
+                resultado, error = None, e
+            yield elemento, resultado, error
+            # El plazo de la siguiente tarea no incluye lo que tarde quien consume el generador
+            inicio = time.monotonic()
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+
+def etapa_extraer(rutas, procesos=None, ventana=VENTANA):
+    procesos = procesos or os.cpu_count() or 1
+    for ruta, resultado, fallo in _mapa_acotado(_extraer, rutas, procesos, max(ventana, procesos)):
+        datos, error = resultado if fallo is None else (None, f"{type(fallo).__name__}: {fallo}")
+        yield ruta, (datos if error is None else _Descarte("extraer", error))
+
+
+def etapa_validar(elementos, periodos_existentes):
+    vistos = set(periodos_existentes)
+    for ruta, datos in elementos:
+        if isinstance(datos, _Descarte):
+            yield ruta, datos
+            continue
+        entradas = entradas_desde_recibo(datos)
+        if not entradas["periodo"]:
+            yield ruta, _Descarte("validar", "el recibo no trae periodo facturado")
+        elif entradas["periodo"] in vistos:
+            yield ruta, _Descarte("validar", f"el periodo {entradas['periodo']} ya está en el historial")
+        elif entradas["precios"][0] <= 0:
+            yield ruta, _Descarte("validar", "falta el precio del nivel básico")
+        elif entradas["kwh_devueltos"] < 0:
+            yield ruta, _Descarte("validar", "el excedente supera al consumo del periodo")
+        else:
+            vistos.add(entradas["periodo"])
+            yield ruta, entradas
+
+
+def etapa_tarifar(elementos, num_periodo, periodo_col, kwh_solar=None):
+    """Arma los registros con ``num_periodo`` provisional; el número definitivo
+    se asigna al agregarlos, para que los descartes no dejen huecos"""
+    kwh_solar = kwh_solar or {}
+    for ruta, entradas in elementos:
+        if isinstance(entradas, _Descarte):
+            yield ruta, entradas
+            continue
+        try:
+            registro = construir_registro(
+                entradas["periodo"], num_periodo, kwh_solar.get(entradas["periodo"], 0.0),
+                entradas["kwh_cfe"], entradas["kwh_devueltos"], entradas["precios"], periodo_col,
+            )
+        except Exception as e:
+            yield ruta, _Descarte("tarifar", f"{type(e).__name__}: {e}")
+            continue
+        yield ruta, registro
+
+
+def ingerir(rutas, almacen, periodo_col="Periodos", procesos=None, ventana=VENTANA, kwh_solar=None):
+    """Corre el pipeline completo y agrega cada registro válido al historial.
+
+    ``kwh_solar`` opcional mapea periodo -> kWh generados por los paneles (el
+    recibo no los trae). Devuelve ``{"agregados": n, "descartes": [...]}``.
+    """
+    df = almacen.cargar()
+    periodos = df[periodo_col].astype(str) if periodo_col in df.columns else []
+
+    flujo = etapa_extraer(rutas, procesos, ventana)
+    flujo = etapa_validar(flujo, periodos)
+    flujo = etapa_tarifar(flujo, siguiente_num_periodo(df), periodo_col, kwh_solar)
+
+    agregados = 0
+    descartes = []
+    lote = []
+
+    def vaciar_lote():
+        nonlocal agregados
+        errores = {}
+        for fila, mensaje in validar_registros([registro for _, registro in lote], periodo_col):
+            if fila is None:
+                errores = {i: mensaje for i in range(len(lote))}
+                break
+            errores[fila] = f"{errores[fila]}; {mensaje}" if fila in errores else mensaje
+        validos = []
+        for i, (ruta, registro) in enumerate(lote):
+            if i in errores:
+                descartes.append({"archivo": ruta, "etapa": "esquema", "error": errores[i]})
+            else:
+                validos.append((ruta, registro))
+        lote.clear()
+        try:
+            # Numerados bajo el candado del almacén: otra alta (app, API) entre lotes no duplica números
+            almacen.agregar_numerados([registro for _, registro in validos])
+            agregados += len(validos)
+        except Exception as e:
+            descartes.extend(
+                {"archivo": ruta, "etapa": "agregar", "error": f"{type(e).__name__}: {e}"} for ruta, _ in validos
+            )
+
+    try:
+        for ruta, registro in flujo:
+            if isinstance(registro, _Descarte):
+                descartes.append({"archivo": ruta, "etapa": registro.etapa, "error": str(registro)})
+                continue
+            lote.append((ruta, registro))
+            if len(lote) >= LOTE:
+                vaciar_lote()
+    finally:
+        # Aunque el flujo se corte, los registros ya validados no se pierden
+        if lote:
+            vaciar_lote()
+    return {"agregados": agregados, "descartes": descartes}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Agrega al historial todos los recibos CFE de un directorio")
+    parser.add_argument("directorio", help="Carpeta con los recibos en PDF")
+    parser.add_argument("--historial", required=True, help="Archivo Parquet del historial")
+    parser.add_argument("-j", "--procesos", type=int, default=None, help="Número de procesos (por defecto, todos los núcleos)")
+    parser.add_argument("--ventana", type=int, default=VENTANA, help="Recibos en vuelo como máximo")
+    args = parser.parse_args(argv)
+
+    almacen = abrir_almacen(args.historial)
+    resultado = ingerir(descubrir_pdfs(args.directorio), almacen, procesos=args.procesos, ventana=args.ventana)
+    almacen.compactar()
+
+    for descarte in resultado["descartes"]:
+        print(f"{descarte['archivo']} [{descarte['etapa']}]: {descarte['error']}", file=sys.stderr)
+    print(f"{resultado['agregados']} registros agregados, {len(resultado['descartes'])} descartados", file=sys.stderr)
+    return 1 if resultado["descartes"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,36 @@
+"""Importación diferida de módulos pesados.
+
+``modulo_perezoso("plotly.express")`` devuelve un objeto que importa el
+módulo la primera vez que se usa uno de sus atributos. Así pdfplumber,
+Plotly o NumPy no se cargan en el arranque si la página nunca lee un recibo
+ni dibuja una gráfica.
+"""
+import importlib
+import threading
+
+
+class ModuloPerezoso:
+    """Sustituto de un módulo que se importa en el primer acceso"""
+
+    def __init__(self, nombre):
+        self._nombre = nombre
+        self._modulo = None
+        self._lock = threading.Lock()
+
+    def _cargar(self):
+        if self._modulo is None:
+            with self._lock:
+                if self._modulo is None:
+                    self._modulo = importlib.import_module(self._nombre)
+        return self._modulo
+
+    def __getattr__(self, atributo):
+        return getattr(self._cargar(), atributo)
+
+    def __repr__(self):
+        estado = "cargado" if self._modulo is not None else "sin cargar"
+        return f"<módulo perezoso {self._nombre!r} ({estado})>"
+
+
+def modulo_perezoso(nombre):
+    return ModuloPerezoso(nombre)
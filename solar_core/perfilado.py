@@ -0,0 +1,104 @@
+"""Perfilado bajo demanda de un rerun del tablero.
+
+Cuando un usuario reporta lentitud se abre su misma vista con
+``?perfil=<token>``; el token se configura en ``SOLAR_PERFIL_TOKEN`` (variable
+de entorno o clave de primer nivel en ``secrets.toml``, que Streamlit también
+publica como variable de entorno). Sin token configurado el modo no se puede
+activar, y apagado no cuesta más que comparar el parámetro.
+
+El perfil de cada rerun se guarda en ``SOLAR_PERFILES`` (por defecto
+``perfiles/``) con la sesión y el tamaño del historial en el nombre:
+
+- ``cprofile`` (por defecto): archivo ``.prof`` de pstats, que abren
+  snakeviz, flameprof o tuna como flamegraph.
+- ``pyinstrument`` (``SOLAR_PERFILADOR=pyinstrument``, si está instalado):
+  perfil por muestreo en formato JSON de speedscope.
+"""
+import hmac
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PERFIL = os.environ.get("SOLAR_PERFIL_TOKEN")
+DIRECTORIO_PERFILES = os.environ.get("SOLAR_PERFILES", "perfiles")
+PERFILADOR = os.environ.get("SOLAR_PERFILADOR", "cprofile")
+
+
+def perfil_solicitado(valor, token=TOKEN_PERFIL):
+    """True si ``valor`` (el parámetro de la URL) coincide con el token configurado"""
+    if not token or not valor:
+        return False
+    return hmac.compare_digest(str(valor).encode(), token.encode())
+
+
+class Perfil:
+    """Perfilador de un rerun: ``iniciar`` al comienzo del script y ``terminar`` al final"""
+
+    def __init__(self, script, sesion, perfilador=PERFILADOR, directorio=DIRECTORIO_PERFILES):
+        self.script = script
+        self.sesion = sesion
+        self.perfilador = perfilador
+        self.directorio = directorio
+        self._perfil = None
+        self._inicio = None
+
+    def iniciar(self):
+        """Arranca el perfilador; devuelve None si no se pudo (p. ej. otro ya está activo)"""
+        if self.perfilador == "pyinstrument":
+            try:
+                from pyinstrument import Profiler
+            except ImportError:
+                logger.warning("pyinstrument no está instalado; se usa cProfile")
+                self.perfilador = "cprofile"
+            else:
+                self._perfil = Profiler()
+        if self.perfilador != "pyinstrument":
+            import cProfile
+
+            self._perfil = cProfile.Profile()
+        try:
+            if self.perfilador == "pyinstrument":
+                self._perfil.start()
+            else:
+                self._perfil.enable()
+        except (RuntimeError, ValueError) as e:
+            logger.warning("No se pudo iniciar el perfil: %s", e)
+            return None
+        self._inicio = time.time()
+        return self
+
+    def _detener(self):
+        perfil, self._perfil = self._perfil, None
+        if perfil is None:
+            return None
+        if self.perfilador == "pyinstrument":
+            perfil.stop()
+        else:
+            perfil.disable()
+        return perfil
+
+    def descartar(self):
+        """Detiene un perfil que no llegó a ``terminar`` (rerun interrumpido)"""
+        self._detener()
+
+    def terminar(self, filas):
+        """Detiene el perfil y lo escribe; devuelve la ruta del archivo"""
+        perfil = self._detener()
+        if perfil is None:
+            return None
+        os.makedirs(self.directorio, exist_ok=True)
+        fecha = time.strftime("%Y%m%d-%H%M%S", time.localtime(self._inicio)) + f".{int(self._inicio * 1000) % 1000:03d}"
+        base = os.path.join(self.directorio, f"{self.script}_{fecha}_sesion-{self.sesion}_{filas}-filas")
+        if self.perfilador == "pyinstrument":
+            from pyinstrument.renderers import SpeedscopeRenderer
+
+            ruta = f"{base}.speedscope.json"
+            with open(ruta, "w", encoding="utf-8") as f:
+                f.write(perfil.output(SpeedscopeRenderer()))
+        else:
+            ruta = f"{base}.prof"
+            perfil.dump_stats(ruta)
+        logger.info("Perfil guardado en %s", ruta)
+        return ruta
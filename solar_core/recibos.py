@@ -0,0 +1,234 @@
+"""Extracción de datos de recibos CFE en PDF.
+
+``extraer_datos_recibo`` procesa un recibo; ``procesar_lote`` reparte muchos
+recibos entre varios procesos y junta resultados y errores en un DataFrame.
+Ambos caminos consultan antes la caché por contenido (``cache_recibos``).
+También se puede usar desde la línea de comandos::
+
+    python -m solar_core.recibos carpeta_de_recibos -o recibos.csv
+"""
+import argparse
+import io
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from solar_core.cache_recibos import CacheRecibos, huella_archivo, huella_bytes
+from solar_core.formatos_recibo import CAMPOS_RECIBO, VERSION_FORMATOS, parsear_texto
+from solar_core.perezoso import modulo_perezoso
+
+# pdfplumber (y pdfminer) solo se cargan cuando de verdad se lee un PDF
+pdfplumber = modulo_perezoso("pdfplumber")
+
+logger = logging.getLogger(__name__)
+
+# Cambia con los formatos de recibo o con la forma de combinar páginas, para
+# no servir datos viejos de la caché
+VERSION_PAGINAS = 2
+VERSION_EXTRACTOR = f"{VERSION_FORMATOS}+paginas.{VERSION_PAGINAS}"
+COLUMNAS_MEDICION = ("formato", "paginas", "ms_texto", "ms_parseo")
+# Columnas de la tabla de resultados de un lote de recibos
+COLUMNAS_LOTE = ("archivo", *CAMPOS_RECIBO, *COLUMNAS_MEDICION, "error")
+# Con estos campos y la tabla de escalones el formulario ya se puede pre-llenar;
+# al tenerlos se deja de leer páginas
+CAMPOS_REQUERIDOS = ("periodo_facturado", "total_pagar", "consumo_total_periodo")
+# Campos de la tabla de escalones: salen completos de la página que trae la tabla
+CAMPOS_ESCALONES = tuple(c for c in CAMPOS_RECIBO if c.startswith(("basico_", "intermedio_", "excedente_")))
+cache_recibos = CacheRecibos(version=VERSION_EXTRACTOR)
+
+
+def _vacio(valor):
+    return valor in ("", 0.0, None)
+
+
+def _completo(datos, con_tabla):
+    return con_tabla and all(not _vacio(datos.get(campo)) for campo in CAMPOS_REQUERIDOS)
+
+
+def _trae_tabla(datos):
+    """True si la página traía la tabla de escalones (siempre empieza con Básico)"""
+    return not _vacio(datos.get("basico_precio"))
+
+
+def _texto_pagina(page, recorte):
+    if recorte:
+        x0, top, x1, bottom = recorte
+        page = page.crop((x0 * page.width, top * page.height, x1 * page.width, bottom * page.height))
+    return page.extract_text() or ""
+
+
+def analizar_recibo(pdf_file, max_paginas=None, recorte=None):
+    """Extrae los campos y mide el recibo.
+
+    Las páginas se leen y analizan una a una y se combinan los campos; en
+    cuanto se leyó la página con la tabla de escalones y están todos los
+    ``CAMPOS_REQUERIDOS`` se deja de leer, así los anexos del recibo no pasan
+    por pdfplumber. Los escalones se toman completos de la página de la
+    tabla: un escalón que no aparece ahí vale 0 y no se completa con líneas
+    de otras páginas. ``max_paginas`` limita las
+    páginas leídas (1 = solo la primera) y ``recorte`` es una caja
+    ``(x0, top, x1, bottom)`` en fracciones de la página donde viene la tabla
+    de consumo.
+
+    Devuelve ``(datos, medicion)``; ``medicion`` trae el formato reconocido,
+    las páginas leídas y los milisegundos de lectura del PDF y de parseo.
+    """
+    datos = None
+    formato = None
+    ms_texto = 0.0
+    ms_parseo = 0.0
+    paginas = 0
+    con_tabla = False
+    with pdfplumber.open(pdf_file) as pdf:
+        for page in pdf.pages[:max_paginas]:
+            inicio = time.perf_counter()
+            texto = _texto_pagina(page, recorte)
+            page.close()
+            ms_texto += (time.perf_counter() - inicio) * 1000
+            paginas += 1
+
+            datos_pagina, formato_pagina, segundos = parsear_texto(texto)
+            ms_parseo += segundos * 1000
+            tabla_pagina = not con_tabla and _trae_tabla(datos_pagina)
+            if datos is None:
+                datos, formato = datos_pagina, formato_pagina
+            else:
+                for campo, valor in datos_pagina.items():
+                    if campo in CAMPOS_ESCALONES:
+                        if tabla_pagina:
+                            datos[campo] = valor
+                    elif _vacio(datos[campo]) and not _vacio(valor):
+                        datos[campo] = valor
+                if tabla_pagina:
+                    formato = formato_pagina
+            con_tabla = con_tabla or tabla_pagina
+            if _completo(datos, con_tabla):
+                break
+
+    if datos is None:
+        datos, formato, _ = parsear_texto("")
+    logger.debug("Recibo %s.%s: %d páginas, texto %.1f ms, parseo %.2f ms",
+                 formato.nombre, formato.version, paginas, ms_texto, ms_parseo)
+    medicion = {
+        "formato": f"{formato.nombre}.{formato.version}",
+        "paginas": paginas,
+        "ms_texto": round(ms_texto, 2),
+        "ms_parseo": round(ms_parseo, 3),
+    }
+    return datos, medicion
+
+
+def extraer_datos_recibo(pdf_file, max_paginas=None, recorte=None):
+    """Extrae los campos del recibo; ``pdf_file`` es una ruta o un archivo binario"""
+    return analizar_recibo(pdf_file, max_paginas, recorte)[0]
+
+
+# ============================
+# Procesamiento por lotes
+# ============================
+def _procesar_archivo(nombre, origen, max_paginas=None, recorte=None):
+    """Tarea de un proceso del pool: nunca lanza, el error queda en la fila"""
+    try:
+        pdf_file = io.BytesIO(origen) if isinstance(origen, (bytes, bytearray)) else origen
+        datos, medicion = analizar_recibo(pdf_file, max_paginas, recorte)
+        return {"archivo": nombre, **datos, **medicion, "error": ""}
+    except Exception as e:
+        return {"archivo": nombre, "error": f"{type(e).__name__}: {e}"}
+
+
+def procesar_lote(archivos, max_workers=None, cache=None, max_paginas=None, recorte=None):
+    """Procesa varios recibos en paralelo.
+
+    ``archivos`` es una lista de pares (nombre, ruta o bytes). Los recibos ya
+    presentes en la caché no se envían al pool. Devuelve un DataFrame con una
+    fila por recibo, en el mismo orden, y la columna ``error`` vacía cuando el
+    recibo se leyó bien.
+    """
+    cache = cache or cache_recibos
+    # Los resultados con páginas o recorte restringidos no se mezclan con los completos
+    sufijo = f"-{huella_bytes(repr((max_paginas, recorte)).encode())[:12]}" if max_paginas or recorte else ""
+    filas = []
+    pendientes = []
+    for nombre, origen in archivos:
+        try:
+            huella = huella_bytes(origen) if isinstance(origen, (bytes, bytearray)) else huella_archivo(origen)
+            huella += sufijo
+        except OSError as e:
+            filas.append({"archivo": nombre, "error": f"{type(e).__name__}: {e}"})
+            continue
+        datos = cache.obtener(huella)
+        if datos is not None:
+            filas.append({"archivo": nombre, **datos, "formato": "cache", "error": ""})
+        else:
+            filas.append(None)
+            pendientes.append((len(filas) - 1, huella, nombre, origen))
+
+    if not filas:
+        return pd.DataFrame(columns=list(COLUMNAS_LOTE))
+
+    max_workers = min(max_workers or os.cpu_count() or 1, max(len(pendientes), 1))
+    if max_workers == 1:
+        procesados = [_procesar_archivo(nombre, origen, max_paginas, recorte) for _, _, nombre, origen in pendientes]
+    else:
+        # "spawn" evita heredar los hilos del servidor de Streamlit al hacer fork
+        contexto = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=contexto) as pool:
+            procesados = list(pool.map(
+                _procesar_archivo,
+                [p[2] for p in pendientes],
+                [p[3] for p in pendientes],
+                [max_paginas] * len(pendientes),
+                [recorte] * len(pendientes),
+            ))
+
+    for (posicion, huella, _, _), fila in zip(pendientes, procesados):
+        filas[posicion] = fila
+        if not fila["error"]:
+            cache.guardar(huella, {campo: fila[campo] for campo in CAMPOS_RECIBO})
+
+    return pd.DataFrame(filas, columns=list(COLUMNAS_LOTE))
+
+
+def listar_pdfs(directorio):
+    """Rutas de los PDF de un directorio (recursivo), ordenadas"""
+    rutas = []
+    for raiz, _, nombres in os.walk(directorio):
+        rutas.extend(os.path.join(raiz, n) for n in nombres if n.lower().endswith(".pdf"))
+    return sorted(rutas)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extrae los datos de un directorio de recibos CFE en PDF")
+    parser.add_argument("directorio", help="Carpeta con los recibos en PDF")
+    parser.add_argument("-o", "--salida", help="CSV de salida (por defecto se imprime en pantalla)")
+    parser.add_argument("-j", "--procesos", type=int, default=None, help="Número de procesos (por defecto, todos los núcleos)")
+    parser.add_argument("--primera-pagina", action="store_true", help="Leer solo la primera página de cada recibo")
+    parser.add_argument("--recorte", help="Caja x0,top,x1,bottom (fracciones de la página) donde está la tabla de consumo")
+    args = parser.parse_args(argv)
+    recorte = tuple(float(v) for v in args.recorte.split(",")) if args.recorte else None
+
+    rutas = listar_pdfs(args.directorio)
+    resultados = procesar_lote(
+        ((os.path.relpath(r, args.directorio), r) for r in rutas),
+        args.procesos,
+        max_paginas=1 if args.primera_pagina else None,
+        recorte=recorte,
+    )
+
+    if args.salida:
+        resultados.to_csv(args.salida, index=False)
+    else:
+        resultados.to_csv(sys.stdout, index=False)
+
+    errores = int((resultados["error"] != "").sum())
+    print(f"{len(resultados)} recibos procesados, {errores} con error", file=sys.stderr)
+    return 1 if errores else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+"""Construcción de registros del historial.
+
+Lo usan el formulario "Nuevo Registro" y la ingesta masiva de recibos, para
+que ambos caminos produzcan exactamente las mismas columnas.
+"""
+from solar_core.tarifas import (
+    COLUMNA_KWH_DEVUELTOS, COLUMNA_KWH_SOLAR, COLUMNAS_KWH_CFE, COLUMNAS_PRECIO,
+    columnas_registro, precios_por_nivel, repartir_kwh,
+)
+
+
+def _float(datos, campo, default=0.0):
+    try:
+        valor = datos.get(campo)
+        return float(valor) if valor is not None else default
+    except (TypeError, ValueError):
+        return default
+
+
+def entradas_desde_recibo(datos):
+    """Traduce los campos de un recibo a las entradas del formulario.
+
+    El consumo se reparte en Básico e Intermedio 1, el excedente se toma del
+    recibo y lo que resta son los kWh devueltos a la red.
+    """
+    consumo_total = _float(datos, "consumo_total_periodo")
+    kwh_niveles = repartir_kwh(consumo_total)
+    basico, intermedio1 = float(kwh_niveles[0]), float(kwh_niveles[1])
+    excedente = _float(datos, "excedente_kwh")
+    return {
+        "periodo": (datos.get("periodo_facturado") or "").replace(" - ", " al "),
+        "kwh_cfe": [basico, intermedio1, 0.0, excedente],
+        "kwh_devueltos": consumo_total - basico - intermedio1 - excedente,
+        "precios": (
+            _float(datos, "basico_precio"),
+            _float(datos, "intermedio_precio"),
+            _float(datos, "excedente_precio"),
+        ),
+    }
+
+
+def siguiente_num_periodo(df):
+    """Número consecutivo para el siguiente periodo del historial"""
+    if "No. Periodo" in df.columns and df["No. Periodo"].notna().any():
+        return int(df["No. Periodo"].max()) + 1
+    return 1
+
+
+def construir_registro(periodo, num_periodo, kwh_solar, kwh_cfe, kwh_devueltos, precios, periodo_col="Periodos"):
+    """Arma el registro del historial de un periodo.
+
+    ``kwh_cfe`` son los kWh por nivel (Básico, Intermedio 1, Intermedio 2,
+    Excedente) y ``precios`` los precios básico, intermedio y excedente.
+    """
+    kwh_cfe = [float(v) for v in kwh_cfe]
+    precios = tuple(float(p) for p in precios)
+    columnas = columnas_registro(kwh_solar, kwh_cfe, kwh_devueltos, precios_por_nivel(*precios))
+    return {
+        periodo_col: periodo,
+        "No. Periodo": num_periodo,
+        COLUMNA_KWH_DEVUELTOS: float(kwh_devueltos),
+        # Entradas guardadas para poder recalcular el periodo si cambian los precios
+        COLUMNA_KWH_SOLAR: float(kwh_solar),
+        **dict(zip(COLUMNAS_KWH_CFE, kwh_cfe)),
+        **dict(zip(COLUMNAS_PRECIO, precios)),
+        **{col: float(valor) for col, valor in columnas.items()}
+    }
@@ -0,0 +1,342 @@
+"""Benchmark de arranque y reruns del tablero.
+
+Genera historiales sintéticos del tamaño pedido, ejecuta ``solar_app.py`` sin
+navegador con ``streamlit.testing.v1.AppTest`` y mide para cada tamaño:
+
+- tiempo del primer render (lectura del historial, índices y gráficas),
+- latencia del rerun tras cada interacción (filtros, meta, alta y baja de un
+  registro),
+- memoria residente pico del proceso,
+- tiempo de escritura del libro de Excel (lo que tarda "Preparar Excel").
+
+Cada tamaño corre en un proceso nuevo para que las cachés y la memoria pico de
+un caso no contaminen al siguiente::
+
+    python -m solar_core.rendimiento
+    python -m solar_core.rendimiento --filas 10 1000 -o rendimiento.jsonl
+
+Cada tamaño se mide ``--repeticiones`` veces (un proceso por repetición) y se
+guarda la mediana de cada tiempo. Dentro de cada proceso una ronda de
+interacciones y una exportación a Excel sin cronometrar calientan imports y
+cachés antes de medir los reruns.
+
+Con ``-o`` cada caso se agrega como una línea JSON y se compara contra la
+corrida anterior del mismo tamaño en ese archivo; los tiempos que crecen más
+de ``--tolerancia`` y además más de ``PISO_RUIDO_MS`` se marcan como
+regresión (código de salida 1). En CI el
+archivo es el artefacto ``rendimiento`` de la corrida anterior, en un job que
+no bloquea el despliegue.
+
+AppTest vuelve a ejecutar el script completo también cuando la interacción
+ocurre dentro de un fragmento, así que las latencias son de rerun completo.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from solar_core.almacen import exportar_excel
+from solar_core.tarifas import (
+    COLUMNA_KWH_DEVUELTOS, COLUMNA_KWH_SOLAR, COLUMNAS_KWH_CFE, COLUMNAS_PRECIO,
+    columnas_registro, precios_por_nivel,
+)
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT_APP = os.path.join(RAIZ, "solar_app.py")
+
+TAMANOS = (10, 1_000, 100_000, 1_000_000)
+# El historial sintético repite periodos (100 años de bimestres) y reparte
+# las filas entre varios orígenes, como varias fuentes por periodo
+MAX_PERIODOS = 600
+ORIGENES = ("Recibo", "Manual", "Importado", "API")
+BIMESTRES = ("Ene-Feb", "Feb-Mar", "Mar-Abr", "Abr-May", "May-Jun", "Jun-Jul",
+             "Jul-Ago", "Ago-Sep", "Sep-Oct", "Oct-Nov", "Nov-Dic", "Dic-Ene")
+HOJA = "Total"
+TIEMPO_MAXIMO = 1800
+TOLERANCIA = 0.2
+REPETICIONES = 3
+# Diferencias menores a este piso (ms) se consideran ruido de la máquina
+PISO_RUIDO_MS = 50.0
+
+
+# ============================
+# Historial sintético
+# ============================
+def etiquetas_periodo(cuantos, desde=2000):
+    return [f"{BIMESTRES[i % 12]} {desde + i // 12}" for i in range(cuantos)]
+
+
+def historial_sintetico(filas, semilla=0):
+    """Historial con el esquema de la app y montos calculados con la tarifa real"""
+    rng = np.random.default_rng(semilla)
+    kwh_solar = rng.uniform(200, 1500, filas).round(2)
+    kwh_cfe = rng.uniform(0, 400, (filas, len(COLUMNAS_KWH_CFE))).round(2)
+    kwh_devueltos = rng.uniform(0, 1200, filas).round(2)
+    precios = rng.uniform((0.9, 1.1, 3.0), (1.2, 1.4, 3.6), (filas, len(COLUMNAS_PRECIO))).round(3)
+    columnas = columnas_registro(kwh_solar, kwh_cfe, kwh_devueltos, precios_por_nivel(*precios.T))
+
+    posiciones = np.arange(filas)
+    periodos = np.array(etiquetas_periodo(min(filas, MAX_PERIODOS)), dtype=object)
+    df = pd.DataFrame({
+        "Periodos": periodos[posiciones * len(periodos) // max(filas, 1)],
+        "No. Periodo": posiciones + 1,
+        "Origen": np.array(ORIGENES, dtype=object)[posiciones % len(ORIGENES)],
+        COLUMNA_KWH_DEVUELTOS: kwh_devueltos,
+        COLUMNA_KWH_SOLAR: kwh_solar,
+        **dict(zip(COLUMNAS_KWH_CFE, kwh_cfe.T)),
+        **dict(zip(COLUMNAS_PRECIO, precios.T)),
+        **columnas,
+    })
+    return df
+
+
+def preparar_caso(directorio, filas):
+    """Escribe el historial sintético y un archivo de sitios que apunta a él"""
+    historial_sintetico(filas).to_parquet(os.path.join(directorio, "historial.parquet"), index=False)
+    ruta_sitios = os.path.join(directorio, "sitios.json")
+    with open(ruta_sitios, "w", encoding="utf-8") as f:
+        json.dump([{"id": "sintetico", "nombre": f"Sintético ({filas:,} filas)",
+                    "ruta": "historial.parquet", "hoja": HOJA}], f)
+    return ruta_sitios
+
+
+# ============================
+# Medición (en el proceso del caso)
+# ============================
+def rss_pico_mb():
+    if resource is None:
+        return None
+    # ru_maxrss está en KiB en Linux y en bytes en macOS
+    escala = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / escala, 1)
+
+
+def _cronometrar(funcion):
+    inicio = time.perf_counter()
+    resultado = funcion()
+    return resultado, round((time.perf_counter() - inicio) * 1000, 1)
+
+
+def _boton(at, etiqueta):
+    return next(b for b in at.button if b.label == etiqueta)
+
+
+def _filtrar(clave, valores):
+    def aplicar(at):
+        widget = at.multiselect(key=clave)
+        widget.set_value(valores(widget.options) if callable(valores) else valores)
+    return aplicar
+
+
+def _meta(at):
+    at.number_input(key="meta_input").set_value(150000.0)
+    _boton(at, "Actualizar Meta").click()
+
+
+def _agregar_registro(at):
+    at.text_input(key="periodo_input").set_value("Benchmark 2099")
+    at.number_input(key="Total_solar_input").set_value(500.0)
+    at.number_input(key="Mwh_devueltos_input").set_value(400.0)
+    at.number_input(key="basico_precio_input").set_value(1.0)
+    at.number_input(key="precio_intermedio_input").set_value(1.2)
+    at.number_input(key="precio_excedente_input").set_value(3.0)
+    _boton(at, "Agregar Datos").click()
+
+
+def _borrar_registro(at):
+    at.button(key="borrar_registro").click()
+
+
+TODO = ["Seleccionar todo"]
+
+# Interacciones en el orden en que se aplican; cada una se mide con su rerun
+INTERACCIONES = (
+    ("sin_cambios", lambda at: None),
+    ("filtro_periodo", _filtrar("filtro_periodo", lambda opciones: [opciones[1]])),
+    ("filtro_origen", _filtrar("filtro_origen", lambda opciones: [opciones[1]])),
+    ("filtro_nivel", _filtrar("filtro_nivel", ["Básico"])),
+    ("quitar_filtros", lambda at: [_filtrar(clave, TODO)(at) for clave in ("filtro_periodo", "filtro_origen", "filtro_nivel")]),
+    ("meta", _meta),
+    ("agregar_registro", _agregar_registro),
+    ("borrar_registro", _borrar_registro),
+)
+
+
+def medir_caso(filas, tiempo_maximo=TIEMPO_MAXIMO):
+    """Corre la app contra el historial del directorio actual y devuelve las métricas"""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(SCRIPT_APP, default_timeout=tiempo_maximo)
+    at, primer_render = _cronometrar(at.run)
+    resultado = {
+        "primer_render_ms": primer_render,
+        "errores": [e.message for e in at.exception],
+        "reruns_ms": {},
+    }
+    # La primera ronda solo calienta: las interacciones dejan el tablero como estaba
+    for ronda in ("calentamiento", "medicion"):
+        for nombre, interaccion in INTERACCIONES:
+            try:
+                interaccion(at)
+            except (KeyError, StopIteration, IndexError) as e:
+                resultado["errores"].append(f"{nombre}: widget no encontrado ({e})")
+                continue
+            at, duracion = _cronometrar(at.run)
+            if ronda == "medicion":
+                resultado["reruns_ms"][nombre] = duracion
+            resultado["errores"].extend(f"{nombre}: {e.message}" for e in at.exception)
+        if resultado["errores"]:
+            break
+
+    df = pd.read_parquet("historial.parquet")
+    exportar_excel(df, HOJA)
+    _, resultado["excel_ms"] = _cronometrar(lambda: exportar_excel(df, HOJA))
+    resultado["rss_pico_mb"] = rss_pico_mb()
+    return resultado
+
+
+# ============================
+# Orquestación
+# ============================
+def combinar(muestras):
+    """Mediana de cada tiempo de ``muestras`` y la memoria pico más alta"""
+    def mediana(valores):
+        valores = [v for v in valores if v is not None]
+        return round(float(np.median(valores)), 1) if valores else None
+
+    nombres = dict.fromkeys(nombre for m in muestras for nombre in m.get("reruns_ms", {}))
+    picos = [m["rss_pico_mb"] for m in muestras if m.get("rss_pico_mb") is not None]
+    return {
+        "repeticiones": len(muestras),
+        "primer_render_ms": mediana([m.get("primer_render_ms") for m in muestras]),
+        "reruns_ms": {n: mediana([m.get("reruns_ms", {}).get(n) for m in muestras]) for n in nombres},
+        "excel_ms": mediana([m.get("excel_ms") for m in muestras]),
+        "rss_pico_mb": max(picos) if picos else None,
+        "errores": list(dict.fromkeys(e for m in muestras for e in m.get("errores", []))),
+    }
+
+
+def correr_caso(filas, tiempo_maximo=TIEMPO_MAXIMO, repeticiones=REPETICIONES):
+    """Prepara el historial de ``filas`` filas y lo mide ``repeticiones`` veces, cada una en un proceso aparte"""
+    with tempfile.TemporaryDirectory(prefix="solar-rendimiento-") as directorio:
+        _, generacion = _cronometrar(lambda: preparar_caso(directorio, filas))
+        entorno = {
+            **os.environ,
+            "SOLAR_SITIOS": os.path.join(directorio, "sitios.json"),
+            "PYTHONPATH": os.pathsep.join(filter(None, [RAIZ, os.environ.get("PYTHONPATH")])),
+        }
+        muestras = []
+        for _ in range(repeticiones):
+            try:
+                proceso = subprocess.run(
+                    [sys.executable, "-m", "solar_core.rendimiento", "--caso", str(filas)],
+                    cwd=directorio, env=entorno, capture_output=True, text=True, timeout=tiempo_maximo,
+                )
+            except subprocess.TimeoutExpired:
+                return {"filas": filas, "generacion_ms": generacion, "errores": [f"Tiempo agotado ({tiempo_maximo} s)"]}
+            salida = proceso.stdout.strip().splitlines()
+            if proceso.returncode != 0 or not salida:
+                error = proceso.stderr.strip().splitlines()[-1] if proceso.stderr.strip() else f"código {proceso.returncode}"
+                return {"filas": filas, "generacion_ms": generacion, "errores": [error]}
+            muestras.append(json.loads(salida[-1]))
+        return {"filas": filas, "generacion_ms": generacion, **combinar(muestras)}
+
+
+def _version():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def _tiempos(resultado):
+    """Tiempos comparables de un resultado: {métrica: ms}"""
+    tiempos = {"primer_render_ms": resultado.get("primer_render_ms"), "excel_ms": resultado.get("excel_ms")}
+    tiempos.update({f"rerun {nombre}": ms for nombre, ms in resultado.get("reruns_ms", {}).items()})
+    return {clave: valor for clave, valor in tiempos.items() if valor is not None}
+
+
+def anteriores(ruta):
+    """Último resultado guardado por tamaño de historial"""
+    ultimos = {}
+    if ruta and os.path.exists(ruta):
+        with open(ruta, encoding="utf-8") as f:
+            for linea in f:
+                if linea.strip():
+                    datos = json.loads(linea)
+                    ultimos[datos["filas"]] = datos
+    return ultimos
+
+
+def regresiones(actual, anterior, tolerancia=TOLERANCIA, piso=PISO_RUIDO_MS):
+    """Métricas que crecieron más de ``tolerancia`` y más de ``piso`` ms respecto a la corrida anterior"""
+    previos = _tiempos(anterior)
+    return [
+        (clave, previos[clave], ms)
+        for clave, ms in _tiempos(actual).items()
+        if clave in previos and previos[clave] > 0
+        and ms > previos[clave] * (1 + tolerancia) and ms - previos[clave] > piso
+    ]
+
+
+def imprimir(resultado):
+    print(f"{resultado['filas']:>9,} filas  (historial generado en {resultado['generacion_ms']:.0f} ms)")
+    for clave, ms in _tiempos(resultado).items():
+        print(f"    {clave:<28} {ms:>10.1f} ms")
+    if resultado.get("rss_pico_mb") is not None:
+        print(f"    {'rss_pico':<28} {resultado['rss_pico_mb']:>10.1f} MB")
+    for error in resultado.get("errores", []):
+        print(f"    Error: {error}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de arranque y reruns del tablero")
+    parser.add_argument("--filas", type=int, nargs="+", default=list(TAMANOS), help="Tamaños del historial sintético")
+    parser.add_argument("-o", "--salida", help="Archivo JSON lines donde se guardan y comparan los resultados")
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA, help="Crecimiento relativo que cuenta como regresión")
+    parser.add_argument("--tiempo-maximo", type=int, default=TIEMPO_MAXIMO, help="Segundos por repetición")
+    parser.add_argument("--repeticiones", type=int, default=REPETICIONES, help="Procesos por tamaño; se guarda la mediana")
+    parser.add_argument("--piso-ruido", type=float, default=PISO_RUIDO_MS, help="ms por debajo de los que un aumento no cuenta")
+    parser.add_argument("--caso", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.caso is not None:
+        # Proceso hijo: el historial ya está en el directorio actual
+        print(json.dumps(medir_caso(args.caso, args.tiempo_maximo)))
+        return 0
+
+    previos = anteriores(args.salida)
+    fallo = False
+    for filas in args.filas:
+        resultado = {
+            "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "version": _version(),
+            "python": sys.version.split()[0],
+            **correr_caso(filas, args.tiempo_maximo, args.repeticiones),
+        }
+        imprimir(resultado)
+        fallo = fallo or bool(resultado.get("errores"))
+        if filas in previos:
+            for clave, antes, ahora in regresiones(resultado, previos[filas], args.tolerancia, args.piso_ruido):
+                print(f"    Regresión en {clave}: {antes:.1f} ms -> {ahora:.1f} ms")
+                fallo = True
+        if args.salida:
+            with open(args.salida, "a", encoding="utf-8") as f:
+                f.write(json.dumps(resultado, ensure_ascii=False) + "\n")
+    return 1 if fallo else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+"""Registro de instalaciones (sitios) con un historial por sitio.
+
+Los sitios se declaran en un archivo JSON (``SOLAR_SITIOS``, por defecto
+``sitios.json``) con una lista de objetos::
+
+    [
+        {"id": "casa", "nombre": "Casa", "ruta": "casa.parquet",
+         "origen_excel": "casa.xlsx", "hoja": "Total", "inversion_inicial": 100000}
+    ]
+
+Las rutas relativas se resuelven desde la carpeta del archivo. Si el archivo
+no existe se usa un único sitio por defecto.
+
+Cada historial se lee la primera vez que se pide y solo los ``max_cargados``
+usados más recientemente se conservan en memoria; a los demás se les suelta
+el DataFrame pero se les mantienen los agregados. El resumen entre sitios no
+pasa por el LRU: usa los totales que cada Parquet guarda en sus metadatos
+(ver ``Almacen.resumen_total``), así que no lee los historiales ni desaloja
+el del sitio activo.
+"""
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from solar_core.almacen import abrir_almacen
+
+ARCHIVO_SITIOS = os.environ.get("SOLAR_SITIOS", "sitios.json")
+MAX_CARGADOS = 4
+
+# Historial de la instalación única, cuando no hay archivo de sitios
+LIBRO_EXCEL = "Inversión sistema fotovoltaico.xlsx"
+HOJA_EXCEL = "Total"
+RUTA_HISTORIAL = "Inversión sistema fotovoltaico.parquet"
+INVERSION_POR_DEFECTO = 100000
+
+
+class Sitio:
+    """Una instalación y la ubicación de su historial"""
+
+    def __init__(self, id, ruta, nombre=None, origen_excel=None, hoja="Total", inversion_inicial=None):
+        self.id = str(id)
+        self.ruta = ruta
+        self.nombre = nombre or self.id
+        self.origen_excel = origen_excel
+        self.hoja = hoja
+        self.inversion_inicial = inversion_inicial
+
+    @classmethod
+    def desde_dict(cls, datos, base="."):
+        def resolver(ruta):
+            return ruta if ruta is None or os.path.isabs(ruta) else os.path.join(base, ruta)
+
+        return cls(
+            datos["id"],
+            resolver(datos["ruta"]),
+            nombre=datos.get("nombre"),
+            origen_excel=resolver(datos.get("origen_excel")),
+            hoja=datos.get("hoja", "Total"),
+            inversion_inicial=datos.get("inversion_inicial"),
+        )
+
+
+def sitio_principal():
+    return Sitio("principal", RUTA_HISTORIAL, nombre="Principal", origen_excel=LIBRO_EXCEL, hoja=HOJA_EXCEL)
+
+
+class RegistroSitios:
+    """Sitios disponibles y LRU de los historiales cargados en memoria"""
+
+    def __init__(self, sitios, max_cargados=MAX_CARGADOS):
+        if not sitios:
+            raise ValueError("El registro necesita al menos un sitio")
+        self.sitios = OrderedDict((sitio.id, sitio) for sitio in sitios)
+        self.max_cargados = max_cargados
+        self._cargados = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def desde_archivo(cls, ruta=ARCHIVO_SITIOS, por_defecto=None, max_cargados=MAX_CARGADOS):
+        """Lee el registro de ``ruta``; sin archivo se usa ``por_defecto`` o el sitio principal"""
+        if os.path.exists(ruta):
+            with open(ruta, encoding="utf-8") as f:
+                datos = json.load(f)
+            base = os.path.dirname(os.path.abspath(ruta))
+            sitios = [Sitio.desde_dict(d, base) for d in datos]
+        else:
+            sitios = [por_defecto or sitio_principal()]
+        return cls(sitios, max_cargados=max_cargados)
+
+    def ids(self):
+        return list(self.sitios)
+
+    def sitio(self, sitio_id):
+        return self.sitios[sitio_id]
+
+    def almacen(self, sitio_id):
+        sitio = self.sitios[sitio_id]
+        return abrir_almacen(sitio.ruta, origen_excel=sitio.origen_excel, hoja=sitio.hoja)
+
+    def _usar(self, sitio_id):
+        """Marca el sitio como reciente y libera los historiales que salen del LRU"""
+        with self._lock:
+            self._cargados[sitio_id] = True
+            self._cargados.move_to_end(sitio_id)
+            desalojados = []
+            while len(self._cargados) > self.max_cargados:
+                desalojados.append(self._cargados.popitem(last=False)[0])
+        for otro in desalojados:
+            self.almacen(otro).liberar()
+
+    def cargar(self, sitio_id):
+        """Historial y firma del sitio, leyéndolo si no está en memoria"""
+        almacen = self.almacen(sitio_id)
+        df, firma = almacen.cargar_con_firma()
+        self._usar(sitio_id)
+        return df, firma
+
+    def resumen(self, sitio_id, periodos=None, origenes=None):
+        """KPIs de ahorro del sitio; solo lee el historial si sus agregados no están vigentes"""
+        almacen = self.almacen(sitio_id)
+        if not almacen.agregados_vigentes():
+            self.cargar(sitio_id)
+        return almacen.resumen(periodos, origenes)
+
+    def resumen_sitios(self):
+        """Tabla con el ahorro de todas las instalaciones"""
+        filas = []
+        for sitio in self.sitios.values():
+            resumen = self.almacen(sitio.id).resumen_total()
+            cuenta = resumen["cuenta"]
+            filas.append({
+                "Sitio": sitio.nombre,
+                "Periodos": cuenta,
+                "Ahorro Acumulado": resumen["suma"],
+                "Ahorro Promedio por Mes": resumen["suma"] / cuenta if cuenta else 0.0,
+                "Mayor Ahorro": resumen["maximo"][0] if resumen["maximo"] else 0.0,
+                "Inversión": sitio.inversion_inicial,
+            })
+        return pd.DataFrame(filas)
+
+
+_registros = {}
+_registros_lock = threading.Lock()
+
+
+def abrir_registro(ruta=ARCHIVO_SITIOS, por_defecto=None, max_cargados=MAX_CARGADOS):
+    """Registro del proceso para ``ruta``, compartido entre reruns y sesiones"""
+    ruta = os.path.abspath(ruta)
+    with _registros_lock:
+        registro = _registros.get(ruta)
+        if registro is None:
+            registro = RegistroSitios.desde_archivo(ruta, por_defecto=por_defecto, max_cargados=max_cargados)
+            _registros[ruta] = registro
+        return registro
@@ -0,0 +1,134 @@
+"""Motor de tarifa escalonada de CFE (básico / intermedio / excedente).
+
+Todas las funciones aceptan escalares o arreglos de NumPy y trabajan sobre
+columnas completas: el mismo código calcula un registro nuevo del formulario
+o el historial entero en una sola pasada vectorizada.
+
+Los cargos se calculan en centavos enteros (ver ``solar_core.dinero``): cada
+escalón se redondea una vez al centavo y el subtotal, el IVA y el total salen
+de esos centavos, igual que en el recibo.
+"""
+import numpy as np
+import pandas as pd
+
+from solar_core.dinero import a_pesos, aplicar_tasa, importe
+
+IVA = 0.16
+NIVELES = ("Básico", "Intermedio 1", "Intermedio 2", "Excedente")
+# kWh que abarca cada escalón; el excedente no tiene tope
+ANCHOS_KWH = (150.0, 200.0, 0.0)
+
+# Entradas en kWh que se guardan con cada registro para poder recalcularlo
+COLUMNA_KWH_SOLAR = "kWh Solar"
+COLUMNAS_KWH_CFE = tuple(f"kWh {nivel} CFE" for nivel in NIVELES)
+COLUMNA_KWH_DEVUELTOS = "Mwh Devueltos"
+COLUMNAS_PRECIO = ("Precio Básico", "Precio Intermedio", "Precio Excedente")
+
+# Columnas monetarias de cada recibo: cargo por escalón, subtotal, IVA y total
+COLUMNAS_RECIBO = {
+    recibo: {
+        "niveles": tuple(f"{nivel} {recibo}" for nivel in NIVELES),
+        "subtotal": f"Subtotal {recibo}",
+        "iva": f"IVA {recibo}",
+        "total": total,
+    }
+    for recibo, total in (("Solar", "Total de recibo Solar"), ("CFE", "Subtotal CFE.1"))
+}
+COLUMNA_AHORRO = "Ahorro Total"
+
+
+def precios_por_nivel(basico, intermedio, excedente):
+    """Arma la matriz de precios (..., 4) a partir de los precios del recibo.
+
+    El formulario no captura un precio para Intermedio 2, así que se cobra al
+    precio intermedio.
+    """
+    basico, intermedio, excedente = np.broadcast_arrays(
+        *(np.asarray(p, dtype=float) for p in (basico, intermedio, excedente))
+    )
+    return np.stack([basico, intermedio, intermedio, excedente], axis=-1)
+
+
+def repartir_kwh(kwh, anchos=ANCHOS_KWH):
+    """Reparte el consumo total entre los escalones: (...,) -> (..., 4)"""
+    kwh = np.asarray(kwh, dtype=float)
+    cortes = np.concatenate(([0.0], np.cumsum(anchos)))
+    topes = np.append(np.asarray(anchos, dtype=float), np.inf)
+    return np.clip(kwh[..., np.newaxis] - cortes, 0.0, topes)
+
+
+def calcular_cargos_centavos(kwh_por_nivel, precios, iva=IVA):
+    """Cargos por escalón, subtotal, IVA y total en centavos enteros"""
+    niveles = importe(kwh_por_nivel, precios)
+    subtotal = niveles.sum(axis=-1)
+    impuesto = aplicar_tasa(subtotal, iva)
+    return {"niveles": niveles, "subtotal": subtotal, "iva": impuesto, "total": subtotal + impuesto}
+
+
+def calcular_cargos(kwh_por_nivel, precios, iva=IVA):
+    """Cargos por escalón, subtotal, IVA y total en pesos para kWh ya repartidos"""
+    return {clave: a_pesos(valor) for clave, valor in calcular_cargos_centavos(kwh_por_nivel, precios, iva).items()}
+
+
+def calcular_tarifa(kwh, precios, anchos=ANCHOS_KWH, iva=IVA):
+    """Aplica la tarifa escalonada a un consumo total"""
+    return calcular_cargos(repartir_kwh(kwh, anchos), precios, iva)
+
+
+def columnas_registro(kwh_solar, kwh_cfe_por_nivel, kwh_devueltos, precios):
+    """Columnas monetarias del historial para uno o muchos periodos.
+
+    ``kwh_solar`` se tarifica por escalones, ``kwh_cfe_por_nivel`` ya viene
+    repartido como en el recibo y el ahorro es el subtotal de los kWh devueltos
+    a la red.
+    """
+    solar = calcular_tarifa(kwh_solar, precios)
+    cfe = calcular_cargos(kwh_cfe_por_nivel, precios)
+    ahorro = calcular_tarifa(kwh_devueltos, precios)["subtotal"]
+
+    cargos = {"Solar": solar, "CFE": cfe}
+    columnas = {}
+    for recibo, nombres in COLUMNAS_RECIBO.items():
+        for i, col in enumerate(nombres["niveles"]):
+            columnas[col] = cargos[recibo]["niveles"][..., i]
+    for recibo, nombres in COLUMNAS_RECIBO.items():
+        for clave in ("subtotal", "iva", "total"):
+            columnas[nombres[clave]] = cargos[recibo][clave]
+    columnas[COLUMNA_AHORRO] = ahorro
+    return columnas
+
+
+def recalcular_historial(df, tabla_precios, periodo_col="Periodos"):
+    """Recalcula las columnas monetarias de todo el historial con nuevos precios.
+
+    ``tabla_precios`` tiene una fila por periodo con ``COLUMNAS_PRECIO``. Solo
+    se recalculan los periodos presentes en la tabla que tienen guardadas sus
+    entradas en kWh; el resto conserva sus valores. Devuelve el DataFrame
+    actualizado y la máscara de filas recalculadas.
+    """
+    faltantes = [col for col in (periodo_col,) + COLUMNAS_PRECIO if col not in tabla_precios.columns]
+    if faltantes:
+        raise ValueError(f"La tabla de precios no tiene las columnas: {', '.join(faltantes)}")
+
+    columnas_kwh = [COLUMNA_KWH_SOLAR, *COLUMNAS_KWH_CFE, COLUMNA_KWH_DEVUELTOS]
+    if df.empty or any(col not in df.columns for col in columnas_kwh):
+        return df, np.zeros(len(df), dtype=bool)
+
+    tabla = tabla_precios.drop_duplicates(periodo_col, keep="last")
+    posiciones = pd.Index(tabla[periodo_col]).get_indexer(df[periodo_col])
+    kwh = df[columnas_kwh].to_numpy(dtype=float)
+    mascara = (posiciones >= 0) & ~np.isnan(kwh).any(axis=1)
+    if not mascara.any():
+        return df, mascara
+
+    precios_tabla = tabla[list(COLUMNAS_PRECIO)].to_numpy(dtype=float)[posiciones[mascara]]
+    precios = precios_por_nivel(*precios_tabla.T)
+    kwh = kwh[mascara]
+    columnas = columnas_registro(kwh[:, 0], kwh[:, 1:5], kwh[:, 5], precios)
+
+    df = df.copy()
+    for col, valores in columnas.items():
+        df.loc[mascara, col] = valores
+    for col, valores in zip(COLUMNAS_PRECIO, precios_tabla.T):
+        df.loc[mascara, col] = valores
+    return df, mascara
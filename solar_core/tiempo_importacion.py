@@ -0,0 +1,110 @@
+"""Reporte del tiempo de importación de los scripts de la app.
+
+Lee las importaciones de nivel superior de cada script (sin ejecutarlo), las
+importa en un intérprete nuevo con ``python -X importtime`` y resume el total,
+los módulos más lentos y si se cargó alguno de los módulos pesados que deben
+importarse de forma diferida::
+
+    python -m solar_core.tiempo_importacion solar_app.py Pages/Documentacion.py
+    python -m solar_core.tiempo_importacion solar_app.py -o importaciones.jsonl --max-ms 1500
+
+Con ``-o`` cada corrida se agrega como una línea JSON para seguir la
+evolución; con ``--max-ms`` o si aparece un módulo pesado el código de salida
+es 1.
+"""
+import argparse
+import ast
+import json
+import os
+import subprocess
+import sys
+import time
+
+# No deben cargarse al arrancar la app; se importan al leer un recibo o dibujar.
+# (Streamlit ya importa plotly.graph_objects, que es ligero; el costo está en express)
+MODULOS_PESADOS = ("pdfplumber", "pdfminer", "plotly.express")
+TOP = 15
+
+
+def importaciones_script(ruta):
+    """Módulos importados en el nivel superior de un script"""
+    with open(ruta, encoding="utf-8") as f:
+        arbol = ast.parse(f.read(), filename=ruta)
+    modulos = []
+    for nodo in arbol.body:
+        if isinstance(nodo, ast.Import):
+            modulos.extend(alias.name for alias in nodo.names)
+        elif isinstance(nodo, ast.ImportFrom) and nodo.module and not nodo.level:
+            modulos.append(nodo.module)
+    return list(dict.fromkeys(modulos))
+
+
+def medir(modulos, directorio="."):
+    """Importa ``modulos`` con ``-X importtime``.
+
+    Devuelve una tupla (módulo, nivel, propio_us, acumulado_us) por módulo
+    cargado; ``nivel`` 0 son los que el script importa directamente.
+    """
+    codigo = "; ".join(f"import {m}" for m in modulos) or "pass"
+    resultado = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", codigo],
+        cwd=directorio, capture_output=True, text=True,
+        env={**os.environ, "PYTHONPATH": os.path.abspath(directorio)},
+    )
+    if resultado.returncode != 0:
+        raise RuntimeError(resultado.stderr.strip().splitlines()[-1] if resultado.stderr else "error al importar")
+    filas = []
+    for linea in resultado.stderr.splitlines():
+        if not linea.startswith("import time:") or "self [us]" in linea:
+            continue
+        propio, acumulado, nombre = linea[len("import time:"):].split("|", 2)
+        # La anidación se indica con dos espacios más por nivel
+        nivel = (len(nombre) - len(nombre.lstrip()) - 1) // 2
+        filas.append((nombre.strip(), nivel, int(propio), int(acumulado)))
+    return filas
+
+
+def reporte(ruta, directorio="."):
+    modulos = importaciones_script(ruta)
+    filas = medir(modulos, directorio)
+    nombres = {nombre for nombre, _, _, _ in filas}
+    total_us = sum(acumulado for _, nivel, _, acumulado in filas if nivel == 0)
+    lentos = sorted(filas, key=lambda f: f[3], reverse=True)[:TOP]
+    return {
+        "script": ruta,
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "total_ms": round(total_us / 1000, 1),
+        "modulos": len(filas),
+        "pesados": sorted(p for p in MODULOS_PESADOS if p in nombres),
+        "lentos": [{"modulo": n, "acumulado_ms": round(a / 1000, 1), "propio_ms": round(p / 1000, 1)} for n, _, p, a in lentos],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tiempo de importación de los scripts de la app")
+    parser.add_argument("scripts", nargs="+", help="Scripts de Streamlit a analizar")
+    parser.add_argument("-o", "--salida", help="Archivo JSON lines al que se agrega el reporte")
+    parser.add_argument("--max-ms", type=float, help="Falla si algún script tarda más en importar")
+    args = parser.parse_args(argv)
+
+    fallo = False
+    for ruta in args.scripts:
+        datos = reporte(ruta)
+        print(f"{ruta}: {datos['total_ms']:.1f} ms, {datos['modulos']} módulos")
+        for fila in datos["lentos"]:
+            print(f"  {fila['acumulado_ms']:>8.1f} ms  {fila['modulo']}")
+        if datos["pesados"]:
+            print(f"  Módulos pesados importados al arrancar: {', '.join(datos['pesados'])}")
+            fallo = True
+        if args.max_ms is not None and datos["total_ms"] > args.max_ms:
+            print(f"  Supera el límite de {args.max_ms:.0f} ms")
+            fallo = True
+        if args.salida:
+            with open(args.salida, "a", encoding="utf-8") as f:
+                f.write(json.dumps(datos, ensure_ascii=False) + "\n")
+    return 1 if fallo else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,189 @@
+"""Tiempos por fase de cada rerun de los scripts de Streamlit.
+
+Cada ejecución del script crea una ``MedicionRerun`` y envuelve sus fases::
+
+    medicion = MedicionRerun("solar_app")
+    with medicion.tramo("datos"):
+        df = cargar(...)
+    medicion.contar("filas", len(df))
+    ...
+    registro_tiempos().registrar(medicion)
+
+El registro del proceso guarda las últimas ``MAX_RERUNS`` mediciones (para el
+panel de depuración) y acumula sumas y cuentas por fase. Si están definidas,
+cada rerun se exporta a archivos locales:
+
+- ``SOLAR_TIEMPOS``: una línea JSON por rerun.
+- ``SOLAR_TIEMPOS_PROMETHEUS``: totales en formato de texto de Prometheus,
+  reescritos en cada rerun (apto para el textfile collector de node_exporter).
+
+Los reruns de un fragmento solo no pasan por el script completo y no se miden.
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from solar_core.perezoso import modulo_perezoso
+
+# Solo el panel de depuración necesita pandas
+pd = modulo_perezoso("pandas")
+
+MAX_RERUNS = 50
+RUTA_JSONL = os.environ.get("SOLAR_TIEMPOS")
+RUTA_PROMETHEUS = os.environ.get("SOLAR_TIEMPOS_PROMETHEUS")
+
+
+class MedicionRerun:
+    """Tramos (ms) y contadores de una ejecución del script"""
+
+    def __init__(self, script, etiquetas=None):
+        self.script = script
+        self.etiquetas = dict(etiquetas or {})
+        self.fecha = time.time()
+        self.tramos = {}
+        self.contadores = {}
+        self._inicio = time.perf_counter()
+        self._abiertos = {}
+        self.total_ms = None
+
+    @contextmanager
+    def tramo(self, nombre):
+        """Mide el bloque; si un tramo se repite en el rerun, sus tiempos se suman"""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._sumar(nombre, inicio)
+
+    def iniciar(self, nombre):
+        """Abre un tramo que no cabe en un bloque ``with``; se cierra con ``terminar``"""
+        self._abiertos[nombre] = time.perf_counter()
+
+    def terminar(self, nombre):
+        inicio = self._abiertos.pop(nombre, None)
+        if inicio is not None:
+            self._sumar(nombre, inicio)
+
+    def _sumar(self, nombre, inicio):
+        self.tramos[nombre] = self.tramos.get(nombre, 0.0) + (time.perf_counter() - inicio) * 1000
+
+    def contar(self, nombre, cantidad=1):
+        self.contadores[nombre] = self.contadores.get(nombre, 0) + cantidad
+
+    def cerrar(self):
+        for nombre in list(self._abiertos):
+            self.terminar(nombre)
+        if self.total_ms is None:
+            self.total_ms = (time.perf_counter() - self._inicio) * 1000
+
+    def a_dict(self):
+        return {
+            "script": self.script,
+            "fecha": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.fecha)),
+            **self.etiquetas,
+            "total_ms": round(self.total_ms or 0.0, 2),
+            "tramos_ms": {nombre: round(ms, 2) for nombre, ms in self.tramos.items()},
+            "contadores": dict(self.contadores),
+        }
+
+
+def _etiquetas_prometheus(**etiquetas):
+    def escapar(valor):
+        return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return ",".join(f'{clave}="{escapar(valor)}"' for clave, valor in etiquetas.items())
+
+
+class RegistroTiempos:
+    """Historial de reruns del proceso y totales por script y fase"""
+
+    def __init__(self, max_reruns=MAX_RERUNS, ruta_jsonl=RUTA_JSONL, ruta_prometheus=RUTA_PROMETHEUS):
+        self.ruta_jsonl = ruta_jsonl
+        self.ruta_prometheus = ruta_prometheus
+        self._recientes = deque(maxlen=max_reruns)
+        self._reruns = {}
+        self._tramos = {}
+        self._contadores = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, medicion):
+        medicion.cerrar()
+        datos = medicion.a_dict()
+        with self._lock:
+            self._recientes.append(datos)
+            self._reruns[medicion.script] = self._reruns.get(medicion.script, 0) + 1
+            for nombre, ms in medicion.tramos.items():
+                acumulado = self._tramos.setdefault((medicion.script, nombre), [0.0, 0])
+                acumulado[0] += ms / 1000
+                acumulado[1] += 1
+            for nombre, cantidad in medicion.contadores.items():
+                clave = (medicion.script, nombre)
+                self._contadores[clave] = self._contadores.get(clave, 0) + cantidad
+            if self.ruta_jsonl:
+                with open(self.ruta_jsonl, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(datos, ensure_ascii=False) + "\n")
+            if self.ruta_prometheus:
+                temporal = f"{self.ruta_prometheus}.tmp"
+                with open(temporal, "w", encoding="utf-8") as f:
+                    f.write(self._texto_prometheus())
+                os.replace(temporal, self.ruta_prometheus)
+        return datos
+
+    def recientes(self, cuantos=None, script=None):
+        """Últimos reruns registrados, del más reciente al más antiguo"""
+        with self._lock:
+            datos = [d for d in reversed(self._recientes) if script is None or d["script"] == script]
+        return datos[:cuantos] if cuantos else datos
+
+    def tabla(self, cuantos=None, script=None):
+        """Reruns recientes como tabla: una fila por rerun y una columna por tramo"""
+        filas = []
+        for datos in self.recientes(cuantos, script):
+            fila = {"fecha": datos["fecha"], "total_ms": datos["total_ms"]}
+            fila.update(datos["tramos_ms"])
+            fila.update(datos["contadores"])
+            filas.append(fila)
+        return pd.DataFrame(filas)
+
+    def texto_prometheus(self):
+        with self._lock:
+            return self._texto_prometheus()
+
+    def _texto_prometheus(self):
+        lineas = [
+            "# HELP solar_reruns_total Ejecuciones completas del script",
+            "# TYPE solar_reruns_total counter",
+        ]
+        lineas += [f"solar_reruns_total{{{_etiquetas_prometheus(script=s)}}} {n}" for s, n in self._reruns.items()]
+        lineas += [
+            "# HELP solar_tramo_segundos Duración de cada fase del script",
+            "# TYPE solar_tramo_segundos summary",
+        ]
+        for (script, nombre), (suma, cuenta) in self._tramos.items():
+            etiquetas = _etiquetas_prometheus(script=script, tramo=nombre)
+            lineas.append(f"solar_tramo_segundos_sum{{{etiquetas}}} {suma:.6f}")
+            lineas.append(f"solar_tramo_segundos_count{{{etiquetas}}} {cuenta}")
+        lineas += [
+            "# HELP solar_contador_total Contadores acumulados de los reruns",
+            "# TYPE solar_contador_total counter",
+        ]
+        lineas += [
+            f"solar_contador_total{{{_etiquetas_prometheus(script=script, nombre=nombre)}}} {total}"
+            for (script, nombre), total in self._contadores.items()
+        ]
+        return "\n".join(lineas) + "\n"
+
+
+_registro = None
+_registro_lock = threading.Lock()
+
+
+def registro_tiempos():
+    """Registro del proceso, compartido por todas las sesiones y páginas"""
+    global _registro
+    with _registro_lock:
+        if _registro is None:
+            _registro = RegistroTiempos()
+        return _registro
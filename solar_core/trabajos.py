@@ -0,0 +1,294 @@
+"""Cola de trabajos para leer recibos fuera del hilo que los recibe.
+
+``encolar`` responde de inmediato con el id del trabajo; el recibo se procesa
+en un pool de procesos local y su estado se consulta con ``estado``. Así un
+recibo lento o malformado no detiene el script de Streamlit, las peticiones
+de la API ni las sesiones de otros usuarios.
+
+Los recibos que ya están en la caché por contenido se resuelven al encolarlos,
+sin pasar por el pool. Se conservan a lo sumo ``max_trabajos``: para hacer
+lugar se descartan los terminados más viejos y, si todos siguen activos, el
+recibo nuevo se rechaza con ``ColaLlena``.
+Todo trabajo termina: listo, con error o vencido por plazo (ver ``ColaRecibos``).
+"""
+import multiprocessing
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+from solar_core.cache_recibos import huella_bytes
+from solar_core.formatos_recibo import CAMPOS_RECIBO
+from solar_core.recibos import _procesar_archivo, cache_recibos
+
+PROCESOS = 2
+MAX_TRABAJOS = 256
+# Segundos de proceso tras los que el trabajo se da por fallido; el proceso
+# que lo corría se termina y el pool se rehace
+TIEMPO_MAXIMO = 120.0
+# Segundos que un trabajo puede esperar su turno en la cola
+TIEMPO_MAXIMO_COLA = 600.0
+# Un trabajo cuyo proceso murió se reintenta una vez, solo en el pool: pudo
+# caer por culpa de otro recibo que corría junto a él
+MAX_INTENTOS = 2
+INTERVALO_VIGILANCIA = 1.0
+
+EN_COLA = "en_cola"
+PROCESANDO = "procesando"
+LISTO = "listo"
+ERROR = "error"
+
+
+def terminar_pool(pool):
+    """Termina los procesos de ``pool``, aunque alguno esté colgado, y lo cierra"""
+    # ProcessPoolExecutor no expone sus procesos ni una forma de terminarlos
+    procesos = list((getattr(pool, "_processes", None) or {}).values())
+    for proceso in procesos:
+        proceso.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+class ColaLlena(RuntimeError):
+    """No hay lugar para otro trabajo: todos los conservados siguen en cola o procesando"""
+
+
+class Trabajo:
+    """Estado y resultado de un recibo encolado"""
+
+    def __init__(self, nombre):
+        self.id = uuid.uuid4().hex
+        self.nombre = nombre
+        self.estado = EN_COLA
+        self.fila = None
+        self.error = ""
+        self.creado = time.time()
+        self.iniciado_en = None
+        self.terminado_en = None
+        self.intentos = 0
+        self._aislado = False
+        self._future = None
+        self._huella = None
+        self._contenido = None
+
+    @property
+    def terminado(self):
+        return self.estado in (LISTO, ERROR)
+
+    @property
+    def datos(self):
+        """Campos del recibo si el trabajo terminó bien"""
+        if self.estado != LISTO:
+            return None
+        return {campo: self.fila.get(campo) for campo in CAMPOS_RECIBO}
+
+    def _terminar(self, fila):
+        self.fila = fila
+        self.error = fila.get("error", "")
+        self.estado = ERROR if self.error else LISTO
+        self.terminado_en = time.time()
+        self._future = None
+        self._contenido = None
+
+    def a_dict(self):
+        return {
+            "id": self.id,
+            "archivo": self.nombre,
+            "estado": self.estado,
+            "error": self.error,
+            "datos": self.datos,
+            "creado": self.creado,
+            "iniciado": self.iniciado_en,
+            "terminado": self.terminado_en,
+        }
+
+
+class ColaRecibos:
+    """Pool de procesos con estado de cada recibo consultable por id.
+
+    La cola propia entrega al pool a lo sumo un trabajo por proceso, así que
+    un trabajo ``procesando`` de verdad ocupa un proceso y su plazo cuenta
+    desde que empezó. Un hilo vigilante vence los trabajos que exceden
+    ``tiempo_maximo`` (procesando) o ``tiempo_maximo_cola`` (esperando); si
+    uno se colgó, termina los procesos del pool, lo rehace y vuelve a encolar
+    los demás trabajos que estaban en vuelo.
+    """
+
+    def __init__(self, procesos=PROCESOS, cache=None, tiempo_maximo=TIEMPO_MAXIMO,
+                 tiempo_maximo_cola=TIEMPO_MAXIMO_COLA, max_trabajos=MAX_TRABAJOS, procesar=_procesar_archivo):
+        self.procesos = procesos
+        self.cache = cache or cache_recibos
+        self.tiempo_maximo = tiempo_maximo
+        self.tiempo_maximo_cola = tiempo_maximo_cola
+        self.max_trabajos = max_trabajos
+        self.procesar = procesar
+        self._trabajos = OrderedDict()
+        self._pendientes = deque()
+        self._en_vuelo = {}
+        self._pool = None
+        self._vigilante = None
+        # Reentrante: un future que ya terminó corre su callback dentro de ``_despachar``
+        self._lock = threading.RLock()
+
+    def _obtener_pool(self):
+        if self._pool is None:
+            # "spawn" evita heredar los hilos del servidor de Streamlit al hacer fork
+            contexto = multiprocessing.get_context("spawn")
+            self._pool = ProcessPoolExecutor(max_workers=self.procesos, mp_context=contexto)
+        return self._pool
+
+    def _reciclar_pool(self):
+        """Termina los procesos del pool actual (incluido el que esté colgado)"""
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            terminar_pool(pool)
+
+    def _registrar(self, trabajo):
+        """Guarda el trabajo; solo descarta trabajos terminados para hacerle lugar"""
+        sobrantes = len(self._trabajos) + 1 - self.max_trabajos
+        if sobrantes > 0:
+            terminados = [t.id for t in self._trabajos.values() if t.terminado][:sobrantes]
+            if len(terminados) < sobrantes:
+                raise ColaLlena(f"Hay {len(self._trabajos)} recibos en proceso; intenta más tarde")
+            for trabajo_id in terminados:
+                del self._trabajos[trabajo_id]
+        self._trabajos[trabajo.id] = trabajo
+
+    def encolar(self, nombre, contenido):
+        """Agrega un recibo (bytes del PDF) a la cola y devuelve el id del trabajo.
+
+        Levanta ``ColaLlena`` si ya hay ``max_trabajos`` trabajos sin terminar.
+        """
+        trabajo = Trabajo(nombre)
+        huella = huella_bytes(contenido)
+        datos = self.cache.obtener(huella)
+        with self._lock:
+            self._registrar(trabajo)
+            if datos is not None:
+                trabajo._terminar({"archivo": nombre, **datos, "formato": "cache", "error": ""})
+                return trabajo.id
+            trabajo._huella, trabajo._contenido = huella, contenido
+            self._pendientes.append(trabajo)
+            self._despachar()
+            if self._vigilante is None:
+                self._vigilante = threading.Thread(target=self._vigilar_mientras_haya, name="vigilar-recibos", daemon=True)
+                self._vigilante.start()
+        return trabajo.id
+
+    def _despachar(self):
+        """Entrega trabajos pendientes al pool mientras haya procesos libres"""
+        while self._pendientes and len(self._en_vuelo) < self.procesos:
+            trabajo = self._pendientes[0]
+            if trabajo.terminado:
+                self._pendientes.popleft()
+                continue
+            # Un reintento tras la caída de un proceso corre sin compañía
+            if self._en_vuelo and (trabajo._aislado or any(t._aislado for t in self._en_vuelo.values())):
+                break
+            self._pendientes.popleft()
+            pool = self._obtener_pool()
+            try:
+                future = pool.submit(self.procesar, trabajo.nombre, trabajo._contenido)
+            except (BrokenProcessPool, RuntimeError):
+                # Pool roto o cerrado: se rehace y se reintenta con el siguiente ciclo
+                self._pool = None
+                self._pendientes.appendleft(trabajo)
+                continue
+            trabajo._future = future
+            trabajo.estado = PROCESANDO
+            trabajo.iniciado_en = time.time()
+            trabajo.intentos += 1
+            self._en_vuelo[trabajo.id] = trabajo
+            future.add_done_callback(partial(self._al_terminar, trabajo, pool))
+
+    def _al_terminar(self, trabajo, pool, future):
+        with self._lock:
+            if trabajo._future is not future:
+                # Trabajo vencido o reencolado al reciclar el pool
+                return
+            del self._en_vuelo[trabajo.id]
+            try:
+                fila = future.result()
+            except BrokenProcessPool as e:
+                # Un proceso murió (p. ej. un PDF que tumba al intérprete); el pool se rehace
+                if self._pool is pool:
+                    self._pool = None
+                if trabajo.intentos < MAX_INTENTOS:
+                    trabajo._future = None
+                    trabajo._aislado = True
+                    trabajo.estado = EN_COLA
+                    self._pendientes.appendleft(trabajo)
+                    self._despachar()
+                    return
+                fila = {"archivo": trabajo.nombre, "error": f"{type(e).__name__}: {e}"}
+            except Exception as e:
+                fila = {"archivo": trabajo.nombre, "error": f"{type(e).__name__}: {e}"}
+            huella = trabajo._huella
+            trabajo._terminar(fila)
+            self._despachar()
+        if not fila.get("error"):
+            self.cache.guardar(huella, {campo: fila[campo] for campo in CAMPOS_RECIBO})
+
+    def _vencer(self, trabajo, mensaje):
+        trabajo._terminar({"archivo": trabajo.nombre, "error": mensaje})
+
+    def vigilar(self):
+        """Vence los trabajos fuera de plazo; devuelve True si quedan trabajos por terminar"""
+        ahora = time.time()
+        with self._lock:
+            for trabajo in [t for t in self._pendientes if ahora - t.creado > self.tiempo_maximo_cola]:
+                self._pendientes.remove(trabajo)
+                self._vencer(trabajo, f"Tiempo agotado en cola ({self.tiempo_maximo_cola:.0f} s)")
+            vencidos = [t for t in self._en_vuelo.values() if ahora - t.iniciado_en > self.tiempo_maximo]
+            if vencidos:
+                for trabajo in vencidos:
+                    del self._en_vuelo[trabajo.id]
+                    self._vencer(trabajo, f"Tiempo agotado ({self.tiempo_maximo:.0f} s)")
+                # El proceso colgado seguiría ocupado: se recicla el pool y los demás
+                # trabajos en vuelo vuelven al frente de la cola sin gastar un intento
+                reencolados = list(self._en_vuelo.values())
+                self._en_vuelo.clear()
+                for trabajo in reencolados:
+                    trabajo._future = None
+                    trabajo.estado = EN_COLA
+                    trabajo.intentos -= 1
+                self._pendientes.extendleft(reversed(reencolados))
+                self._reciclar_pool()
+                self._despachar()
+            return bool(self._pendientes or self._en_vuelo)
+
+    def _vigilar_mientras_haya(self):
+        while True:
+            time.sleep(INTERVALO_VIGILANCIA)
+            with self._lock:
+                if not self.vigilar():
+                    self._vigilante = None
+                    return
+
+    def estado(self, trabajo_id):
+        """Trabajo con su estado actual; None si no existe o ya se descartó"""
+        with self._lock:
+            return self._trabajos.get(trabajo_id)
+
+    def cerrar(self):
+        with self._lock:
+            for trabajo in [*self._pendientes, *self._en_vuelo.values()]:
+                self._vencer(trabajo, "Cola cerrada")
+            self._pendientes.clear()
+            self._en_vuelo.clear()
+            self._reciclar_pool()
+
+
+_cola = None
+_cola_lock = threading.Lock()
+
+
+def cola_recibos():
+    """Cola del proceso, compartida por la app y la API"""
+    global _cola
+    with _cola_lock:
+        if _cola is None:
+            _cola = ColaRecibos()
+        return _cola
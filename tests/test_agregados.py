@@ -0,0 +1,54 @@
+import itertools
+import math
+import random
+
+import pandas as pd
+
+from solar_core.agregados import AgregadosAhorro
+
+
+def _historial(ahorros):
+    return pd.DataFrame({"Periodos": [f"P{i}" for i in range(len(ahorros))], "Ahorro Total": ahorros})
+
+
+def test_maximo_trae_su_periodo_sin_consultar_el_historial():
+    agregados = AgregadosAhorro.desde_dataframe(_historial([10.0, 30.0, 20.0]))
+    assert agregados.resumen()["maximo"] == (30.0, 1, "P1")
+
+    # Una alta de otra sesión: el df que tenga quien lee aún no trae esa fila
+    agregados.agregar({"Periodos": "P3", "Ahorro Total": 50.0}, 3)
+    assert agregados.resumen()["maximo"] == (50.0, 3, "P3")
+    assert agregados.resumen(periodos=["P3"])["maximo"] == (50.0, 3, "P3")
+
+    agregados.quitar({"Periodos": "P3", "Ahorro Total": 50.0}, 3)
+    assert agregados.resumen()["maximo"] == (30.0, 1, "P1")
+
+
+def _resumenes(agregados, periodos, origenes):
+    selecciones = [(None, None)]
+    selecciones += [([p], None) for p in periodos] + [(None, [o]) for o in origenes]
+    selecciones += [([p], [o]) for p, o in itertools.product(periodos, origenes)]
+    selecciones += [(periodos[:2], None), (periodos[:2], origenes)]
+    return [agregados.resumen(p, o) for p, o in selecciones]
+
+
+def test_altas_y_bajas_al_azar_coinciden_con_desde_dataframe():
+    azar = random.Random(0)
+    periodos = ["Ene-Feb", "Mar-Abr", "May-Jun"]
+    origenes = ["Recibo", "Manual"]
+
+    def fila():
+        # Valores repetidos y faltantes para ejercitar empates y NaN
+        ahorro = azar.choice([math.nan, 0.0, 100.0, 100.0, azar.randint(0, 50_000) / 100])
+        return {"Periodos": azar.choice(periodos), "Origen": azar.choice(origenes), "Ahorro Total": ahorro}
+
+    filas = [fila() for _ in range(20)]
+    agregados = AgregadosAhorro.desde_dataframe(pd.DataFrame(filas))
+    for _ in range(500):
+        if filas and azar.random() < 0.45:
+            agregados.quitar(filas.pop(), len(filas))
+        else:
+            filas.append(fila())
+            agregados.agregar(filas[-1], len(filas) - 1)
+        esperado = AgregadosAhorro.desde_dataframe(pd.DataFrame(filas, columns=["Periodos", "Origen", "Ahorro Total"]))
+        assert _resumenes(agregados, periodos, origenes) == _resumenes(esperado, periodos, origenes)
@@ -0,0 +1,238 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import pandas as pd
+import pytest
+
+from solar_core import almacen as almacen_mod
+from solar_core.almacen import AlmacenParquet
+from solar_core.registros import construir_registro
+
+
+def _registros(n, inicio=0):
+    return [
+        construir_registro(f"P{i}", i + 1, 100.0 * i, [150.0, 200.0, 0.0, float(i)], float(i), (1.0, 1.2, 3.0))
+        for i in range(inicio, inicio + n)
+    ]
+
+
+@pytest.fixture
+def ruta(tmp_path):
+    return str(tmp_path / "historial.parquet")
+
+
+def _periodos(almacen):
+    return almacen.cargar()["Periodos"].astype(str).tolist()
+
+
+def test_diario_se_reproduce_con_altas_y_bajas(ruta):
+    almacen = AlmacenParquet(ruta)
+    almacen.agregar_lote(_registros(3))
+    almacen.borrar_ultimo()
+    almacen.agregar_lote(_registros(1, inicio=5))
+
+    assert _periodos(AlmacenParquet(ruta)) == ["P0", "P1", "P5"]
+
+
+def test_baja_de_filas_ya_compactadas(ruta):
+    almacen = AlmacenParquet(ruta)
+    almacen.agregar_lote(_registros(3))
+    almacen.compactar()
+    almacen.borrar_ultimo()
+    almacen.borrar_ultimo()
+    almacen.agregar_lote(_registros(1, inicio=7))
+
+    assert _periodos(AlmacenParquet(ruta)) == ["P0", "P7"]
+    almacen.compactar()
+    assert _periodos(AlmacenParquet(ruta)) == ["P0", "P7"]
+    assert not os.path.exists(almacen.ruta_diario)
+
+
+def test_compactacion_interrumpida_no_duplica_filas(ruta):
+    almacen = AlmacenParquet(ruta)
+    almacen.agregar_lote(_registros(3))
+    # El proceso muere después de reemplazar el Parquet y antes de borrar el diario
+    with mock.patch.object(AlmacenParquet, "_borrar_rotados", side_effect=OSError("sin espacio")):
+        almacen.compactar()
+
+    assert _periodos(AlmacenParquet(ruta)) == ["P0", "P1", "P2"]
+    almacen.agregar_lote(_registros(1, inicio=3))
+    almacen.compactar()
+    assert _periodos(AlmacenParquet(ruta)) == ["P0", "P1", "P2", "P3"]
+    assert [nombre for nombre in os.listdir(os.path.dirname(ruta)) if "diario" in nombre] == []
+
+
+def test_compactacion_antes_de_escribir_el_parquet_conserva_el_diario(ruta):
+    almacen = AlmacenParquet(ruta)
+    almacen.agregar_lote(_registros(2))
+    with mock.patch.object(AlmacenParquet, "_escribir_temporal", side_effect=OSError("sin espacio")):
+        almacen.compactar()
+
+    assert _periodos(AlmacenParquet(ruta)) == ["P0", "P1"]
+
+
+def test_altas_durante_la_compactacion_no_se_pierden(ruta):
+    almacen = AlmacenParquet(ruta)
+    almacen.agregar_lote(_registros(2))
+    otro_proceso = AlmacenParquet(ruta)
+    escribir = AlmacenParquet._escribir_temporal
+
+    def escribir_con_alta_concurrente(self, df, generacion):
+        otro_proceso.agregar_lote(_registros(1, inicio=9))
+        return escribir(self, df, generacion)
+
+    with mock.patch.object(AlmacenParquet, "_escribir_temporal", escribir_con_alta_concurrente):
+        almacen.compactar()
+
+    assert _periodos(AlmacenParquet(ruta)) == ["P0", "P1", "P9"]
+    assert _periodos(almacen) == ["P0", "P1", "P9"]
+
+
+def test_compactar_conserva_cache_y_agregados(ruta):
+    almacen = AlmacenParquet(ruta)
+    almacen.agregar_lote(_registros(4))
+    resumen = almacen.resumen()
+    almacen.compactar()
+
+    assert almacen.agregados_vigentes()
+    assert almacen.resumen() == resumen
+
+
+def test_guardar_durante_la_compactacion_no_se_bloquea(ruta):
+    almacen = AlmacenParquet(ruta)
+    almacen.agregar_lote(_registros(3))
+    nuevo = almacen.cargar().iloc[:1].copy()
+    compactando = threading.Event()
+    leer_base = AlmacenParquet._leer_base
+
+    def leer_base_lento(self):
+        compactando.set()
+        time.sleep(0.3)
+        return leer_base(self)
+
+    with mock.patch.object(AlmacenParquet, "_leer_base", leer_base_lento):
+        compactacion = threading.Thread(target=almacen.compactar, daemon=True)
+        compactacion.start()
+        compactando.wait(5)
+        escritura = threading.Thread(target=almacen.guardar, args=(nuevo,), daemon=True)
+        escritura.start()
+        compactacion.join(10)
+        escritura.join(10)
+
+    assert not compactacion.is_alive() and not escritura.is_alive()
+    assert _periodos(AlmacenParquet(ruta)) == ["P0"]
+
+
+def test_compactacion_descarta_su_copia_si_la_base_cambio(ruta):
+    almacen = AlmacenParquet(ruta)
+    almacen.agregar_lote(_registros(3))
+    almacen.compactar()
+    almacen.agregar_lote(_registros(1, inicio=3))
+    otro_proceso = AlmacenParquet(ruta)
+    nuevo = otro_proceso.cargar().iloc[:1].copy()
+    escribir = AlmacenParquet._escribir_temporal
+
+    def escribir_tras_candado_vencido(self, df, generacion):
+        tmp = escribir(self, df, generacion)
+        if self is almacen:
+            # El otro proceso dio el candado por abandonado y reescribió el Parquet
+            otro_proceso._escribir(nuevo)
+        return tmp
+
+    with mock.patch.object(AlmacenParquet, "_escribir_temporal", escribir_tras_candado_vencido):
+        almacen.compactar()
+
+    assert _periodos(AlmacenParquet(ruta)) == ["P0"]
+
+
+def test_altas_simultaneas_reciben_numeros_distintos(ruta):
+    almacen = AlmacenParquet(ruta)
+
+    def armar(num_periodo):
+        return construir_registro(f"N{num_periodo}", num_periodo, 0.0, [150.0, 0.0, 0.0, 0.0], 0.0, (1.0, 1.2, 3.0))
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        registros = list(pool.map(lambda _: almacen.agregar_siguiente(armar), range(16)))
+
+    assert sorted(registro["No. Periodo"] for registro in registros) == list(range(1, 17))
+    assert AlmacenParquet(ruta).cargar()["No. Periodo"].tolist() == list(range(1, 17))
+
+
+def test_quitar_ultimo_devuelve_la_fila_borrada(ruta):
+    almacen = AlmacenParquet(ruta)
+    almacen.agregar_lote(_registros(2))
+
+    assert almacen.quitar_ultimo()["Periodos"] == "P1"
+    assert almacen.quitar_ultimo()["Periodos"] == "P0"
+    assert almacen.quitar_ultimo() is None
+
+
+def test_resumen_total_sin_leer_el_historial(ruta):
+    almacen = AlmacenParquet(ruta)
+    almacen.agregar_lote(_registros(3))
+    almacen.compactar()
+    almacen.agregar_lote(_registros(2, inicio=3))
+    esperado = AlmacenParquet(ruta).resumen()
+
+    frio = AlmacenParquet(ruta)
+    with mock.patch.object(AlmacenParquet, "_leer", side_effect=AssertionError("leyó el historial")):
+        assert frio.resumen_total() == esperado
+    assert frio._cache is None
+
+
+def test_resumen_total_con_bajas_de_la_base_lee_sin_retener(ruta):
+    almacen = AlmacenParquet(ruta)
+    almacen.agregar_lote(_registros(3))
+    almacen.compactar()
+    almacen.borrar_ultimo()
+
+    frio = AlmacenParquet(ruta)
+    resumen = frio.resumen_total()
+    assert resumen["cuenta"] == 2
+    assert resumen == AlmacenParquet(ruta).resumen()
+    assert frio._cache is None and frio.agregados_vigentes()
+
+
+def test_actualizar_transforma_el_historial_vigente(ruta):
+    almacen = AlmacenParquet(ruta)
+    almacen.agregar_lote(_registros(2))
+    almacen.cargar()
+    otro_proceso = AlmacenParquet(ruta)
+    llamadas = []
+
+    def renombrar(df):
+        llamadas.append(len(df))
+        if len(llamadas) == 1:
+            # Alta de otra sesión mientras se transforma: obliga a repetir
+            otro_proceso.agregar_lote(_registros(1, inicio=5))
+        df = df.copy()
+        df["Periodos"] = df["Periodos"].astype(str) + "*"
+        return df, len(df)
+
+    assert almacen.actualizar(renombrar) == 3
+    assert llamadas == [2, 3]
+    assert _periodos(AlmacenParquet(ruta)) == ["P0*", "P1*", "P5*"]
+
+
+def test_migracion_simultanea_importa_el_libro_una_vez(tmp_path, ruta):
+    libro = str(tmp_path / "historial.xlsx")
+    pd.DataFrame(_registros(3)).to_excel(libro, sheet_name="Total", index=False)
+    importar = almacen_mod.importar_excel
+    llamadas = []
+
+    def importar_lento(ruta_libro, hoja):
+        llamadas.append(ruta_libro)
+        time.sleep(0.3)
+        return importar(ruta_libro, hoja)
+
+    almacenes = [AlmacenParquet(ruta, origen_excel=libro, hoja="Total") for _ in range(2)]
+    with mock.patch.object(almacen_mod, "importar_excel", importar_lento):
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            leidos = list(pool.map(lambda almacen: _periodos(almacen), almacenes))
+
+    assert leidos == [["P0", "P1", "P2"]] * 2
+    assert len(llamadas) == 1
+    assert [nombre for nombre in os.listdir(tmp_path) if nombre.endswith((".tmp", ".migrando"))] == []
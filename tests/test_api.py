@@ -0,0 +1,50 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from solar_core import api
+from solar_core.sitios import RegistroSitios, Sitio
+
+TOKEN = "secreto"
+NUEVO = {"periodo": "ENE 24 al MAR 24", "kwh_solar": 500, "kwh_cfe": [150, 200, 0, 40],
+         "kwh_devueltos": 400, "precios": [1.0, 1.2, 3.0]}
+
+
+@pytest.fixture
+def cliente(tmp_path, monkeypatch):
+    registro = RegistroSitios([Sitio("casa", str(tmp_path / "casa.parquet"))])
+    monkeypatch.setattr(api, "_registro", lambda: registro)
+    monkeypatch.setenv("SOLAR_API_TOKEN", TOKEN)
+    return TestClient(api.app)
+
+
+def _auth(token=TOKEN):
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_escrituras_piden_token(cliente, monkeypatch):
+    assert cliente.post("/sitios/casa/registros", json=NUEVO).status_code == 401
+    assert cliente.post("/sitios/casa/registros", json=NUEVO, headers=_auth("otro")).status_code == 401
+    assert cliente.delete("/sitios/casa/registros/ultimo").status_code == 401
+    assert cliente.post("/recibos", files={"archivo": ("r.pdf", b"x")}).status_code == 401
+    monkeypatch.delenv("SOLAR_API_TOKEN")
+    assert cliente.post("/sitios/casa/registros", json=NUEVO, headers=_auth()).status_code == 503
+    assert cliente.get("/sitios/casa/kpis").status_code == 200
+
+
+def test_alta_y_baja(cliente):
+    primero = cliente.post("/sitios/casa/registros", json=NUEVO, headers=_auth())
+    segundo = cliente.post("/sitios/casa/registros", json={**NUEVO, "periodo": "MAR 24 al MAY 24"}, headers=_auth())
+
+    assert (primero.status_code, segundo.status_code) == (201, 201)
+    assert [primero.json()["No. Periodo"], segundo.json()["No. Periodo"]] == [1, 2]
+    eliminado = cliente.delete("/sitios/casa/registros/ultimo", headers=_auth())
+    assert eliminado.json()["Periodo"] == "MAR 24 al MAY 24"
+    cliente.delete("/sitios/casa/registros/ultimo", headers=_auth())
+    assert cliente.delete("/sitios/casa/registros/ultimo", headers=_auth()).status_code == 404
+
+
+def test_registro_invalido_responde_422(cliente):
+    respuesta = cliente.post("/sitios/casa/registros", json={**NUEVO, "precios": [1.0, 1.2, 300.0]}, headers=_auth())
+
+    assert respuesta.status_code == 422
+    assert any("Precio Excedente" in mensaje for mensaje in respuesta.json()["detail"])
@@ -0,0 +1,30 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from solar_core import cache_recibos
+from solar_core.cache_recibos import CacheRecibos
+
+
+def _volcar_en_dos_partes(datos, f, **opciones):
+    """json.dump lento: deja tiempo para que otro hilo escriba a la vez"""
+    texto = json.dumps(datos, **opciones)
+    f.write(texto[:len(texto) // 2])
+    f.flush()
+    time.sleep(0.05)
+    f.write(texto[len(texto) // 2:])
+
+
+def test_hilos_que_guardan_el_mismo_recibo_no_se_pisan(tmp_path):
+    cache = CacheRecibos(directorio=str(tmp_path))
+    datos = [{"archivo": f"recibo-{i}.pdf", "relleno": str(i) * 1000} for i in range(8)]
+
+    with mock.patch.object(cache_recibos.json, "dump", _volcar_en_dos_partes), mock.patch.object(cache_recibos, "logger") as logger:
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(lambda d: cache.guardar("huella", d), datos))
+
+    assert not logger.warning.called
+    assert cache.obtener("huella") in datos
+    assert [nombre for nombre in os.listdir(tmp_path) if nombre.endswith(".tmp")] == []
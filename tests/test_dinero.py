@@ -0,0 +1,43 @@
+import random
+from decimal import ROUND_HALF_UP, Decimal
+
+import numpy as np
+
+from solar_core.dinero import a_centavos, aplicar_tasa, importe
+
+
+def _redondear(valor):
+    return int(valor.quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def _importe_referencia(kwh, precio):
+    return _redondear(Decimal(kwh) * Decimal(precio) * 100)
+
+
+def test_importe_coincide_con_decimal():
+    azar = random.Random(0)
+    # kWh con 3 decimales y precios con 4, las escalas de punto fijo del módulo
+    kwh = [f"{azar.randint(-2_000_000, 2_000_000) / 1000:.3f}" for _ in range(2000)]
+    precios = [f"{azar.randint(0, 100_000) / 10_000:.4f}" for _ in range(2000)]
+    # Casos exactamente a la mitad de un centavo
+    kwh += ["1.000", "-1.000", "0.500", "3.000"]
+    precios += ["1.0050", "1.0050", "0.0100", "0.0050"]
+
+    obtenido = importe(np.array(kwh, dtype=float), np.array(precios, dtype=float))
+
+    assert obtenido.tolist() == [_importe_referencia(k, p) for k, p in zip(kwh, precios)]
+
+
+def test_aplicar_tasa_coincide_con_decimal():
+    azar = random.Random(1)
+    centavos = [azar.randint(-10**9, 10**9) for _ in range(2000)] + [50, -50, 25, 3125]
+    tasas = ["0.16"] * 2000 + ["0.01", "0.01", "0.02", "0.16"]
+
+    obtenido = aplicar_tasa(np.array(centavos), np.array(tasas, dtype=float))
+
+    assert obtenido.tolist() == [_redondear(Decimal(c) * Decimal(t)) for c, t in zip(centavos, tasas)]
+
+
+def test_a_centavos_redondea_la_mitad_hacia_arriba():
+    pesos = ["1.005", "-1.005", "2.675", "0.125", "1234567.895"]
+    assert a_centavos(np.array(pesos, dtype=float)).tolist() == [_redondear(Decimal(p) * 100) for p in pesos]
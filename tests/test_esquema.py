@@ -0,0 +1,62 @@
+import pandas as pd
+import pytest
+
+from solar_core.esquema import RegistroInvalido, exigir_validos, validar_registros
+from solar_core.registros import construir_registro
+
+
+def _registro(num_periodo=1, **cambios):
+    registro = construir_registro("Ene-Feb 2024", num_periodo, 500.0, [150.0, 200.0, 0.0, 40.0], 400.0, (1.0, 1.2, 3.0))
+    registro.update(cambios)
+    return registro
+
+
+def _mensajes(errores):
+    return [mensaje for _, mensaje in errores]
+
+
+def test_registros_construidos_son_validos():
+    registros = [_registro(i) for i in range(1, 4)]
+    assert validar_registros(registros) == []
+    assert validar_registros(pd.DataFrame(registros)) == []
+    assert validar_registros([]) == []
+    exigir_validos(registros)
+
+
+def test_faltan_columnas_es_error_del_lote():
+    registro = _registro()
+    del registro["IVA CFE"]
+    assert validar_registros([registro]) == [(None, "faltan las columnas: IVA CFE")]
+
+
+@pytest.mark.parametrize("cambios, mensaje", [
+    ({"Periodos": "  "}, "el periodo está vacío"),
+    ({"Periodos": None}, "el periodo está vacío"),
+    ({"Ahorro Total": "n/d"}, "'Ahorro Total' falta o no es numérico"),
+    ({"No. Periodo": 0}, "'No. Periodo' fuera de rango [1, 1e+06]"),
+    ({"No. Periodo": 2.5}, "'No. Periodo' no es entero"),
+    ({"Precio Básico": 150.0}, "'Precio Básico' fuera de rango [0, 100]"),
+    ({"IVA Solar": 1.0}, "'IVA Solar' no es el 16% del subtotal"),
+])
+def test_rechaza_campos_invalidos(cambios, mensaje):
+    errores = validar_registros([_registro(**cambios)])
+    assert (0, mensaje) in errores
+
+
+def test_subtotal_que_no_suma_los_escalones():
+    registro = _registro()
+    registro["Básico Solar"] += 0.05
+    assert _mensajes(validar_registros([registro])) == ["'Subtotal Solar' no es la suma de los escalones"]
+
+
+def test_tolera_un_centavo_de_diferencia():
+    registro = _registro()
+    registro["Total de recibo Solar"] += 0.01
+    assert validar_registros([registro]) == []
+
+
+def test_exigir_validos_reporta_solo_las_filas_invalidas():
+    registros = [_registro(1), _registro(2, **{"Periodos": ""}), _registro(3), _registro(4, **{"Ahorro Total": -5.0})]
+    with pytest.raises(RegistroInvalido) as error:
+        exigir_validos(registros)
+    assert error.value.filas() == [1, 3]
@@ -0,0 +1,50 @@
+from pathlib import Path
+
+import pytest
+
+from solar_core.formatos_recibo import CAMPOS_RECIBO, FormatoLegado, FormatoTabla, parsear_texto
+
+RECIBOS = sorted((Path(__file__).parent / "recibos").glob("*.txt"))
+# Campos que el formato legado extrae bien; sus patrones de kWh por escalón no
+# distinguen los kWh del precio y no sirven de referencia
+CAMPOS_COMPARABLES = (
+    "periodo_facturado", "total_pagar", "energia_total_kwh", "consumo_total_periodo",
+    "basico_precio", "basico_subtotal", "intermedio_kwh", "intermedio_precio", "intermedio_subtotal",
+    "apoyo_gubernamental",
+)
+
+
+@pytest.mark.parametrize("ruta", RECIBOS, ids=lambda ruta: ruta.stem)
+def test_formato_tabla_coincide_con_legado(ruta):
+    texto = ruta.read_text(encoding="utf-8")
+    tabla = FormatoTabla().extraer(texto)
+    legado = FormatoLegado().extraer(texto)
+
+    assert set(tabla) == set(CAMPOS_RECIBO)
+    assert {campo: tabla[campo] for campo in CAMPOS_COMPARABLES} == {campo: legado[campo] for campo in CAMPOS_COMPARABLES}
+    assert tabla["periodo_facturado"]
+    assert tabla["total_pagar"] > 0
+
+
+@pytest.mark.parametrize("ruta", RECIBOS, ids=lambda ruta: ruta.stem)
+def test_parsear_texto_elige_formato_tabla(ruta):
+    datos, formato, _ = parsear_texto(ruta.read_text(encoding="utf-8"))
+
+    assert formato.nombre == FormatoTabla.nombre
+    assert datos["basico_kwh"] == 150.0
+
+
+def test_encabezado_a_varias_columnas():
+    datos, _, _ = parsear_texto((Path(__file__).parent / "recibos" / "encabezado_columnas.txt").read_text(encoding="utf-8"))
+
+    assert datos["periodo_facturado"] == "15 ENE 24 - 15 MAR 24"
+    assert datos["total_pagar"] == 1234.0
+    assert datos["excedente_kwh"] == 170.0
+
+
+def test_escalon_ausente_queda_en_cero():
+    datos, _, _ = parsear_texto((Path(__file__).parent / "recibos" / "sin_excedente.txt").read_text(encoding="utf-8"))
+
+    assert datos["excedente_kwh"] == 0.0
+    assert datos["excedente_precio"] == 0.0
+    assert datos["intermedio_kwh"] == 110.0
@@ -0,0 +1,86 @@
+import os
+import time
+
+from solar_core import ingesta
+from solar_core.almacen import AlmacenParquet
+from solar_core.registros import construir_registro
+
+
+def duplicar_o_caer(valor):
+    if valor == "fatal":
+        os._exit(1)
+    if valor == "error":
+        raise ValueError("recibo ilegible")
+    return valor * 2
+
+
+def duplicar_o_colgar(valor):
+    if valor == "colgado":
+        time.sleep(3600)
+    return valor * 2
+
+
+def test_mapa_acotado_sobrevive_a_un_proceso_caido():
+    elementos = ["a", "b", "fatal", "c", "error", "d", "e"]
+    resultados = list(ingesta._mapa_acotado(duplicar_o_caer, elementos, procesos=2, ventana=3))
+
+    assert sorted(elemento for elemento, _, _ in resultados) == sorted(elementos)
+    fallidos = {elemento: type(error).__name__ for elemento, _, error in resultados if error is not None}
+    assert fallidos == {"fatal": "BrokenProcessPool", "error": "ValueError"}
+    assert {elemento: resultado for elemento, resultado, error in resultados if error is None} == {
+        "a": "aa", "b": "bb", "c": "cc", "d": "dd", "e": "ee",
+    }
+
+
+def _recibo(periodo, precio_basico=1.0):
+    return {
+        "periodo_facturado": periodo, "consumo_total_periodo": 400.0, "excedente_kwh": 30.0,
+        "basico_precio": precio_basico, "intermedio_precio": 1.2, "excedente_precio": 3.0,
+    }
+
+
+def test_descartes_de_esquema_no_dejan_huecos_en_la_numeracion(tmp_path, monkeypatch):
+    recibos = {
+        "a.pdf": _recibo("ENE 24 - MAR 24"),
+        "b.pdf": _recibo("MAR 24 - MAY 24", precio_basico=500.0),
+        "c.pdf": _recibo("MAY 24 - JUL 24"),
+    }
+    monkeypatch.setattr(ingesta, "etapa_extraer", lambda rutas, procesos, ventana: ((r, recibos[r]) for r in rutas))
+    almacen = AlmacenParquet(str(tmp_path / "historial.parquet"))
+
+    resultado = ingesta.ingerir(list(recibos), almacen)
+
+    assert resultado["agregados"] == 2
+    assert [(d["archivo"], d["etapa"]) for d in resultado["descartes"]] == [("b.pdf", "esquema")]
+    assert almacen.cargar()["No. Periodo"].tolist() == [1, 2]
+
+
+def test_mapa_acotado_vence_un_recibo_colgado():
+    elementos = ["a", "colgado", "b", "c", "d"]
+    resultados = list(ingesta._mapa_acotado(duplicar_o_colgar, elementos, procesos=2, ventana=3, tiempo_maximo=2.0))
+
+    fallidos = {elemento: type(error).__name__ for elemento, _, error in resultados if error is not None}
+    assert fallidos == {"colgado": "TimeoutError"}
+    assert {elemento: resultado for elemento, resultado, error in resultados if error is None} == {
+        "a": "aa", "b": "bb", "c": "cc", "d": "dd",
+    }
+
+
+def test_lotes_se_numeran_bajo_el_candado_del_almacen(tmp_path, monkeypatch):
+    recibos = {f"{i}.pdf": _recibo(f"P{i}") for i in range(3)}
+    almacen = AlmacenParquet(str(tmp_path / "historial.parquet"))
+    otra_sesion = AlmacenParquet(almacen.ruta)
+
+    def extraer_con_alta_concurrente(rutas, procesos, ventana):
+        for ruta in rutas:
+            # Otra sesión agrega un periodo entre lote y lote
+            otra_sesion.agregar_numerados([construir_registro(f"Otro {ruta}", 1, 0.0, [150.0, 0.0, 0.0, 0.0], 0.0, (1.0, 1.2, 3.0))])
+            yield ruta, recibos[ruta]
+
+    monkeypatch.setattr(ingesta, "etapa_extraer", extraer_con_alta_concurrente)
+    monkeypatch.setattr(ingesta, "LOTE", 1)
+
+    resultado = ingesta.ingerir(list(recibos), almacen)
+
+    assert resultado["agregados"] == 3
+    assert AlmacenParquet(almacen.ruta).cargar()["No. Periodo"].tolist() == list(range(1, 7))
@@ -0,0 +1,65 @@
+from pathlib import Path
+
+from solar_core import recibos
+
+RECIBOS = Path(__file__).parent / "recibos"
+
+
+class _Pagina:
+    def __init__(self, texto, leidas):
+        self.texto = texto
+        self.leidas = leidas
+
+    def extract_text(self):
+        self.leidas.append(self.texto)
+        return self.texto
+
+    def close(self):
+        pass
+
+
+class _Pdf:
+    def __init__(self, textos):
+        self.leidas = []
+        self.pages = [_Pagina(texto, self.leidas) for texto in textos]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        return False
+
+
+class _Pdfplumber:
+    def __init__(self, pdf):
+        self.pdf = pdf
+
+    def open(self, _):
+        return self.pdf
+
+
+def test_recibo_de_bajo_consumo_se_deja_de_leer_tras_la_tabla(monkeypatch):
+    anexo = "AVISO\nExcedente 999 9.999 9,999.99\nIntermedio 888 8.888 8,888.88\n"
+    pdf = _Pdf([(RECIBOS / "sin_excedente.txt").read_text(encoding="utf-8"), anexo, anexo])
+    monkeypatch.setattr(recibos, "pdfplumber", _Pdfplumber(pdf))
+
+    datos, medicion = recibos.analizar_recibo("recibo.pdf")
+
+    assert medicion["paginas"] == 1 and len(pdf.leidas) == 1
+    assert datos["intermedio_kwh"] == 110.0
+    assert datos["excedente_kwh"] == 0.0 and datos["excedente_precio"] == 0.0
+
+
+def test_encabezado_en_otra_pagina_no_cambia_los_escalones(monkeypatch):
+    encabezado = "PERIODO FACTURADO: 16 MAR 24 - 15 MAY 24\nTOTAL A PAGAR: $ 312\n"
+    tabla = "Energía (kWh) 12,865 13,125 260\nBásico 150 1.002 150.30\nIntermedio 110 1.213 133.43\n"
+    anexo = "Excedente 999 9.999 9,999.99\n"
+    pdf = _Pdf([encabezado, tabla, anexo])
+    monkeypatch.setattr(recibos, "pdfplumber", _Pdfplumber(pdf))
+
+    datos, medicion = recibos.analizar_recibo("recibo.pdf")
+
+    assert medicion["paginas"] == 2
+    assert datos["periodo_facturado"] == "16 MAR 24 - 15 MAY 24"
+    assert datos["consumo_total_periodo"] == 260.0
+    assert datos["excedente_kwh"] == 0.0
@@ -0,0 +1,96 @@
+import os
+import time
+
+import pytest
+
+from solar_core.formatos_recibo import CAMPOS_RECIBO
+from solar_core.trabajos import EN_COLA, ERROR, LISTO, ColaLlena, ColaRecibos
+
+
+class CacheMemoria:
+    def __init__(self):
+        self.datos = {}
+
+    def obtener(self, huella):
+        return self.datos.get(huella)
+
+    def guardar(self, huella, datos):
+        self.datos[huella] = datos
+
+
+def procesar_de_prueba(nombre, contenido):
+    """Se cuelga con los recibos 'colgado', tumba el proceso con 'fatal' y responde rápido con el resto"""
+    if nombre.startswith("colgado"):
+        time.sleep(3600)
+    if nombre.startswith("fatal"):
+        os._exit(1)
+    time.sleep(0.2)
+    return {"archivo": nombre, **{campo: 1.0 for campo in CAMPOS_RECIBO}, "error": ""}
+
+
+def _esperar(cola, ids, limite=60.0):
+    fin = time.monotonic() + limite
+    while time.monotonic() < fin:
+        trabajos = [cola.estado(trabajo_id) for trabajo_id in ids]
+        if all(trabajo.terminado for trabajo in trabajos):
+            return trabajos
+        time.sleep(0.1)
+    return [cola.estado(trabajo_id) for trabajo_id in ids]
+
+
+def test_recibos_colgados_no_detienen_la_cola():
+    cola = ColaRecibos(procesos=2, cache=CacheMemoria(), tiempo_maximo=2.0, procesar=procesar_de_prueba)
+    try:
+        nombres = ["colgado-1", "colgado-2", "a", "b", "c", "d"]
+        ids = [cola.encolar(nombre, nombre.encode()) for nombre in nombres]
+        trabajos = _esperar(cola, ids)
+    finally:
+        cola.cerrar()
+
+    estados = {trabajo.nombre: trabajo.estado for trabajo in trabajos}
+    assert estados == {"colgado-1": ERROR, "colgado-2": ERROR, "a": LISTO, "b": LISTO, "c": LISTO, "d": LISTO}
+    assert "Tiempo agotado" in trabajos[0].error
+
+
+def test_plazo_en_cola():
+    cola = ColaRecibos(procesos=1, cache=CacheMemoria(), tiempo_maximo=30.0, tiempo_maximo_cola=1.0,
+                       procesar=procesar_de_prueba)
+    try:
+        ids = [cola.encolar(nombre, nombre.encode()) for nombre in ("colgado", "espera")]
+        time.sleep(0.5)
+        assert cola.estado(ids[1]).estado == EN_COLA
+        espera = _esperar(cola, ids[1:], limite=10.0)[0]
+    finally:
+        cola.cerrar()
+
+    assert espera.estado == ERROR
+    assert "en cola" in espera.error
+
+
+def test_proceso_caido_no_arrastra_a_los_demas():
+    cola = ColaRecibos(procesos=2, cache=CacheMemoria(), tiempo_maximo=30.0, procesar=procesar_de_prueba)
+    try:
+        ids = [cola.encolar(nombre, nombre.encode()) for nombre in ("fatal", "a", "b", "c")]
+        trabajos = _esperar(cola, ids)
+    finally:
+        cola.cerrar()
+
+    assert [trabajo.estado for trabajo in trabajos] == [ERROR, LISTO, LISTO, LISTO]
+    assert "BrokenProcessPool" in trabajos[0].error
+
+
+def test_cola_llena_solo_descarta_trabajos_terminados():
+    cola = ColaRecibos(procesos=1, cache=CacheMemoria(), tiempo_maximo=30.0, max_trabajos=3,
+                       procesar=procesar_de_prueba)
+    try:
+        listo = cola.encolar("a", b"a")
+        _esperar(cola, [listo])
+        activos = [cola.encolar(nombre, nombre.encode()) for nombre in ("colgado", "espera-1")]
+        # Entra descartando el terminado; después ya no hay lugar
+        activos.append(cola.encolar("espera-2", b"espera-2"))
+        assert cola.estado(listo) is None
+        with pytest.raises(ColaLlena):
+            cola.encolar("espera-3", b"espera-3")
+        assert all(cola.estado(trabajo_id) is not None for trabajo_id in activos)
+    finally:
+        cola.cerrar()